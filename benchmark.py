@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Benchmark del generador circular
+================================
+
+Genera imágenes sintéticas deterministas (degradado, ruido, tablero y
+retrato), recorre varias combinaciones de parámetros y mide tiempo, pico de
+memoria, vértices de salida y bytes del SVG. Con `--guardar-referencia` los
+resultados y las geometrías quedan como referencia; en las siguientes
+ejecuciones se comparan con ella, incluida la equivalencia geométrica por
+el área de la diferencia simétrica. En los casos de grosor cero se comprueba
+además que las mallas extruidas (STL/3MF) son cerradas: cada arista está en
+exactamente dos triángulos.
+
+Con `--arranque` mide en cambio el arranque de la CLI: lanza cada escenario
+(--help, un error de parámetros, --validar, vista previa y SVG) con
+`python -X importtime` y resume el tiempo total, el de importación y qué
+librerías pesadas (numpy, PIL, shapely) llega a cargar.
+
+Uso:
+    python benchmark.py --guardar-referencia     # en la versión de referencia
+    python benchmark.py                          # tras un cambio
+    python benchmark.py --arranque --repeticiones 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+import shapely
+
+from circular_lines_generator import RenderizadorCircular, malla_extruida, pico_memoria_mb, reiniciar_pico_memoria
+
+
+PATRONES = ('degradado', 'ruido', 'tablero', 'retrato')
+ORIENTACIONES = {'h': (3, 2), 'v': (2, 3)}
+CENTROS = {'dentro': (50.0, 50.0), 'fuera': (-20.0, 50.0)}
+
+# Caso base de las curvas de escalado
+LINEAS_BASE = 120
+RESOLUCION_BASE = 1200
+
+# Grupos de casos: matriz de imágenes y parámetros, curvas de escalado y
+# grosores que se anulan (-min 0), donde un anillo puede perder el grosor y
+# las piezas se tocan en un punto (con círculos y con elipses)
+GRUPOS = ('matriz', 'lineas', 'resolucion', 'grosor')
+LINEAS_CURVA = (60, 120, 240, 480)
+RESOLUCIONES_CURVA = (600, 1200, 2400, 4800)
+RESOLUCION_MATRIZ = 900
+GROSORES_CERO = ((0.0, 10.0), (0.0, 0.0))
+CURVAS_GROSOR = ('circulos', 'elipses')
+
+# Escenarios del arranque: argumentos de la CLI ({imagen} y {salida} se
+# sustituyen por rutas temporales)
+ESCENARIOS_ARRANQUE = (
+    ('ayuda', ['--help']),
+    ('error', ['{imagen}', '-n', '0']),
+    ('validar', ['--validar', '-n', '300', '-c', '60']),
+    ('preview', ['{imagen}', '--preview', '{salida}.png']),
+    ('svg', ['{imagen}', '-o', '{salida}.svg', '--no-dividir']),
+)
+LIBRERIAS_PESADAS = ('numpy', 'PIL', 'shapely')
+
+
+def crear_imagen(patron, orientacion, resolucion):
+    """Imagen sintética en escala de grises; `resolucion` es el lado mayor en píxeles."""
+    proporcion_x, proporcion_y = ORIENTACIONES[orientacion]
+    lado = resolucion / max(proporcion_x, proporcion_y)
+    ancho, alto = int(proporcion_x * lado), int(proporcion_y * lado)
+    y, x = np.mgrid[0:alto, 0:ancho] / float(max(ancho, alto))
+    rng = np.random.default_rng(12345)
+
+    if patron == 'degradado':
+        valores = (x + y) / (x.max() + y.max())
+    elif patron == 'ruido':
+        valores = rng.random((alto, ancho))
+    elif patron == 'tablero':
+        valores = ((np.floor(x * 12) + np.floor(y * 12)) % 2).astype(float)
+    else:
+        # Manchas gaussianas de tamaños variados sobre fondo claro
+        valores = np.ones((alto, ancho))
+        centros = rng.random((7, 2)) * [x.max(), y.max()]
+        radios = rng.uniform(0.05, 0.25, 7)
+        for (mx, my), r in zip(centros, radios):
+            valores -= 0.6 * np.exp(-((x - mx) ** 2 + (y - my) ** 2) / (2 * r ** 2))
+        valores = np.clip(valores, 0, 1)
+
+    return Image.fromarray((valores * 255).astype(np.uint8))
+
+
+def casos(grupos):
+    """
+    Lista de casos (id, patrón, orientación, resolución, num_lineas, centro,
+    dividir, grosores, curvas); `grosores` es (mínimo, máximo), o None para
+    los de por defecto.
+    """
+    lista = []
+    if 'matriz' in grupos:
+        for patron in PATRONES:
+            for orientacion in ORIENTACIONES:
+                for centro in CENTROS:
+                    for dividir in (True, False):
+                        lista.append((patron, orientacion, RESOLUCION_MATRIZ, LINEAS_BASE, centro, dividir, None,
+                                      'circulos'))
+    if 'lineas' in grupos:
+        for num_lineas in LINEAS_CURVA:
+            lista.append(('retrato', 'h', RESOLUCION_BASE, num_lineas, 'fuera', True, None, 'circulos'))
+    if 'resolucion' in grupos:
+        for resolucion in RESOLUCIONES_CURVA:
+            lista.append(('retrato', 'h', resolucion, LINEAS_BASE, 'fuera', True, None, 'circulos'))
+    if 'grosor' in grupos:
+        for patron in PATRONES:
+            for grosores in GROSORES_CERO:
+                for curvas in CURVAS_GROSOR:
+                    lista.append((patron, 'h', RESOLUCION_MATRIZ, LINEAS_BASE, 'dentro', True, grosores, curvas))
+
+    vistos = set()
+    resultado = []
+    for patron, orientacion, resolucion, num_lineas, centro, dividir, grosores, curvas in lista:
+        caso_id = f"{patron}-{orientacion}-r{resolucion}-n{num_lineas}-{centro}-{'paneles' if dividir else 'unico'}"
+        if grosores is not None:
+            caso_id += f"-g{grosores[0]:g}-{grosores[1]:g}"
+        if curvas != 'circulos':
+            caso_id += f"-{curvas}"
+        if caso_id not in vistos:
+            vistos.add(caso_id)
+            resultado.append((caso_id, patron, orientacion, resolucion, num_lineas, centro, dividir, grosores, curvas))
+    return resultado
+
+
+def medir_caso(caso, directorio, repeticiones):
+    """Genera un caso (la mejor de varias repeticiones) y devuelve sus medidas y su geometría."""
+    caso_id, patron, orientacion, resolucion, num_lineas, centro, dividir, grosores, curvas = caso
+    imagen_path = os.path.join(directorio, f"{patron}-{orientacion}-r{resolucion}.png")
+    if not os.path.exists(imagen_path):
+        crear_imagen(patron, orientacion, resolucion).save(imagen_path)
+    svg_path = os.path.join(directorio, f"{caso_id}.svg")
+    centro_x, centro_y = CENTROS[centro]
+    parametros = {'curvas': curvas}
+    if grosores is not None:
+        parametros.update(grosor_min=grosores[0], grosor_max=grosores[1])
+
+    mejor = None
+    for _ in range(repeticiones):
+        # Renderizador nuevo en cada repetición: sin reutilizar etapas
+        reiniciar_pico_memoria()
+        inicio = time.perf_counter()
+        resultado = RenderizadorCircular().render(
+            imagen_path, num_lineas=num_lineas, centro_x=centro_x, centro_y=centro_y, dividir_paneles=dividir,
+            **parametros
+        )
+        resultado.guardar(svg_path)
+        segundos = time.perf_counter() - inicio
+        if mejor is None or segundos < mejor[0]:
+            mejor = (segundos, pico_memoria_mb(), resultado)
+
+    segundos, memoria, resultado = mejor
+    medidas = {
+        'segundos': round(segundos, 4),
+        'memoria_pico_mb': None if memoria is None else round(memoria, 1),
+        'vertices': int(shapely.get_num_coordinates(resultado.geometria)),
+        'bytes_svg': os.path.getsize(svg_path),
+        'etapas': {etapa: round(valor, 4) for etapa, valor in resultado.tiempos.items()},
+    }
+    if grosores is not None:
+        medidas['aristas_abiertas'] = aristas_abiertas(resultado)
+    return medidas, resultado.geometria
+
+
+def aristas_abiertas(resultado):
+    """
+    Aristas de las mallas extruidas (diseño completo y cada panel) que no
+    están en exactamente dos triángulos; en una malla cerrada no hay ninguna.
+    """
+    total = 0
+    for pieza in [resultado] + list(resultado.paneles):
+        _, caras = malla_extruida(pieza.geometria, pieza.ancho, pieza.ancho_mm, pieza.alto_mm)
+        aristas = np.sort(np.concatenate((caras[:, [0, 1]], caras[:, [1, 2]], caras[:, [2, 0]])), axis=1)
+        _, usos = np.unique(aristas, axis=0, return_counts=True)
+        total += int((usos != 2).sum())
+    return total
+
+
+def diferencia_relativa(geometria, referencia):
+    """Área de la diferencia simétrica relativa al área de la referencia."""
+    if referencia.area == 0:
+        return 0.0 if geometria.area == 0 else float('inf')
+    return geometria.symmetric_difference(referencia).area / referencia.area
+
+
+def leer_importtime(salida):
+    """
+    Resume la salida de `python -X importtime`: microsegundos de importación
+    en total (suma de los tiempos propios), módulos de primer nivel con su
+    tiempo acumulado, y el conjunto de módulos importados.
+    """
+    total = 0
+    primer_nivel = {}
+    modulos = set()
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:'):
+            continue
+        propio, acumulado, nombre = linea[len('import time:'):].split('|')
+        if not propio.strip().isdigit():
+            continue
+        total += int(propio)
+        modulos.add(nombre.strip())
+        # Los módulos importados directamente van sangrados con un solo espacio
+        if not nombre.startswith('  '):
+            primer_nivel[nombre.strip()] = int(acumulado)
+    return total, primer_nivel, modulos
+
+
+def medir_arranque(argumentos, repeticiones):
+    """Lanza la CLI con `-X importtime` (la mejor de varias repeticiones) y devuelve sus medidas."""
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    comando = [sys.executable, '-X', 'importtime', '-m', 'circular_lines_generator'] + argumentos
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        proceso = subprocess.run(comando, cwd=directorio, capture_output=True, text=True)
+        segundos = time.perf_counter() - inicio
+        if mejor is None or segundos < mejor[0]:
+            mejor = (segundos, proceso)
+
+    segundos, proceso = mejor
+    total, primer_nivel, modulos = leer_importtime(proceso.stderr)
+    mayores = sorted(primer_nivel.items(), key=lambda item: -item[1])[:5]
+    return {
+        'segundos': round(segundos, 4),
+        'importacion_ms': round(total / 1000, 1),
+        'codigo_salida': proceso.returncode,
+        'librerias': [lib for lib in LIBRERIAS_PESADAS if any(m.split('.')[0] == lib for m in modulos)],
+        'mayores_ms': {nombre: round(us / 1000, 1) for nombre, us in mayores},
+    }
+
+
+def benchmark_arranque(repeticiones):
+    """Mide el arranque de la CLI en cada escenario de ESCENARIOS_ARRANQUE."""
+    print(f"Arranque: {len(ESCENARIOS_ARRANQUE)} escenarios ({repeticiones} repeticiones)")
+    print(f"{'escenario':<10} {'s':>7} {'import ms':>10} {'salida':>7}  {'librerías':<20} mayores importaciones")
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        imagen_path = os.path.join(directorio, 'retrato.png')
+        crear_imagen('retrato', 'h', RESOLUCION_MATRIZ).save(imagen_path)
+        salida = os.path.join(directorio, 'salida')
+        for escenario, argumentos in ESCENARIOS_ARRANQUE:
+            argumentos = [a.format(imagen=imagen_path, salida=salida) for a in argumentos]
+            medidas = medir_arranque(argumentos, repeticiones)
+            resultados[escenario] = medidas
+            mayores = ', '.join(f"{nombre} {ms:.0f}" for nombre, ms in medidas['mayores_ms'].items())
+            print(f"{escenario:<10} {medidas['segundos']:>7.3f} {medidas['importacion_ms']:>10.1f} "
+                  f"{medidas['codigo_salida']:>7}  {', '.join(medidas['librerias']) or '-':<20} {mayores}")
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del generador circular con imágenes sintéticas')
+    parser.add_argument('--grupos', default=','.join(GRUPOS),
+                        help=f'Grupos de casos separados por comas: {", ".join(GRUPOS)} (default: todos)')
+    parser.add_argument('--repeticiones', type=int, default=1,
+                        help='Repeticiones por caso; se guarda la más rápida (default: 1)')
+    parser.add_argument('--referencia', metavar='DIR', default='benchmark_referencia',
+                        help='Carpeta de la referencia (default: benchmark_referencia)')
+    parser.add_argument('--guardar-referencia', action='store_true',
+                        help='Guardar los resultados como nueva referencia')
+    parser.add_argument('--tolerancia-area', type=float, default=1e-3,
+                        help='Diferencia simétrica relativa máxima frente a la referencia (default: 0.001)')
+    parser.add_argument('--umbral-tiempo', type=float, default=1.2,
+                        help='Cociente de tiempo a partir del cual se avisa de una regresión (default: 1.2)')
+    parser.add_argument('-o', '--output', metavar='JSON', default=None,
+                        help='Guardar los resultados en JSON')
+    parser.add_argument('--arranque', action='store_true',
+                        help='Medir el arranque de la CLI con python -X importtime en lugar del render')
+
+    args = parser.parse_args()
+
+    grupos = [grupo.strip() for grupo in args.grupos.split(',') if grupo.strip()]
+    desconocidos = [grupo for grupo in grupos if grupo not in GRUPOS]
+    if desconocidos:
+        print(f"Error: Grupos desconocidos: {', '.join(desconocidos)}", file=sys.stderr)
+        sys.exit(1)
+    if args.repeticiones < 1:
+        print("Error: El número de repeticiones debe ser al menos 1", file=sys.stderr)
+        sys.exit(1)
+
+    if args.arranque:
+        resultados = benchmark_arranque(args.repeticiones)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(resultados, f, indent=2)
+            print(f"✓ Resultados: {args.output}")
+        return
+
+    referencia_path = os.path.join(args.referencia, 'referencia.json')
+    referencia = {}
+    if not args.guardar_referencia and os.path.exists(referencia_path):
+        with open(referencia_path) as f:
+            referencia = json.load(f)
+    if args.guardar_referencia:
+        os.makedirs(args.referencia, exist_ok=True)
+
+    lista = casos(grupos)
+    print(f"Benchmark: {len(lista)} casos ({args.repeticiones} repeticiones)")
+    print(f"{'caso':<52} {'s':>8} {'MB':>7} {'vértices':>9} {'bytes':>10}  comparación")
+
+    resultados = {}
+    fallos = 0
+    with tempfile.TemporaryDirectory() as directorio:
+        for caso in lista:
+            caso_id = caso[0]
+            medidas, geometria = medir_caso(caso, directorio, args.repeticiones)
+            resultados[caso_id] = medidas
+
+            comparacion = ''
+            wkb_path = os.path.join(args.referencia, f"{caso_id}.wkb")
+            if args.guardar_referencia:
+                with open(wkb_path, 'wb') as f:
+                    f.write(shapely.to_wkb(geometria))
+            elif caso_id in referencia and os.path.exists(wkb_path):
+                anterior = referencia[caso_id]
+                with open(wkb_path, 'rb') as f:
+                    diferencia = diferencia_relativa(geometria, shapely.from_wkb(f.read()))
+                medidas['diferencia_area'] = diferencia
+                cociente = medidas['segundos'] / max(anterior['segundos'], 1e-9)
+                comparacion = (f"tiempo x{cociente:.2f}, vértices {medidas['vertices'] - anterior['vertices']:+d}, "
+                               f"bytes {medidas['bytes_svg'] - anterior['bytes_svg']:+d}, área {diferencia:.2e}")
+                if diferencia > args.tolerancia_area:
+                    comparacion += '  ✗ geometría distinta'
+                    fallos += 1
+                elif cociente > args.umbral_tiempo:
+                    comparacion += '  ⚠ más lento'
+            elif referencia:
+                comparacion = 'sin referencia'
+            if medidas.get('aristas_abiertas'):
+                comparacion += f"  ✗ malla abierta ({medidas['aristas_abiertas']} aristas)"
+                fallos += 1
+
+            memoria = '-' if medidas['memoria_pico_mb'] is None else f"{medidas['memoria_pico_mb']:.1f}"
+            print(f"{caso_id:<52} {medidas['segundos']:>8.3f} {memoria:>7} {medidas['vertices']:>9} "
+                  f"{medidas['bytes_svg']:>10}  {comparacion}")
+
+    if args.guardar_referencia:
+        with open(referencia_path, 'w') as f:
+            json.dump(resultados, f, indent=2)
+        print(f"\n✓ Referencia guardada: {args.referencia}/")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(resultados, f, indent=2)
+        print(f"✓ Resultados: {args.output}")
+
+    if fallos:
+        print(f"\n✗ {fallos} casos con geometría distinta de la referencia o malla abierta", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,648 +1,3958 @@
-#!/usr/bin/env python3
-"""
-Circular Lines Generator
-========================
-
-Autor: Oliver Nabani
-Versión: 1.0
-"""
-
-import argparse
-import numpy as np
-from PIL import Image, ImageEnhance
-import sys
-import os
-
-try:
-    from shapely.geometry import Polygon, MultiPolygon, box
-    from shapely.ops import unary_union
-    from shapely.affinity import translate
-except ImportError:
-    print("Error: Se requiere la librería 'shapely'")
-    print("Instálala con: pip install shapely")
-    sys.exit(1)
-
-
-# CONSTANTES FÍSICAS PARA IMPRESIÓN 3D (Pueden cambiarse)
-PANEL_SIZE_MM = 217.7  # Tamaño de cada panel en mm
-MARCO_WIDTH_MM = 3.2   # Ancho del marco en mm
-LINEA_SEPARADORA_MM = 2.8  # Ancho de las líneas separadoras entre paneles
-
-
-def ajustar_contraste(imagen, contraste):
-    """Ajusta el contraste de la imagen."""
-    factor = contraste / 50.0
-    enhancer = ImageEnhance.Contrast(imagen)
-    return enhancer.enhance(factor)
-
-
-def suavizar_valores(valores, ventana=1):
-    """Aplica un promedio móvil circular para suavizar transiciones."""
-    n = len(valores)
-    suavizados = np.zeros(n)
-    mitad_ventana = ventana // 2
-
-    for i in range(n):
-        indices = [(i + j - mitad_ventana) % n for j in range(ventana)]
-        suavizados[i] = np.mean([valores[idx] for idx in indices])
-
-    return suavizados
-
-
-def calcular_dimensiones_canvas(imagen):
-
-    ancho_img, alto_img = imagen.size
-
-    # Determinar si es horizontal o vertical
-    if ancho_img >= alto_img:
-        # Horizontal: 3 columnas x 2 filas
-        cols, rows = 3, 2
-    else:
-        # Vertical: 2 columnas x 3 filas
-        cols, rows = 2, 3
-
-    ancho_mm = cols * PANEL_SIZE_MM
-    alto_mm = rows * PANEL_SIZE_MM
-
-    return ancho_mm, alto_mm, cols, rows
-
-
-def ajustar_proporcion_imagen(imagen, cols, rows):
-
-    ancho_actual, alto_actual = imagen.size
-    ratio_actual = ancho_actual / alto_actual
-
-    # Calcular ratio objetivo
-    ratio_objetivo = cols / rows
-
-    # Si ya tiene la proporción correcta (con tolerancia de 1%), no hacer nada
-    if abs(ratio_actual - ratio_objetivo) < 0.01:
-        return imagen
-
-    # Determinar si recortar por ancho o por alto
-    if ratio_actual > ratio_objetivo:
-        # Imagen más ancha de lo necesario - recortar ancho
-        nuevo_ancho = int(alto_actual * ratio_objetivo)
-        nuevo_alto = alto_actual
-
-        # Calcular offset para centrar
-        offset_x = (ancho_actual - nuevo_ancho) // 2
-        offset_y = 0
-    else:
-        # Imagen más alta de lo necesario - recortar alto
-        nuevo_ancho = ancho_actual
-        nuevo_alto = int(ancho_actual / ratio_objetivo)
-
-        # Calcular offset para centrar
-        offset_x = 0
-        offset_y = (alto_actual - nuevo_alto) // 2
-
-    # Realizar crop centrado
-    imagen_cropped = imagen.crop((
-        offset_x,
-        offset_y,
-        offset_x + nuevo_ancho,
-        offset_y + nuevo_alto
-    ))
-
-    print(f"  Imagen ajustada: {ancho_actual}x{alto_actual} → {nuevo_ancho}x{nuevo_alto} (crop centrado)")
-
-    return imagen_cropped
-
-
-def optimizar_puntos(puntos_exterior, puntos_interior, grosores, tolerancia=0.01):
-
-    n = len(grosores)
-    if n < 3:
-        return puntos_exterior, puntos_interior, list(range(n))
-
-    indices_mantenidos = []
-    i = 0
-
-    while i < n:
-        grosor_actual = grosores[i]
-        j = i + 1
-
-        while j < n and abs(grosores[j] - grosor_actual) < tolerancia:
-            j += 1
-
-        longitud_segmento = j - i
-
-        if longitud_segmento >= 6:
-            indices_mantenidos.append(i)
-            paso = max(3, longitud_segmento // 4)
-            for k in range(i + paso, j, paso):
-                indices_mantenidos.append(k)
-        else:
-            for k in range(i, j):
-                indices_mantenidos.append(k)
-
-        i = j
-
-    indices_mantenidos = sorted(list(set(indices_mantenidos)))
-
-    # Rellenar huecos grandes
-    indices_final = []
-    for idx in range(len(indices_mantenidos)):
-        indices_final.append(indices_mantenidos[idx])
-        siguiente_idx = (idx + 1) % len(indices_mantenidos)
-        distancia = indices_mantenidos[siguiente_idx] - indices_mantenidos[idx]
-
-        if siguiente_idx == 0:
-            distancia = n - indices_mantenidos[idx] + indices_mantenidos[siguiente_idx]
-
-        if distancia > 5:
-            puntos_intermedios = distancia // 3
-            for p in range(1, puntos_intermedios + 1):
-                nuevo_idx = (indices_mantenidos[idx] + p * distancia // (puntos_intermedios + 1)) % n
-                if nuevo_idx not in indices_final:
-                    indices_final.append(nuevo_idx)
-
-    indices_final = sorted(list(set(indices_final)))
-
-    puntos_ext_opt = [puntos_exterior[i] for i in indices_final]
-    puntos_int_opt = [puntos_interior[i] for i in indices_final]
-
-    return puntos_ext_opt, puntos_int_opt, indices_final
-
-
-def crear_poligono_anillo(puntos_exterior, puntos_interior):
-
-    try:
-        if len(puntos_exterior) < 3 or len(puntos_interior) < 3:
-            return None
-
-        poligono = Polygon(puntos_exterior, [puntos_interior])
-
-        if not poligono.is_valid:
-            poligono = poligono.buffer(0)
-
-        return poligono
-    except Exception as e:
-        return None
-
-
-def polygon_a_svg_path(poligono):
-
-    paths = []
-
-    if poligono.is_empty:
-        return ""
-
-    if isinstance(poligono, MultiPolygon):
-        for poly in poligono.geoms:
-            path = polygon_a_svg_path(poly)
-            if path:
-                paths.append(path)
-        return " ".join(paths)
-
-    if not isinstance(poligono, Polygon):
-        return ""
-
-    # Exterior del polígono
-    coords = list(poligono.exterior.coords)
-    if len(coords) < 3:
-        return ""
-
-    path_data = f"M {coords[0][0]:.2f},{coords[0][1]:.2f} "
-    for x, y in coords[1:]:
-        path_data += f"L {x:.2f},{y:.2f} "
-    path_data += "Z "
-
-    # Agujeros interiores
-    for interior in poligono.interiors:
-        coords = list(interior.coords)
-        if len(coords) < 3:
-            continue
-        path_data += f"M {coords[0][0]:.2f},{coords[0][1]:.2f} "
-        for x, y in coords[1:]:
-            path_data += f"L {x:.2f},{y:.2f} "
-        path_data += "Z "
-
-    return path_data
-
-
-def circulo_intersecta_canvas(cx, cy, radio, grosor_max, ancho, alto):
-
-    radio_ext = radio + grosor_max / 2
-
-    if cx + radio_ext < 0 or cx - radio_ext > ancho:
-        return False
-    if cy + radio_ext < 0 or cy - radio_ext > alto:
-        return False
-
-    return True
-
-
-def escribir_svg(file_path, ancho, alto, ancho_mm, alto_mm, geometria):
-
-    with open(file_path, 'w') as f:
-        f.write('<?xml version="1.0" ?>\n')
-        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" '
-                f'baseProfile="full" '
-                f'height="{alto_mm}mm" '
-                f'width="{ancho_mm}mm" '
-                f'viewBox="0 0 {ancho} {alto}" '
-                f'version="1.1">\n')
-
-        path_data = polygon_a_svg_path(geometria)
-        if path_data:
-            f.write(f'<path d="{path_data}" fill="black"/>\n')
-
-        f.write('</svg>\n')
-
-
-def generar_svg_circular(imagen_path, num_lineas, grosor_min, grosor_max, contraste, centro_x, centro_y, output_path, dividir_paneles=True):
-
-    print(f"Cargando imagen: {imagen_path}")
-    imagen = Image.open(imagen_path)
-
-    if imagen.mode != 'L':
-        imagen = imagen.convert('L')
-
-    # Calcular dimensiones físicas según orientación (antes de ajustar)
-    ancho_mm, alto_mm, cols, rows = calcular_dimensiones_canvas(imagen)
-
-    # Ajustar proporción de la imagen mediante crop centrado
-    imagen = ajustar_proporcion_imagen(imagen, cols, rows)
-
-    # Ajustar contraste
-    if contraste != 50:
-        print(f"Ajustando contraste: {contraste}")
-        imagen = ajustar_contraste(imagen, contraste)
-
-    # Trabajar con la imagen (ya con proporción ajustada)
-    imagen_array = np.array(imagen)
-    alto_original, ancho_original = imagen_array.shape
-
-    print(f"Modo: {'Archivo completo + 6 paneles' if dividir_paneles else 'Solo archivo completo'}")
-    print(f"Orientación detectada: {'Horizontal' if cols > rows else 'Vertical'}")
-    print(f"Disposición de paneles: {cols}x{rows}")
-    print(f"Dimensiones físicas totales: {ancho_mm}mm x {alto_mm}mm")
-    print(f"Marco: {MARCO_WIDTH_MM}mm")
-
-    alto, ancho = alto_original, ancho_original
-
-    # Calcular posición del centro en píxeles
-    cx = int(ancho * centro_x / 100.0)
-    cy = int(alto * centro_y / 100.0)
-
-    print(f"Dimensiones canvas: {ancho}x{alto} píxeles")
-    print(f"Centro: ({cx}, {cy})")
-
-    radio_max = np.sqrt(
-        max(cx**2 + cy**2,
-            (ancho - cx)**2 + cy**2,
-            cx**2 + (alto - cy)**2,
-            (ancho - cx)**2 + (alto - cy)**2)
-    )
-
-    num_segmentos = 900
-
-    print(f"Generando {num_lineas} círculos con grosor variable...")
-
-    # Crear rectángulo del canvas para operación booleana
-    canvas_rect = box(0, 0, ancho, alto)
-
-    # Calcular escala píxel a mm
-    escala_pixel_a_mm = ancho / ancho_mm
-    marco_width_pixels = MARCO_WIDTH_MM * escala_pixel_a_mm
-
-    print(f"Escala: {escala_pixel_a_mm:.2f} píxeles/mm")
-    print(f"Ancho del marco: {marco_width_pixels:.2f} píxeles ({MARCO_WIDTH_MM}mm)")
-
-    # Crear marco con 4 rectángulos en los bordes
-    marco_superior = box(0, 0, ancho, marco_width_pixels)
-    marco_inferior = box(0, alto - marco_width_pixels, ancho, alto)
-    marco_izquierdo = box(0, 0, marco_width_pixels, alto)
-    marco_derecho = box(ancho - marco_width_pixels, 0, ancho, alto)
-
-    marco = unary_union([marco_superior, marco_inferior, marco_izquierdo, marco_derecho])
-
-    # Lista para acumular todos los polígonos
-    todos_los_poligonos = [marco]
-
-    # Solo añadir separadores si dividir_paneles == True
-    if dividir_paneles:
-        # Calcular ancho de las líneas separadoras en píxeles
-        linea_sep_pixels = LINEA_SEPARADORA_MM * escala_pixel_a_mm
-        print(f"Ancho líneas separadoras: {linea_sep_pixels:.2f} píxeles ({LINEA_SEPARADORA_MM}mm)")
-
-        # Crear líneas separadoras entre paneles
-        lineas_separadoras = []
-
-        # Líneas VERTICALES (entre columnas)
-        if cols == 3:
-            # 3x2 (horizontal): Dos líneas verticales a 217.7mm y 435.4mm
-            x_pos_1_pixels = PANEL_SIZE_MM * escala_pixel_a_mm
-            x_pos_2_pixels = PANEL_SIZE_MM * 2 * escala_pixel_a_mm
-
-            linea_vertical_1 = box(
-                x_pos_1_pixels - linea_sep_pixels / 2,
-                0,
-                x_pos_1_pixels + linea_sep_pixels / 2,
-                alto
-            )
-            linea_vertical_2 = box(
-                x_pos_2_pixels - linea_sep_pixels / 2,
-                0,
-                x_pos_2_pixels + linea_sep_pixels / 2,
-                alto
-            )
-            lineas_separadoras.append(linea_vertical_1)
-            lineas_separadoras.append(linea_vertical_2)
-        else:
-            # 2x3 (vertical): Una línea vertical a 217.7mm
-            x_pos_pixels = PANEL_SIZE_MM * escala_pixel_a_mm
-            linea_vertical = box(
-                x_pos_pixels - linea_sep_pixels / 2,
-                0,
-                x_pos_pixels + linea_sep_pixels / 2,
-                alto
-            )
-            lineas_separadoras.append(linea_vertical)
-
-        # Líneas HORIZONTALES (entre filas)
-        if rows == 2:
-            # 3x2 (horizontal): Una línea horizontal a 217.7mm
-            y_pos_pixels = PANEL_SIZE_MM * escala_pixel_a_mm
-            linea_horizontal = box(
-                0,
-                y_pos_pixels - linea_sep_pixels / 2,
-                ancho,
-                y_pos_pixels + linea_sep_pixels / 2
-            )
-            lineas_separadoras.append(linea_horizontal)
-        else:
-            # 2x3 (vertical): Dos líneas horizontales a 217.7mm y 435.4mm
-            y_pos_1_pixels = PANEL_SIZE_MM * escala_pixel_a_mm
-            y_pos_2_pixels = PANEL_SIZE_MM * 2 * escala_pixel_a_mm
-
-            linea_horizontal_1 = box(
-                0,
-                y_pos_1_pixels - linea_sep_pixels / 2,
-                ancho,
-                y_pos_1_pixels + linea_sep_pixels / 2
-            )
-            linea_horizontal_2 = box(
-                0,
-                y_pos_2_pixels - linea_sep_pixels / 2,
-                ancho,
-                y_pos_2_pixels + linea_sep_pixels / 2
-            )
-            lineas_separadoras.append(linea_horizontal_1)
-            lineas_separadoras.append(linea_horizontal_2)
-
-        separadores = unary_union(lineas_separadoras)
-        todos_los_poligonos.append(separadores)
-
-        print(f"Líneas separadoras: {cols - 1} verticales + {rows - 1} horizontales")
-
-    total_puntos_antes = 0
-    total_puntos_despues = 0
-    circulos_completos = 0
-    circulos_cortados = 0
-    circulos_descartados = 0
-
-    # Generar cada círculo
-    for i in range(num_lineas):
-        radio = radio_max * (i + 1) / num_lineas
-
-        if not circulo_intersecta_canvas(cx, cy, radio, grosor_max, ancho, alto):
-            circulos_descartados += 1
-            continue
-
-        # Recopilar intensidades
-        intensidades_circulo = []
-        for j in range(num_segmentos):
-            angulo_medio = 2 * np.pi * (j + 0.5) / num_segmentos
-            x = int(cx + radio * np.cos(angulo_medio))
-            y = int(cy + radio * np.sin(angulo_medio))
-
-            if 0 <= x < ancho and 0 <= y < alto:
-                intensidad = imagen_array[y, x]
-            else:
-                intensidad = 255
-
-            intensidades_circulo.append(intensidad)
-
-        intensidades_suavizadas = suavizar_valores(intensidades_circulo, ventana=1)
-
-        # Convertir a grosores
-        grosores = []
-        for intensidad in intensidades_suavizadas:
-            factor = 1.0 - (intensidad / 255.0)
-            grosor = grosor_min + (grosor_max - grosor_min) * factor
-            grosores.append(grosor)
-
-        # Calcular puntos
-        puntos_exterior = []
-        puntos_interior = []
-
-        for j in range(num_segmentos):
-            angulo = 2 * np.pi * j / num_segmentos
-            grosor_actual = grosores[j]
-
-            radio_interior = radio - grosor_actual / 2
-            radio_exterior = radio + grosor_actual / 2
-
-            x_ext = cx + radio_exterior * np.cos(angulo)
-            y_ext = cy + radio_exterior * np.sin(angulo)
-            puntos_exterior.append((x_ext, y_ext))
-
-            x_int = cx + radio_interior * np.cos(angulo)
-            y_int = cy + radio_interior * np.sin(angulo)
-            puntos_interior.append((x_int, y_int))
-
-        # Optimizar puntos
-        total_puntos_antes += len(puntos_exterior)
-        puntos_ext_opt, puntos_int_opt, _ = optimizar_puntos(
-            puntos_exterior, puntos_interior, grosores, tolerancia=0.01
-        )
-        total_puntos_despues += len(puntos_ext_opt)
-
-        # Crear polígono del anillo
-        poligono_anillo = crear_poligono_anillo(puntos_ext_opt, puntos_int_opt)
-
-        if poligono_anillo is None or poligono_anillo.is_empty:
-            circulos_descartados += 1
-            continue
-
-        # OPERACIÓN BOOLEANA: Intersección con el canvas
-        try:
-            poligono_recortado = poligono_anillo.intersection(canvas_rect)
-
-            if poligono_recortado.is_empty:
-                circulos_descartados += 1
-                continue
-
-            if poligono_recortado.area < poligono_anillo.area * 0.99:
-                circulos_cortados += 1
-            else:
-                circulos_completos += 1
-
-            todos_los_poligonos.append(poligono_recortado)
-
-        except Exception as e:
-            print(f"  Advertencia: Error procesando círculo {i}: {e}")
-            circulos_descartados += 1
-            continue
-
-        if (i + 1) % 50 == 0:
-            print(f"  Procesados {i + 1}/{num_lineas} círculos...")
-
-    # UNIÓN BOOLEANA FINAL
-    print("Realizando unión booleana final...")
-    geometria_completa = unary_union(todos_los_poligonos)
-    print("✓ Unión booleana exitosa")
-
-    # GUARDAR ARCHIVO COMPLETO
-    print(f"\nGuardando archivo completo: {output_path}")
-    escribir_svg(output_path, ancho, alto, ancho_mm, alto_mm, geometria_completa)
-    print(f"✓ SVG completo guardado")
-
-    # Si no dividir paneles, terminar aquí
-    if not dividir_paneles:
-        print(f"\n✓ Generación completa (archivo único)")
-        # Estadísticas
-        if total_puntos_antes > 0:
-            reduccion = 100 * (1 - total_puntos_despues / total_puntos_antes)
-            print(f"\nEstadísticas:")
-            print(f"  Puntos antes: {total_puntos_antes}")
-            print(f"  Puntos después: {total_puntos_despues}")
-            print(f"  Reducción de puntos: {reduccion:.1f}%")
-            print(f"  Círculos completos: {circulos_completos}")
-            print(f"  Círculos cortados: {circulos_cortados}")
-            print(f"  Círculos descartados: {circulos_descartados}")
-        return
-
-    # CREAR CARPETA PARA PANELES
-    base_name = os.path.splitext(output_path)[0]
-    panels_dir = base_name
-    os.makedirs(panels_dir, exist_ok=True)
-    print(f"\nCarpeta para paneles: {panels_dir}/")
-
-    # CALCULAR DIMENSIONES DE CADA PANEL EN PÍXELES
-    panel_width_pixels = PANEL_SIZE_MM * escala_pixel_a_mm
-    panel_height_pixels = PANEL_SIZE_MM * escala_pixel_a_mm
-
-    # GENERAR LOS 6 PANELES
-    print(f"\nGenerando {cols * rows} paneles individuales...")
-    panel_num = 1
-
-    for row in range(rows):
-        for col in range(cols):
-            # Calcular rectángulo de corte para este panel
-            x_min = col * panel_width_pixels
-            y_min = row * panel_height_pixels
-            x_max = x_min + panel_width_pixels
-            y_max = y_min + panel_height_pixels
-
-            panel_rect = box(x_min, y_min, x_max, y_max)
-
-            # Cortar la geometría completa con el rectángulo del panel
-            panel_geom = geometria_completa.intersection(panel_rect)
-
-            if not panel_geom.is_empty:
-                # Trasladar la geometría al origen (0,0)
-                panel_geom_trasladado = translate(panel_geom, -x_min, -y_min)
-
-                # Guardar SVG del panel
-                panel_svg_path = os.path.join(panels_dir, f"panel_{panel_num}.svg")
-                escribir_svg(
-                    panel_svg_path,
-                    panel_width_pixels,
-                    panel_height_pixels,
-                    PANEL_SIZE_MM,
-                    PANEL_SIZE_MM,
-                    panel_geom_trasladado
-                )
-                print(f"  ✓ Panel {panel_num}: {panel_svg_path}")
-            else:
-                print(f"  ⚠ Panel {panel_num} vacío (omitido)")
-
-            panel_num += 1
-
-    # Estadísticas
-    if total_puntos_antes > 0:
-        reduccion = 100 * (1 - total_puntos_despues / total_puntos_antes)
-        print(f"\nEstadísticas:")
-        print(f"  Puntos antes: {total_puntos_antes}")
-        print(f"  Puntos después: {total_puntos_despues}")
-        print(f"  Reducción de puntos: {reduccion:.1f}%")
-        print(f"  Círculos completos: {circulos_completos}")
-        print(f"  Círculos cortados: {circulos_cortados}")
-        print(f"  Círculos descartados: {circulos_descartados}")
-
-    print(f"\n✓ Generación completa!")
-    print(f"✓ 1 archivo completo: {output_path}")
-    print(f"✓ 6 archivos SVG en: {panels_dir}/")
-
-
-def main():
-    parser = argparse.ArgumentParser(
-        description='Circular Lines Generator - Genera círculos concéntricos a partir de imágenes',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Ejemplos de uso:
-  %(prog)s imagen.jpg -o salida.svg
-  %(prog)s imagen.jpg -n 500 -min 0.5 -max 5.0 -c 75
-  %(prog)s imagen.jpg -cx 50 -cy 30 -n 300
-  %(prog)s imagen.jpg -o salida.svg --no-dividir  (solo archivo único)
-
-Características:
-  - Dimensiones físicas: 217.7mm x 217.7mm por panel (6 paneles total)
-  - Marco de 3.2mm y líneas separadoras de 2.8mm
-  - Optimización automática de puntos
-  - Operaciones booleanas para recorte preciso
-        """
-    )
-
-    parser.add_argument('imagen', help='Ruta de la imagen de entrada (blanco y negro)')
-    parser.add_argument('-o', '--output', default='salida.svg', help='Archivo SVG salida (default: salida.svg)')
-    parser.add_argument('-n', '--num-lineas', type=int, default=120, help='Número de círculos (default: 120)')
-    parser.add_argument('-min', '--grosor-min', type=float, default=6.0, help='Grosor mínimo (default: 6.0)')
-    parser.add_argument('-max', '--grosor-max', type=float, default=16.0, help='Grosor máximo (default: 16.0)')
-    parser.add_argument('-c', '--contraste', type=float, default=75.0, help='Contraste: 50=neutro (default: 75)')
-    parser.add_argument('-cx', '--centro-x', type=float, default=-20.0, help='Centro X en % (default: -20)')
-    parser.add_argument('-cy', '--centro-y', type=float, default=50.0, help='Centro Y en % (default: 50)')
-    parser.add_argument('--no-dividir', action='store_true', help='Solo generar archivo completo, sin paneles')
-
-    args = parser.parse_args()
-
-    if args.num_lineas < 1:
-        print("Error: El número de líneas debe ser al menos 1", file=sys.stderr)
-        sys.exit(1)
-
-    if args.grosor_min < 0 or args.grosor_max < 0:
-        print("Error: Los grosores no pueden ser negativos", file=sys.stderr)
-        sys.exit(1)
-
-    if args.grosor_min > args.grosor_max:
-        print("Error: El grosor mínimo no puede ser mayor que el máximo", file=sys.stderr)
-        sys.exit(1)
-
-    try:
-        generar_svg_circular(
-            args.imagen,
-            args.num_lineas,
-            args.grosor_min,
-            args.grosor_max,
-            args.contraste,
-            args.centro_x,
-            args.centro_y,
-            args.output,
-            dividir_paneles=not args.no_dividir
-        )
-    except FileNotFoundError:
-        print(f"Error: No se encontró el archivo '{args.imagen}'", file=sys.stderr)
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error: {str(e)}", file=sys.stderr)
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
-
-
-if __name__ == '__main__':
-    main()
+#!/usr/bin/env python3
+"""
+Circular Lines Generator
+========================
+
+Autor: Oliver Nabani
+Versión: 1.0
+"""
+
+import argparse
+import sys
+import os
+import io
+import csv
+import gzip
+import time
+import hashlib
+import json
+import contextlib
+import signal
+import threading
+from dataclasses import dataclass, field, replace
+from urllib.parse import parse_qs, urlparse
+
+
+class ModuloDiferido:
+    """
+    Módulo que se importa la primera vez que se usa uno de sus atributos.
+
+    Así --help, los errores de parámetros y --validar no cargan numpy, PIL ni
+    shapely, y cada etapa solo carga lo que necesita (PIL al decodificar la
+    imagen, shapely al vectorizar). Tras la importación el nombre global
+    pasa a ser el módulo real y los siguientes accesos no pasan por aquí.
+    """
+
+    def __init__(self, modulo, nombre, paquete):
+        self._modulo = modulo
+        self._nombre = nombre
+        self._paquete = paquete
+
+    def __getattr__(self, atributo):
+        try:
+            # __import__ y no importlib.import_module: así la importación
+            # aparece en el informe de python -X importtime
+            __import__(self._modulo)
+        except ImportError:
+            raise ImportError(f"Se requiere la librería '{self._paquete}'. "
+                              f"Instálala con: pip install {self._paquete}") from None
+        modulo = sys.modules[self._modulo]
+        globals()[self._nombre] = modulo
+        return getattr(modulo, atributo)
+
+
+np = ModuloDiferido('numpy', 'np', 'numpy')
+Image = ModuloDiferido('PIL.Image', 'Image', 'pillow')
+ImageEnhance = ModuloDiferido('PIL.ImageEnhance', 'ImageEnhance', 'pillow')
+shapely = ModuloDiferido('shapely', 'shapely', 'shapely')
+
+
+# CONSTANTES FÍSICAS PARA IMPRESIÓN 3D (Pueden cambiarse)
+PANEL_SIZE_MM = 217.7  # Tamaño de cada panel en mm
+MARCO_WIDTH_MM = 3.2   # Ancho del marco en mm
+LINEA_SEPARADORA_MM = 2.8  # Ancho de las líneas separadoras entre paneles
+ALTURA_EXTRUSION_MM = 0.8  # Altura de la extrusión en los formatos 3D (STL y 3MF)
+
+# RESOLUCIÓN DE TRABAJO
+RESOLUCION_MAXIMA_PX_MM = 10.0  # Más de 10 píxeles por mm (0.1mm) no aporta detalle imprimible
+NIVELES_PIRAMIDE = 5  # Niveles de la pirámide de imágenes para el muestreo
+
+# TESELADO
+NUM_SEGMENTOS = 900  # Segmentos por círculo con teselado fijo
+SEGMENTOS_MINIMOS = 12  # Mínimo de segmentos por círculo con teselado adaptativo
+TOLERANCIA_SIMPLIFICACION_MM = 0.05  # Desviación máxima al simplificar los anillos
+ITERACIONES_BISECCION = 40  # Bisecciones para situar el borde visible de un anillo junto a un lado
+
+# CURVAS
+FAMILIAS_CURVAS = ('circulos', 'elipses', 'espiral')
+ESPACIADOS_CURVAS = ('uniforme', 'detalle')
+PROPORCION_ELIPSE = 0.6  # Semieje vertical / semieje horizontal de las elipses
+MUESTRAS_DETALLE = 256  # Ángulos por curva al medir el detalle para el espaciado adaptativo
+DENSIDAD_MAXIMA_DETALLE = 2.0  # El espaciado por detalle varía entre la mitad y el doble del uniforme
+
+# RENDER POR PANELES
+ANILLOS_POR_BLOQUE = 32  # Anillos que se clasifican a la vez contra el canvas completo
+
+# VISTA PREVIA
+PREVIEW_ANCHO_PX = 1200  # Ancho de la vista previa PNG en píxeles
+
+# LOTES
+IMAGEN_GRANDE_MPX = 20  # Imágenes de más megapíxeles cuentan para el límite de --max-grandes
+
+# CACHÉ
+TAMANO_CACHE_MB = 500  # Tamaño máximo de la caché en disco; se borran las entradas menos usadas
+
+# SERVIDOR
+PUERTO_SERVIDOR = 8765
+TRABAJOS_GUARDADOS = 1000  # Trabajos terminados que el servidor recuerda, con sus eventos
+
+
+def ajustar_contraste(imagen, contraste):
+    """Ajusta el contraste de la imagen."""
+    factor = contraste / 50.0
+    enhancer = ImageEnhance.Contrast(imagen)
+    return enhancer.enhance(factor)
+
+
+def suavizar_valores(valores, ventana=1, circular=True):
+    """
+    Aplica un promedio móvil (sobre el último eje) para suavizar transiciones.
+
+    Con `circular=False` (arcos abiertos) los extremos se repiten en lugar de
+    dar la vuelta.
+    """
+    valores = np.asarray(valores, dtype=float)
+    if ventana <= 1:
+        return valores.copy()
+
+    n = valores.shape[-1]
+    mitad_ventana = ventana // 2
+
+    # Extender los extremos y usar sumas acumuladas: O(n) para cualquier ventana
+    indices = np.arange(-mitad_ventana, n - mitad_ventana + ventana - 1)
+    indices = indices % n if circular else np.clip(indices, 0, n - 1)
+    acumulado = np.cumsum(valores[..., indices], axis=-1)
+    ceros = np.zeros(valores.shape[:-1] + (1,))
+    acumulado = np.concatenate((ceros, acumulado), axis=-1)
+
+    return (acumulado[..., ventana:] - acumulado[..., :-ventana]) / ventana
+
+
+def leer_medidas(valor):
+    """
+    Pareja (a, b) a partir de un número, una pareja o un texto 'AxB'. Un
+    solo valor vale para los dos.
+    """
+    if isinstance(valor, str):
+        valores = [float(parte) for parte in valor.lower().replace('×', 'x').split('x')]
+    elif isinstance(valor, (int, float)):
+        valores = [valor]
+    else:
+        valores = list(valor)
+
+    if len(valores) == 1:
+        valores = valores * 2
+    if len(valores) != 2:
+        raise ValueError(f"Medida no válida: {valor!r} (se espera N o AxB)")
+    return valores[0], valores[1]
+
+
+@dataclass
+class Disposicion:
+    """
+    Cuadrícula de paneles y medidas físicas en mm de cada panel, del marco
+    exterior y de las líneas separadoras.
+    """
+    cols: int
+    rows: int
+    panel_ancho_mm: float = PANEL_SIZE_MM
+    panel_alto_mm: float = PANEL_SIZE_MM
+    marco_mm: float = MARCO_WIDTH_MM
+    separador_mm: float = LINEA_SEPARADORA_MM
+
+    @property
+    def ancho_mm(self):
+        return self.cols * self.panel_ancho_mm
+
+    @property
+    def alto_mm(self):
+        return self.rows * self.panel_alto_mm
+
+    @property
+    def num_paneles(self):
+        return self.cols * self.rows
+
+    @property
+    def proporcion(self):
+        """Proporción ancho:alto del diseño completo."""
+        return (self.cols / self.rows) * (self.panel_ancho_mm / self.panel_alto_mm)
+
+    def rectangulos_paneles(self, escala_pixel_a_mm):
+        """(x_min, y_min, ancho, alto) de cada panel en píxeles del canvas, por filas."""
+        ancho_panel = self.panel_ancho_mm * escala_pixel_a_mm
+        alto_panel = self.panel_alto_mm * escala_pixel_a_mm
+        return [
+            (col * ancho_panel, row * alto_panel, ancho_panel, alto_panel)
+            for row in range(self.rows) for col in range(self.cols)
+        ]
+
+
+def calcular_disposicion(imagen, paneles=None, panel_mm=PANEL_SIZE_MM, marco_mm=MARCO_WIDTH_MM,
+                         separador_mm=LINEA_SEPARADORA_MM):
+    """
+    Disposición de los paneles para una imagen.
+
+    `paneles` es la cuadrícula (columnas, filas) o 'CxF'; sin ella se usan
+    3x2 para imágenes horizontales y 2x3 para verticales. `panel_mm` es el
+    lado de un panel cuadrado o su (ancho, alto).
+    """
+    if paneles is None:
+        ancho_img, alto_img = imagen.size
+
+        # Determinar si es horizontal o vertical
+        if ancho_img >= alto_img:
+            # Horizontal: 3 columnas x 2 filas
+            cols, rows = 3, 2
+        else:
+            # Vertical: 2 columnas x 3 filas
+            cols, rows = 2, 3
+    else:
+        cols, rows = leer_medidas(paneles)
+        if cols != int(cols) or rows != int(rows) or cols < 1 or rows < 1:
+            raise ValueError(f"Cuadrícula de paneles no válida: {paneles!r}")
+        cols, rows = int(cols), int(rows)
+
+    panel_ancho_mm, panel_alto_mm = leer_medidas(panel_mm)
+    if panel_ancho_mm <= 0 or panel_alto_mm <= 0:
+        raise ValueError(f"Tamaño de panel no válido: {panel_mm!r}")
+    if marco_mm < 0 or separador_mm < 0:
+        raise ValueError("El marco y los separadores no pueden ser negativos")
+
+    return Disposicion(cols, rows, panel_ancho_mm, panel_alto_mm, marco_mm, separador_mm)
+
+
+def calcular_recorte(ancho_actual, alto_actual, ratio_objetivo):
+    """Calcula el recorte centrado (offset_x, offset_y, ancho, alto) para la proporción ancho:alto dada."""
+    ratio_actual = ancho_actual / alto_actual
+
+    # Si ya tiene la proporción correcta (con tolerancia de 1%), no hacer nada
+    if abs(ratio_actual - ratio_objetivo) < 0.01:
+        return 0, 0, ancho_actual, alto_actual
+
+    # Determinar si recortar por ancho o por alto
+    if ratio_actual > ratio_objetivo:
+        # Imagen más ancha de lo necesario - recortar ancho
+        nuevo_ancho = int(alto_actual * ratio_objetivo)
+        nuevo_alto = alto_actual
+
+        # Calcular offset para centrar
+        offset_x = (ancho_actual - nuevo_ancho) // 2
+        offset_y = 0
+    else:
+        # Imagen más alta de lo necesario - recortar alto
+        nuevo_ancho = ancho_actual
+        nuevo_alto = int(ancho_actual / ratio_objetivo)
+
+        # Calcular offset para centrar
+        offset_x = 0
+        offset_y = (alto_actual - nuevo_alto) // 2
+
+    return offset_x, offset_y, nuevo_ancho, nuevo_alto
+
+
+def ajustar_proporcion_imagen(imagen, proporcion):
+
+    ancho_actual, alto_actual = imagen.size
+    offset_x, offset_y, nuevo_ancho, nuevo_alto = calcular_recorte(ancho_actual, alto_actual, proporcion)
+
+    if (nuevo_ancho, nuevo_alto) == (ancho_actual, alto_actual):
+        return imagen
+
+    # Realizar crop centrado
+    imagen_cropped = imagen.crop((
+        offset_x,
+        offset_y,
+        offset_x + nuevo_ancho,
+        offset_y + nuevo_alto
+    ))
+
+    print(f"  Imagen ajustada: {ancho_actual}x{alto_actual} → {nuevo_ancho}x{nuevo_alto} (crop centrado)")
+
+    return imagen_cropped
+
+
+def calcular_escala_trabajo(ancho, ancho_mm, radio_max, num_lineas, num_segmentos):
+    """
+    Calcula la escala (<= 1) de la imagen de trabajo respecto al canvas.
+
+    El detalle más fino que pueden representar los anillos es el menor entre la
+    separación de dos anillos y el tramo de arco de un segmento en el anillo
+    exterior; con dos píxeles de trabajo por ese paso basta. Tampoco se pasa de
+    RESOLUCION_MAXIMA_PX_MM sobre el tamaño físico. Si la reducción no llega a
+    la mitad, se trabaja a resolución completa.
+    """
+    espaciado = radio_max / num_lineas
+    arco_exterior = 2 * np.pi * radio_max / num_segmentos
+    pixel_muestreo = min(espaciado, arco_exterior) / 2
+    pixel_fisico = (ancho / ancho_mm) / RESOLUCION_MAXIMA_PX_MM
+
+    escala = 1.0 / max(pixel_muestreo, pixel_fisico, 1.0)
+
+    return escala if escala <= 0.5 else 1.0
+
+
+def cargar_imagen_trabajo(imagen, proporcion, escala):
+    """
+    Decodifica la imagen en escala de grises, recortada a la proporción
+    ancho:alto dada y reducida a `escala`.
+
+    Con JPEG la reducción se hace durante la decodificación (`draft`), así que
+    nunca se llega a tener la imagen completa en memoria.
+    """
+    ancho_original, alto_original = imagen.size
+    offset_x, offset_y, ancho, alto = calcular_recorte(ancho_original, alto_original, proporcion)
+    ancho_trabajo = max(1, round(ancho * escala))
+    alto_trabajo = max(1, round(alto * escala))
+
+    imagen.draft('L', (int(np.ceil(ancho_original * escala)), int(np.ceil(alto_original * escala))))
+    if imagen.mode != 'L':
+        imagen = imagen.convert('L')
+
+    # El borrador puede venir ya reducido: llevar el recorte a su escala
+    factor_x = imagen.size[0] / ancho_original
+    factor_y = imagen.size[1] / alto_original
+    imagen = imagen.crop((
+        offset_x * factor_x,
+        offset_y * factor_y,
+        (offset_x + ancho) * factor_x,
+        (offset_y + alto) * factor_y
+    ))
+
+    if (ancho, alto) != (ancho_original, alto_original):
+        print(f"  Imagen ajustada: {ancho_original}x{alto_original} → {ancho}x{alto} (crop centrado)")
+
+    return imagen.resize((ancho_trabajo, alto_trabajo), Image.BOX, reducing_gap=2.0)
+
+
+def construir_piramide(imagen_array, niveles=NIVELES_PIRAMIDE):
+    """Construye una pirámide de imágenes promediando bloques de 2x2 en cada nivel."""
+    piramide = [np.asarray(imagen_array)]
+
+    while len(piramide) < niveles:
+        nivel = piramide[-1]
+        alto, ancho = nivel.shape[0] // 2, nivel.shape[1] // 2
+        if alto < 2 or ancho < 2:
+            break
+        bloques = nivel[:alto * 2, :ancho * 2].reshape(alto, 2, ancho, 2)
+        piramide.append(bloques.mean(axis=(1, 3), dtype=np.float32))
+
+    return piramide
+
+
+def distancia_a_cuerda(puntos, inicio, fin):
+    """Distancia de cada punto al segmento inicio-fin (todos arrays de forma (n, 2))."""
+    cuerda = fin - inicio
+    relativo = puntos - inicio
+    longitud2 = np.einsum('ij,ij->i', cuerda, cuerda)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(longitud2 > 0, np.einsum('ij,ij->i', relativo, cuerda) / longitud2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(*(relativo - t[:, np.newaxis] * cuerda).T)
+
+
+def simplificar_tramos(tramos, tolerancia):
+    """
+    Simplifica todos los tramos a la vez con Douglas-Peucker vectorizado.
+
+    `tramos` es una lista de (puntos_exterior, puntos_interior, cerrado). Los dos
+    bordes de cada tramo conservan los mismos índices, y ningún punto eliminado
+    queda a más de `tolerancia` de la cuerda que lo sustituye en ninguno de
+    ellos. En lugar de recursión, cada pasada parte a la vez todas las cuerdas
+    que superan la tolerancia de todos los tramos. Devuelve la lista de
+    (puntos_exterior, puntos_interior) simplificados.
+    """
+    if not tramos:
+        return []
+
+    # Concatenar tramos; los cerrados repiten el primer punto al final
+    exteriores, interiores, longitudes = [], [], []
+    for puntos_exterior, puntos_interior, cerrado in tramos:
+        puntos_exterior = np.asarray(puntos_exterior, dtype=float)
+        puntos_interior = np.asarray(puntos_interior, dtype=float)
+        if cerrado:
+            puntos_exterior = np.vstack((puntos_exterior, puntos_exterior[:1]))
+            puntos_interior = np.vstack((puntos_interior, puntos_interior[:1]))
+        exteriores.append(puntos_exterior)
+        interiores.append(puntos_interior)
+        longitudes.append(len(puntos_exterior))
+
+    exterior = np.concatenate(exteriores)
+    interior = np.concatenate(interiores)
+    finales = np.cumsum(longitudes)
+    inicios = finales - longitudes
+
+    # Extremos de cada tramo y, en los cerrados, el punto opuesto al inicio
+    mantener = np.zeros(len(exterior), dtype=bool)
+    mantener[inicios] = True
+    mantener[finales - 1] = True
+    for (_, _, cerrado), inicio, longitud in zip(tramos, inicios, longitudes):
+        if cerrado:
+            mantener[inicio + longitud // 2] = True
+
+    # Solo se revisan los puntos de cuerdas que aún superan la tolerancia
+    activos = np.flatnonzero(~mantener)
+    while len(activos):
+        mantenidos = np.flatnonzero(mantener)
+
+        # Cuerda a la que pertenece cada punto activo
+        cuerda = np.searchsorted(mantenidos, activos, side='right') - 1
+        a = mantenidos[cuerda]
+        b = mantenidos[cuerda + 1]
+
+        desviacion = np.maximum(
+            distancia_a_cuerda(exterior[activos], exterior[a], exterior[b]),
+            distancia_a_cuerda(interior[activos], interior[a], interior[b])
+        )
+
+        excedidos = np.flatnonzero(desviacion > tolerancia)
+        if len(excedidos) == 0:
+            break
+
+        # Partir cada cuerda que se sale de la tolerancia por su punto más lejano
+        cuerdas_excedidas = cuerda[excedidos]
+        orden = np.lexsort((-desviacion[excedidos], cuerdas_excedidas))
+        _, primeros = np.unique(cuerdas_excedidas[orden], return_index=True)
+        nuevos = activos[excedidos[orden[primeros]]]
+        mantener[nuevos] = True
+
+        # Seguir solo con los puntos de las cuerdas que se han partido
+        partida = np.zeros(len(mantenidos), dtype=bool)
+        partida[cuerdas_excedidas] = True
+        activos = activos[partida[cuerda] & ~mantener[activos]]
+
+    resultado = []
+    for (_, _, cerrado), inicio, final in zip(tramos, inicios, finales):
+        indices = np.flatnonzero(mantener[inicio:final]) + inicio
+        if cerrado:
+            indices = indices[:-1]
+        resultado.append((exterior[indices], interior[indices]))
+
+    return resultado
+
+
+def calcular_tabla_integral(imagen_array):
+    """Calcula la tabla de áreas sumadas (con una fila y columna de ceros al inicio)."""
+    alto, ancho = imagen_array.shape
+    tabla = np.zeros((alto + 1, ancho + 1))
+    np.cumsum(imagen_array, axis=0, out=tabla[1:, 1:])
+    np.cumsum(tabla[1:, 1:], axis=1, out=tabla[1:, 1:])
+    return tabla
+
+
+def muestrear_cercano(imagen_array, xs, ys):
+    """Lee el píxel que contiene cada posición (255 fuera del canvas)."""
+    alto, ancho = imagen_array.shape
+
+    # Truncado hacia cero, igual que int()
+    xi = np.trunc(xs).astype(np.intp)
+    yi = np.trunc(ys).astype(np.intp)
+
+    dentro = (xi >= 0) & (xi < ancho) & (yi >= 0) & (yi < alto)
+    intensidades = np.full(xi.shape, 255.0)
+    intensidades[dentro] = imagen_array[yi[dentro], xi[dentro]]
+
+    return intensidades
+
+
+def muestrear_bilineal(imagen_array, xs, ys):
+    """Interpola bilinealmente entre los centros de los píxeles (255 fuera del canvas)."""
+    alto, ancho = imagen_array.shape
+
+    # Borde de un píxel blanco para que el exterior se interpole hacia 255
+    imagen_borde = np.pad(imagen_array.astype(float), 1, constant_values=255.0)
+
+    # Coordenadas en el espacio de índices de la imagen con borde
+    u = np.clip(np.asarray(xs, dtype=float) + 0.5, 0, ancho + 1)
+    v = np.clip(np.asarray(ys, dtype=float) + 0.5, 0, alto + 1)
+
+    u0 = np.minimum(np.floor(u).astype(np.intp), ancho)
+    v0 = np.minimum(np.floor(v).astype(np.intp), alto)
+    du = u - u0
+    dv = v - v0
+
+    superior = imagen_borde[v0, u0] * (1 - du) + imagen_borde[v0, u0 + 1] * du
+    inferior = imagen_borde[v0 + 1, u0] * (1 - du) + imagen_borde[v0 + 1, u0 + 1] * du
+
+    return superior * (1 - dv) + inferior * dv
+
+
+def muestrear_area(tabla_integral, xs, ys, lado):
+    """
+    Promedia la imagen en una caja de lado `lado` centrada en cada posición.
+
+    Usa la tabla integral, así que el coste no depende del tamaño de la caja.
+    La parte de la caja fuera del canvas cuenta como blanco (255).
+    """
+    alto, ancho = tabla_integral.shape[0] - 1, tabla_integral.shape[1] - 1
+    mitad = np.maximum(np.asarray(lado, dtype=float), 1.0) / 2
+
+    x0 = np.round(xs - mitad).astype(np.intp)
+    y0 = np.round(ys - mitad).astype(np.intp)
+    x1 = np.maximum(np.round(xs + mitad).astype(np.intp), x0 + 1)
+    y1 = np.maximum(np.round(ys + mitad).astype(np.intp), y0 + 1)
+    area_total = (x1 - x0) * (y1 - y0)
+
+    # Recortar la caja al canvas
+    x0 = np.clip(x0, 0, ancho)
+    x1 = np.clip(x1, 0, ancho)
+    y0 = np.clip(y0, 0, alto)
+    y1 = np.clip(y1, 0, alto)
+    area_dentro = (x1 - x0) * (y1 - y0)
+
+    suma = (tabla_integral[y1, x1] - tabla_integral[y0, x1]
+            - tabla_integral[y1, x0] + tabla_integral[y0, x0])
+
+    return (suma + 255.0 * (area_total - area_dentro)) / area_total
+
+
+MODOS_MUESTREO = ('cercano', 'bilineal', 'area')
+
+
+def muestrear_intensidades(imagen_array, xs, ys, modo='cercano', lado=1.0, tabla_integral=None):
+    """Lee la intensidad de la imagen en las posiciones dadas con el modo indicado."""
+    if modo == 'cercano':
+        return muestrear_cercano(imagen_array, xs, ys)
+    if modo == 'bilineal':
+        return muestrear_bilineal(imagen_array, xs, ys)
+    if modo == 'area':
+        if tabla_integral is None:
+            tabla_integral = calcular_tabla_integral(imagen_array)
+        return muestrear_area(tabla_integral, xs, ys, lado)
+
+    raise ValueError(f"Modo de muestreo desconocido: {modo}")
+
+
+def muestrear_piramide(piramide, ancho, alto, xs, ys, modo='cercano', lado=1.0):
+    """
+    Muestrea la pirámide en coordenadas del canvas (ancho × alto).
+
+    'cercano' y 'area' leen siempre el nivel base; 'bilineal' elige para cada
+    muestra el nivel cuyo píxel se ajusta a `lado`, como un mipmap.
+    """
+    base = piramide[0]
+    escala_x = base.shape[1] / ancho
+    escala_y = base.shape[0] / alto
+    lado_base = np.asarray(lado, dtype=float) * escala_x
+
+    if modo != 'bilineal' or len(piramide) == 1:
+        return muestrear_intensidades(base, xs * escala_x, ys * escala_y, modo=modo, lado=lado_base)
+
+    niveles = np.floor(np.log2(np.maximum(lado_base, 1.0))).astype(np.intp)
+    niveles = np.minimum(np.broadcast_to(niveles, xs.shape), len(piramide) - 1)
+
+    intensidades = np.empty(xs.shape)
+    for n in np.unique(niveles):
+        muestras = niveles == n
+        imagen_nivel = piramide[n]
+        intensidades[muestras] = muestrear_bilineal(
+            imagen_nivel,
+            xs[muestras] * imagen_nivel.shape[1] / ancho,
+            ys[muestras] * imagen_nivel.shape[0] / alto
+        )
+
+    return intensidades
+
+
+@dataclass
+class FamiliaCurvas:
+    """
+    Familia de curvas polares alrededor del centro del diseño.
+
+    La curva k es r_k(θ) = escalas[k] · forma(θ) + paso · θ / 2π, con θ en
+    [0, 2π]. Con `paso` 0 son curvas cerradas: círculos, o elipses si
+    `proporcion` (semieje menor / semieje mayor) no es 1. Con `paso` mayor
+    que 0 cada curva es una vuelta de una espiral de Arquímedes que empieza
+    donde acaba la anterior, así que la espiral se construye por vueltas
+    como si fueran anillos abiertos. `espaciados` es la distancia a la curva
+    anterior, que fija la huella de las muestras.
+    """
+    escalas: 'np.ndarray'
+    espaciados: 'np.ndarray'
+    proporcion: float = 1.0
+    rotacion: float = 0.0
+    paso: float = 0.0
+
+    def __len__(self):
+        return len(self.escalas)
+
+    def __getitem__(self, indices):
+        return replace(self, escalas=self.escalas[indices], espaciados=self.espaciados[indices])
+
+    @property
+    def cerradas(self):
+        return self.paso == 0
+
+    @property
+    def radios_min(self):
+        return self.escalas * min(self.proporcion, 1.0)
+
+    @property
+    def radios_max(self):
+        return self.escalas * max(self.proporcion, 1.0) + self.paso
+
+    def forma(self, angulos):
+        """Radio de la curva de escala 1 en cada ángulo (1 en los círculos)."""
+        if self.proporcion == 1:
+            return np.ones(np.shape(angulos))
+        relativos = np.asarray(angulos) - self.rotacion
+        return self.proporcion / np.hypot(self.proporcion * np.cos(relativos), np.sin(relativos))
+
+    def radios(self, angulos, k=None):
+        """
+        Radios de la curva k en los ángulos dados o, sin `k`, matriz
+        (curvas × ángulos) de todas las curvas.
+        """
+        escalas = self.escalas[:, np.newaxis] if k is None else self.escalas[k]
+        return escalas * self.forma(angulos) + self.paso * np.asarray(angulos) / (2 * np.pi)
+
+
+def medir_detalle(piramide, ancho, alto, cx, cy, familia):
+    """
+    Detalle de la imagen a lo largo de cada curva de la familia: media de la
+    variación absoluta de intensidad entre muestras vecinas, en el sentido de
+    la curva y hacia la curva siguiente.
+    """
+    angulos = 2 * np.pi * np.arange(MUESTRAS_DETALLE) / MUESTRAS_DETALLE
+    radios = familia.radios(angulos)
+    intensidades = muestrear_piramide(
+        piramide, ancho, alto, cx + radios * np.cos(angulos), cy + radios * np.sin(angulos)
+    )
+    a_lo_largo = np.abs(np.diff(intensidades, axis=1, append=intensidades[:, :1]))
+    hacia_fuera = np.abs(np.diff(intensidades, axis=0, append=intensidades[-1:]))
+    return (a_lo_largo + hacia_fuera).mean(axis=1)
+
+
+def crear_familia(lienzo, num_lineas, curvas='circulos', proporcion_elipse=PROPORCION_ELIPSE, rotacion_elipse=0.0,
+                  espaciado='uniforme', piramide=None):
+    """
+    Familia de curvas del diseño que cubre el canvas hasta `radio_max`.
+
+    Las elipses se escalan para que su semieje menor llegue a `radio_max`, y
+    la espiral da `num_lineas` vueltas. Con espaciado 'detalle' (círculos y
+    elipses) las curvas se acercan donde la imagen tiene más detalle y se
+    separan en las zonas lisas, entre la mitad y el doble del espaciado
+    uniforme; hace falta la pirámide de la imagen.
+    """
+    radio_max = lienzo['radio_max']
+    if curvas == 'espiral':
+        paso = radio_max / num_lineas
+        return FamiliaCurvas(escalas=paso * np.arange(num_lineas), espaciados=np.full(num_lineas, paso), paso=paso)
+
+    proporcion = proporcion_elipse if curvas == 'elipses' else 1.0
+    alcance = radio_max / min(proporcion, 1.0)
+    familia = FamiliaCurvas(
+        escalas=alcance * np.arange(1, num_lineas + 1) / num_lineas,
+        espaciados=np.full(num_lineas, alcance / num_lineas),
+        proporcion=proporcion, rotacion=np.radians(rotacion_elipse)
+    )
+    if espaciado == 'uniforme':
+        return familia
+
+    # Densidad de curvas según el detalle, medido sobre curvas cuatro veces
+    # más juntas y suavizado a lo largo de un espaciado uniforme
+    finas = replace(familia, escalas=alcance * np.arange(1, 4 * num_lineas + 1) / (4 * num_lineas))
+    detalle = medir_detalle(piramide, lienzo['ancho'], lienzo['alto'], lienzo['cx'], lienzo['cy'], finas)
+    detalle = suavizar_valores(detalle, ventana=5, circular=False)
+    densidad = np.clip(detalle / max(detalle.mean(), 1e-9), 1 / DENSIDAD_MAXIMA_DETALLE, DENSIDAD_MAXIMA_DETALLE)
+
+    # Las escalas reparten la densidad acumulada en partes iguales
+    acumulada = np.concatenate(([0.0], np.cumsum(densidad)))
+    escalas = np.interp(np.arange(1, num_lineas + 1) / num_lineas * acumulada[-1],
+                        acumulada, np.concatenate(([0.0], finas.escalas)))
+    return replace(familia, escalas=escalas, espaciados=np.diff(escalas, prepend=0.0))
+
+
+def calcular_anillos(piramide, ancho, alto, cx, cy, familia, num_segmentos,
+                     modo_muestreo='cercano', ventana_suavizado=1):
+    """
+    Muestrea las intensidades de todas las curvas en una sola pasada.
+
+    Devuelve una matriz de forma (curvas × segmentos) con la intensidad en
+    el punto medio de cada segmento; en curvas abiertas (espiral), con una
+    columna más, en cada uno de los vértices. La huella de cada muestra
+    tiene el área del tramo de arco (longitud del segmento × espaciado entre
+    curvas): en modo 'area' se promedia esa caja y en 'bilineal' elige el
+    nivel de la pirámide.
+    """
+    # Tabla trigonométrica compartida por todas las curvas
+    if familia.cerradas:
+        angulos_medios = 2 * np.pi * (np.arange(num_segmentos) + 0.5) / num_segmentos
+    else:
+        angulos_medios = 2 * np.pi * np.arange(num_segmentos + 1) / num_segmentos
+    cos_medios, sin_medios = np.cos(angulos_medios), np.sin(angulos_medios)
+    radios = familia.radios(angulos_medios)
+
+    # Recopilar intensidades en el punto medio de cada segmento
+    longitud_arco = 2 * np.pi * radios / num_segmentos
+    lado = np.sqrt(longitud_arco * familia.espaciados[:, np.newaxis])
+
+    intensidades = muestrear_piramide(
+        piramide, ancho, alto, cx + radios * cos_medios, cy + radios * sin_medios,
+        modo=modo_muestreo, lado=lado
+    )
+    return suavizar_valores(intensidades, ventana=ventana_suavizado, circular=familia.cerradas)
+
+
+def segmentos_por_tolerancia(radios, tolerancia):
+    """Número de segmentos para que la flecha de cada cuerda no supere `tolerancia`."""
+    radios = np.asarray(radios, dtype=float)
+    cociente = np.clip(1 - tolerancia / np.maximum(radios, 1e-9), -1.0, 1.0)
+    with np.errstate(divide='ignore'):
+        segmentos = np.ceil(np.pi / np.arccos(cociente))
+    return np.maximum(np.nan_to_num(segmentos, posinf=SEGMENTOS_MINIMOS), SEGMENTOS_MINIMOS).astype(int)
+
+
+def recorte_radial(cx, cy, cos_angulos, sin_angulos, ancho, alto):
+    """
+    Calcula el tramo [t_entrada, t_salida] de cada rayo desde el centro que cae dentro del canvas.
+
+    t_entrada es 0 si el centro está dentro; t_salida < t_entrada cuando el
+    rayo no atraviesa el canvas.
+    """
+    t_entrada = np.zeros(np.shape(cos_angulos))
+    t_salida = np.full(np.shape(cos_angulos), np.inf)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for d, c, limite in ((cos_angulos, cx, ancho), (sin_angulos, cy, alto)):
+            t0 = (0 - c) / d
+            t1 = (limite - c) / d
+            paralelo = np.abs(d) < 1e-12
+            fuera = paralelo & ((c < 0) | (c > limite))
+            t_entrada = np.where(paralelo, t_entrada, np.maximum(t_entrada, np.minimum(t0, t1)))
+            t_salida = np.where(paralelo, t_salida, np.minimum(t_salida, np.maximum(t0, t1)))
+            t_salida = np.where(fuera, -np.inf, t_salida)
+
+    return t_entrada, t_salida
+
+
+def contiene_esquina(cx, cy, radio_interior, radio_exterior, ancho, alto):
+    """Indica si alguna esquina del canvas cae dentro de la corona."""
+    for esquina_x in (0, ancho):
+        for esquina_y in (0, alto):
+            if radio_interior <= np.hypot(esquina_x - cx, esquina_y - cy) <= radio_exterior:
+                return True
+    return False
+
+
+def puntos_polares(cx, cy, angulos, radios):
+    """Convierte ángulos y radios alrededor de (cx, cy) en un array de puntos (n, 2)."""
+    return np.stack((cx + radios * np.cos(angulos), cy + radios * np.sin(angulos)), axis=-1)
+
+
+def recortar_tramo(cx, cy, angulos, radios_interior, radios_exterior, cerrado, ancho, alto):
+    """
+    Recorta analíticamente un tramo de anillo con el canvas, sin operaciones booleanas.
+
+    En cada ángulo el segmento radial [radio_interior, radio_exterior] se limita
+    al tramo del rayo que cae dentro del canvas. Donde un borde del anillo cruza
+    un lado del canvas, o el tramo se vacía, se inserta el punto de cruce
+    interpolado. Entre dos vértices recortados contra el mismo lado el contorno
+    es ese mismo lado, así que el recorte es exacto salvo en las esquinas: no
+    debe usarse si la corona contiene alguna (ver contiene_esquina).
+
+    Devuelve (piezas, recortado), con piezas como lista de (puntos_exterior,
+    puntos_interior, cerrado); puntos_interior es None en un disco sin agujero.
+    """
+    angulos = np.asarray(angulos, dtype=float)
+    radios_interior = np.maximum(radios_interior, 0.0)
+    radios_exterior = np.asarray(radios_exterior, dtype=float)
+
+    holgura = 1e-9 * max(ancho, alto)
+
+    if cerrado:
+        # Repetir el primer vértice al final para tratar la vuelta completa
+        angulos = np.append(angulos, angulos[0] + 2 * np.pi)
+        radios_interior = np.append(radios_interior, radios_interior[0])
+        radios_exterior = np.append(radios_exterior, radios_exterior[0])
+
+    def limitar(angulos, radios_interior, radios_exterior):
+        t_entrada, t_salida = recorte_radial(cx, cy, np.cos(angulos), np.sin(angulos), ancho, alto)
+        return np.maximum(radios_interior, t_entrada), np.minimum(radios_exterior, t_salida), t_entrada, t_salida
+
+    interior, exterior, t_entrada, t_salida = limitar(angulos, radios_interior, radios_exterior)
+
+    # Un rayo paralelo a un lado del canvas puede separar la parte visible de
+    # la oculta con un salto que no admite interpolación (p. ej. con el
+    # centro en la prolongación de un lado): ahí el límite se busca por bisección
+    visibles = exterior >= interior - holgura
+    saltos = np.flatnonzero(visibles[:-1] != visibles[1:])
+    saltos = saltos[np.floor(angulos[saltos + 1] / (np.pi / 2)) * (np.pi / 2) >= angulos[saltos]]
+    if len(saltos):
+        indices = np.arange(len(angulos), dtype=float)
+        visible = np.where(visibles[saltos], saltos, saltos + 1).astype(float)
+        oculto = np.where(visibles[saltos], saltos + 1, saltos).astype(float)
+        for _ in range(ITERACIONES_BISECCION):
+            medio = (visible + oculto) / 2
+            interior_medio, exterior_medio, _, _ = limitar(
+                np.interp(medio, indices, angulos), np.interp(medio, indices, radios_interior),
+                np.interp(medio, indices, radios_exterior)
+            )
+            es_visible = exterior_medio >= interior_medio - holgura
+            visible = np.where(es_visible, medio, visible)
+            oculto = np.where(es_visible, oculto, medio)
+
+        posiciones = np.unique(np.concatenate((indices, visible)))
+        angulos = np.interp(posiciones, indices, angulos)
+        radios_interior = np.interp(posiciones, indices, radios_interior)
+        radios_exterior = np.interp(posiciones, indices, radios_exterior)
+        interior, exterior, t_entrada, t_salida = limitar(angulos, radios_interior, radios_exterior)
+
+    # Insertar los cruces: borde exterior con la salida del rayo, borde
+    # interior con la entrada, y puntos donde el tramo se vacía
+    posiciones = [np.arange(len(angulos), dtype=float)]
+    for funcion in (radios_exterior - t_salida, t_entrada - radios_interior, exterior - interior):
+        funcion = np.nan_to_num(funcion, posinf=1e12, neginf=-1e12)
+        cambios = np.flatnonzero((funcion[:-1] > 0) != (funcion[1:] > 0))
+        fraccion = funcion[cambios] / (funcion[cambios] - funcion[cambios + 1])
+        posiciones.append(cambios + np.clip(fraccion, 0.0, 1.0))
+    posiciones = np.unique(np.concatenate(posiciones))
+
+    if len(posiciones) > len(angulos):
+        indices = np.arange(len(angulos))
+        angulos = np.interp(posiciones, indices, angulos)
+        radios_interior = np.interp(posiciones, indices, radios_interior)
+        radios_exterior = np.interp(posiciones, indices, radios_exterior)
+        interior, exterior, _, _ = limitar(angulos, radios_interior, radios_exterior)
+
+    visibles = exterior >= interior - holgura
+    exterior = np.maximum(exterior, interior)
+    recortado = not visibles.all() or bool(np.any(
+        (exterior < radios_exterior - holgura) | (interior > radios_interior + holgura)
+    ))
+
+    if cerrado and visibles.all():
+        exterior, interior, angulos = exterior[:-1], interior[:-1], angulos[:-1]
+        puntos_interior = None
+        if interior.max() > holgura:
+            puntos_interior = puntos_polares(cx, cy, angulos, interior)
+        return [(puntos_polares(cx, cy, angulos, exterior), puntos_interior, True)], recortado
+
+    # Rachas de vértices visibles; en un tramo cerrado, la primera y la última
+    # son la misma si cruzan el ángulo inicial
+    cortes = np.flatnonzero(np.diff(visibles.astype(int))) + 1
+    rachas = [racha for racha in np.split(np.arange(len(angulos)), cortes) if visibles[racha[0]]]
+    if cerrado and len(rachas) > 1 and visibles[0] and visibles[-1]:
+        rachas[0] = np.concatenate((rachas.pop()[:-1], rachas[0]))
+
+    piezas = []
+    for racha in rachas:
+        if len(racha) < 2:
+            continue
+        piezas.append((
+            puntos_polares(cx, cy, angulos[racha], exterior[racha]),
+            puntos_polares(cx, cy, angulos[racha], interior[racha]),
+            False
+        ))
+
+    return piezas, recortado
+
+
+def intervalos_visibles(cx, cy, radio_interior, radio_exterior, ancho, alto):
+    """
+    Calcula los intervalos angulares en los que la corona toca el canvas.
+
+    Devuelve una lista de (a0, a1) en radianes con a0 < a1 (a0 puede ser
+    negativo si el intervalo cruza el ángulo 0). [(0, 2π)] si la corona es
+    visible en todas direcciones.
+    """
+    radio_interior = max(radio_interior, 0.0)
+
+    # Ángulos críticos: cortes de ambas circunferencias con los lados y esquinas
+    criticos = [0.0]
+    for radio in (radio_interior, radio_exterior):
+        if radio <= 0:
+            continue
+        for borde_x in (0, ancho):
+            c = (borde_x - cx) / radio
+            if abs(c) <= 1:
+                criticos += [np.arccos(c), -np.arccos(c)]
+        for borde_y in (0, alto):
+            c = (borde_y - cy) / radio
+            if abs(c) <= 1:
+                criticos += [np.arcsin(c), np.pi - np.arcsin(c)]
+    for esquina_x in (0, ancho):
+        for esquina_y in (0, alto):
+            criticos.append(np.arctan2(esquina_y - cy, esquina_x - cx))
+
+    criticos = np.unique(np.mod(criticos, 2 * np.pi))
+    criticos = np.append(criticos, 2 * np.pi)
+
+    # Entre dos ángulos críticos la visibilidad no cambia: probar el punto medio
+    medios = (criticos[:-1] + criticos[1:]) / 2
+
+    # Recorte del segmento radial [radio_interior, radio_exterior] con el canvas
+    t_entrada, t_salida = recorte_radial(cx, cy, np.cos(medios), np.sin(medios), ancho, alto)
+    visibles = np.maximum(t_entrada, radio_interior) <= np.minimum(t_salida, radio_exterior)
+
+    if visibles.all():
+        return [(0.0, 2 * np.pi)]
+
+    intervalos = []
+    for k in np.flatnonzero(visibles):
+        if intervalos and np.isclose(intervalos[-1][1], criticos[k]):
+            intervalos[-1][1] = criticos[k + 1]
+        else:
+            intervalos.append([criticos[k], criticos[k + 1]])
+
+    # Unir el último intervalo con el primero si cruzan el ángulo 0
+    if len(intervalos) > 1 and intervalos[0][0] == 0 and np.isclose(intervalos[-1][1], 2 * np.pi):
+        ultimo = intervalos.pop()
+        intervalos[0][0] = ultimo[0] - 2 * np.pi
+
+    return [tuple(intervalo) for intervalo in intervalos]
+
+
+def intervalos_de_curva(intervalos, cerradas):
+    """
+    Ajusta los intervalos visibles a las curvas: las abiertas (vueltas de la
+    espiral) van de 0 a 2π, así que un intervalo que cruza el ángulo 0 se
+    parte en dos.
+    """
+    if cerradas:
+        return intervalos
+    partes = []
+    for a0, a1 in intervalos:
+        for desplazamiento in (2 * np.pi, 0.0):
+            b0, b1 = max(a0 + desplazamiento, 0.0), min(a1 + desplazamiento, 2 * np.pi)
+            if b1 > b0:
+                partes.append((b0, b1))
+    return sorted(partes)
+
+
+def calcular_tramos_adaptativos(piramide, ancho, alto, cx, cy, familia, grosor_max, tolerancia,
+                                modo_muestreo='cercano', ventana_suavizado=1):
+    """
+    Muestrea las curvas con un número de segmentos adaptado al radio de cada una.
+
+    Solo se generan los tramos de arco que tocan el canvas (con el grosor
+    máximo). Devuelve, por cada curva, una lista de tramos (angulos,
+    intensidades, cerrado); una curva cerrada completamente visible es un
+    único tramo cerrado.
+    """
+    radios_min, radios_max = familia.radios_min, familia.radios_max
+    segmentos_anillo = segmentos_por_tolerancia(radios_max + grosor_max / 2, tolerancia)
+
+    # Ángulos de vértices y muestras de todos los tramos, concatenados
+    tramos = []
+    radios_tramos, angulos_tramos, medios_tramos, arcos_tramos, espaciados_tramos = [], [], [], [], []
+    for k in range(len(familia)):
+        intervalos = intervalos_visibles(cx, cy, radios_min[k] - grosor_max / 2, radios_max[k] + grosor_max / 2,
+                                         ancho, alto)
+        for a0, a1 in intervalos_de_curva(intervalos, familia.cerradas):
+            amplitud = a1 - a0
+            cerrado = familia.cerradas and amplitud >= 2 * np.pi
+            if cerrado:
+                # Igual que el teselado fijo: vértices en j y muestras en j + 0.5
+                n = segmentos_anillo[k]
+                angulos = 2 * np.pi * np.arange(n) / n
+                medios = 2 * np.pi * (np.arange(n) + 0.5) / n
+            else:
+                n = max(2, int(np.ceil(segmentos_anillo[k] * amplitud / (2 * np.pi))))
+                angulos = a0 + amplitud * np.arange(n + 1) / n
+                medios = angulos
+
+            radios = familia.radios(medios, k)
+            tramos.append((k, cerrado))
+            radios_tramos.append(radios)
+            angulos_tramos.append(angulos)
+            medios_tramos.append(medios)
+            arcos_tramos.append(radios * amplitud / n)
+            espaciados_tramos.append(np.full(len(angulos), familia.espaciados[k]))
+
+    resultado = [[] for _ in range(len(familia))]
+    if not tramos:
+        return resultado
+
+    cortes = np.cumsum([len(angulos) for angulos in angulos_tramos])[:-1]
+    radios_flat = np.concatenate(radios_tramos)
+    angulos_flat = np.concatenate(angulos_tramos)
+    medios_flat = np.concatenate(medios_tramos)
+    arcos_flat = np.concatenate(arcos_tramos)
+    espaciados_flat = np.concatenate(espaciados_tramos)
+
+    # Recopilar intensidades de todos los tramos a la vez
+    lado = np.sqrt(arcos_flat * espaciados_flat)
+    intensidades = muestrear_piramide(
+        piramide, ancho, alto, cx + radios_flat * np.cos(medios_flat), cy + radios_flat * np.sin(medios_flat),
+        modo=modo_muestreo, lado=lado
+    )
+
+    if ventana_suavizado > 1:
+        intensidades = np.concatenate([
+            suavizar_valores(valores, ventana=ventana_suavizado, circular=cerrado)
+            for valores, (_, cerrado) in zip(np.split(intensidades, cortes), tramos)
+        ])
+
+    for (k, cerrado), angulos, valores in zip(tramos, np.split(angulos_flat, cortes), np.split(intensidades, cortes)):
+        resultado[k].append((angulos, valores, cerrado))
+
+    return resultado
+
+
+def muestrear_anillos(piramide, ancho, alto, cx, cy, familia, num_segmentos, grosor_max,
+                      modo_muestreo='cercano', ventana_suavizado=1, tolerancia_cuerda=None):
+    """
+    Muestrea la intensidad de la imagen a lo largo de cada curva de la familia.
+
+    Devuelve, por cada curva, una lista de tramos (angulos, intensidades,
+    cerrado). Con teselado fijo las posiciones no dependen de los grosores;
+    con teselado adaptativo (tolerancia en píxeles) dependen de `grosor_max`,
+    que decide qué arcos son visibles.
+    """
+    if tolerancia_cuerda is None:
+        # Muestreo vectorizado de todas las curvas a la vez
+        intensidades = calcular_anillos(
+            piramide, ancho, alto, cx, cy, familia, num_segmentos,
+            modo_muestreo=modo_muestreo, ventana_suavizado=ventana_suavizado
+        )
+        angulos = 2 * np.pi * np.arange(intensidades.shape[1]) / num_segmentos
+        return [[(angulos, valores, familia.cerradas)] for valores in intensidades]
+
+    # Teselado adaptativo: segmentos según el radio y solo los arcos visibles
+    return calcular_tramos_adaptativos(
+        piramide, ancho, alto, cx, cy, familia, grosor_max, tolerancia_cuerda,
+        modo_muestreo=modo_muestreo, ventana_suavizado=ventana_suavizado
+    )
+
+
+def aplicar_grosores(muestras, familia, grosor_min, grosor_max):
+    """
+    Convierte las muestras de cada curva en tramos polares (angulos,
+    radios_interior, radios_exterior, cerrado): cuanto más oscuro, más grueso.
+
+    Un tramo abierto de una vuelta completa (espiral) se solaparía consigo
+    mismo donde el grosor supera el paso, así que se parte en dos mitades
+    que comparten el vértice central.
+    """
+    tramos_anillos = []
+    for k, tramos in enumerate(muestras):
+        tramos_anillo = []
+        for angulos, intensidades, cerrado in tramos:
+            factor = 1.0 - (intensidades / 255.0)
+            grosores = grosor_min + (grosor_max - grosor_min) * factor
+            radios = familia.radios(angulos, k)
+            tramo = (angulos, np.maximum(radios - grosores / 2, 0.0), radios + grosores / 2, cerrado)
+            if not cerrado and len(angulos) > 2 and angulos[-1] - angulos[0] >= 2 * np.pi - 1e-9:
+                medio = len(angulos) // 2
+                tramos_anillo += [tuple(valores[:medio + 1] for valores in tramo[:3]) + (False,),
+                                  tuple(valores[medio:] for valores in tramo[:3]) + (False,)]
+            else:
+                tramos_anillo.append(tramo)
+        tramos_anillos.append(tramos_anillo)
+    return tramos_anillos
+
+
+def partir_por_grosor(puntos_exterior, puntos_interior, cerrado, holgura):
+    """
+    Parte una pieza de anillo donde su grosor se anula.
+
+    Donde el borde interior coincide con el exterior (grosor 0, que admite
+    -min 0) el agujero tocaría el contorno a lo largo de un tramo. En su
+    lugar, cada racha de vértices con grosor es una pieza abierta que se
+    estrecha hasta el vértice sin grosor de cada extremo. Devuelve la lista
+    de piezas (puntos_exterior, puntos_interior, cerrado).
+    """
+    if puntos_interior is None:
+        return [(puntos_exterior, puntos_interior, cerrado)]
+
+    puntos_exterior = np.asarray(puntos_exterior, dtype=float)
+    puntos_interior = np.asarray(puntos_interior, dtype=float)
+    sin_grosor = np.hypot(*(puntos_exterior - puntos_interior).T) <= holgura
+    if not sin_grosor.any():
+        return [(puntos_exterior, puntos_interior, cerrado)]
+
+    if cerrado:
+        # Empezar en un vértice sin grosor y volver a él al final
+        orden = np.roll(np.arange(len(sin_grosor)), -np.argmax(sin_grosor))
+        orden = np.append(orden, orden[0])
+        puntos_exterior, puntos_interior, sin_grosor = puntos_exterior[orden], puntos_interior[orden], sin_grosor[orden]
+
+    cortes = np.flatnonzero(np.diff(sin_grosor.astype(int))) + 1
+    piezas = []
+    for racha in np.split(np.arange(len(sin_grosor)), cortes):
+        if sin_grosor[racha[0]]:
+            continue
+        desde, hasta = max(racha[0] - 1, 0), min(racha[-1] + 2, len(sin_grosor))
+        piezas.append((puntos_exterior[desde:hasta], puntos_interior[racha], False))
+    return piezas
+
+
+def contorno_de_pieza(puntos_exterior, puntos_interior, cerrado, cx, cy, holgura):
+    """
+    Contorno y agujeros de una pieza de anillo, válidos por construcción.
+
+    Donde el grosor supera el radio el borde interior se colapsa en el centro
+    (cx, cy), y un anillo que pasara varias veces por él se tocaría a sí
+    mismo. En su lugar, cada racha de vértices interiores fuera del centro
+    que no llega a los extremos del tramo es un agujero que solo toca el
+    contorno en el centro; un borde interior colapsado del todo deja un disco.
+    Devuelve (contorno, agujeros) como arrays de puntos.
+    """
+    puntos_exterior = np.asarray(puntos_exterior, dtype=float)
+    if puntos_interior is None:
+        return puntos_exterior, []
+
+    puntos_interior = np.asarray(puntos_interior, dtype=float)
+    en_centro = np.hypot(puntos_interior[:, 0] - cx, puntos_interior[:, 1] - cy) <= holgura
+    if not en_centro.any():
+        if cerrado:
+            return puntos_exterior, [puntos_interior]
+        # Tramo de arco: borde exterior de ida e interior de vuelta
+        return np.vstack((puntos_exterior, puntos_interior[::-1])), []
+
+    cortes = np.flatnonzero(np.diff(en_centro.astype(int))) + 1
+    rachas = [racha for racha in np.split(np.arange(len(puntos_interior)), cortes) if not en_centro[racha[0]]]
+    centro = np.array([[cx, cy]])
+
+    if cerrado:
+        # La primera y la última racha son la misma si cruzan el vértice inicial
+        if len(rachas) > 1 and not en_centro[0] and not en_centro[-1]:
+            rachas[0] = np.concatenate((rachas.pop(), rachas[0]))
+        contorno = puntos_exterior
+    else:
+        # Las rachas que llegan a los extremos del tramo forman parte del contorno
+        inicial = rachas.pop(0) if not en_centro[0] else []
+        final = rachas.pop() if not en_centro[-1] else []
+        contorno = np.vstack((puntos_exterior, puntos_interior[final[::-1]], centro,
+                              puntos_interior[inicial[::-1]]))
+
+    agujeros = [np.vstack((centro, puntos_interior[racha])) for racha in rachas if len(racha) >= 2]
+    return contorno, agujeros
+
+
+def crear_poligonos_anillo(piezas, cx, cy, holgura, contadores=None):
+    """
+    Polígonos de una lista de piezas de anillo (puntos_exterior,
+    puntos_interior, cerrado), construidos todos a la vez con
+    shapely.polygons a partir de los arrays de coordenadas.
+
+    Los contornos son válidos por construcción (ver partir_por_grosor y
+    contorno_de_pieza); la comprobación de validez, vectorizada, solo queda
+    como red de seguridad y repara con make_valid. Devuelve un polígono por
+    pieza, o None si la pieza no tiene área. Si se pasa `contadores`, se
+    suman en él las reparaciones ('reparaciones') y las piezas sin área
+    descartadas ('piezas_descartadas').
+    """
+    poligonos = [None] * len(piezas)
+    anillos, piezas_anillos, construidas = [], [], []
+    for i, pieza in enumerate(piezas):
+        for puntos_exterior, puntos_interior, cerrado in partir_por_grosor(*pieza, holgura):
+            contorno, agujeros = contorno_de_pieza(puntos_exterior, puntos_interior, cerrado, cx, cy, holgura)
+            if len(contorno) < 3:
+                continue
+            anillos += [contorno] + agujeros
+            piezas_anillos += [len(construidas)] * (1 + len(agujeros))
+            construidas.append(i)
+
+    if construidas:
+        longitudes = [len(anillo) for anillo in anillos]
+        lineas = shapely.linearrings(np.concatenate(anillos), indices=np.repeat(np.arange(len(anillos)), longitudes))
+        construidos = shapely.polygons(lineas, indices=piezas_anillos)
+
+        # Una pieza sin área (p. ej. un tramo estrangulado en un borde) se
+        # descarta; solo cuenta como reparada si la reparación conserva área.
+        # make_valid no puede añadir área a la que encierran los anillos (un
+        # agujero que toca el contorno a lo largo de un tramo lo rellenaría):
+        # en ese caso se repara como buffer(0)
+        for j in np.flatnonzero(~shapely.is_valid(construidos)):
+            area_anillos = construidos[j].area
+            partes = poligonos_de(shapely.make_valid(construidos[j]))
+            if sum(parte.area for parte in partes) > area_anillos * (1 + 1e-9) + holgura ** 2:
+                partes = poligonos_de(construidos[j].buffer(0))
+            construidos[j] = None if not partes else partes[0] if len(partes) == 1 else shapely.MultiPolygon(partes)
+            if partes and contadores is not None:
+                contadores['reparaciones'] += 1
+
+        # Las piezas partidas por grosor nulo se vuelven a juntar
+        partes_piezas = {}
+        for i, poligono in zip(construidas, construidos):
+            if poligono is not None:
+                partes_piezas.setdefault(i, []).extend(poligonos_de(poligono))
+        for i, partes in partes_piezas.items():
+            poligonos[i] = partes[0] if len(partes) == 1 else shapely.MultiPolygon(partes)
+
+    if contadores is not None:
+        contadores['piezas_descartadas'] += sum(
+            poligono is None or poligono.is_empty for poligono in poligonos
+        )
+    return poligonos
+
+
+def calcular_coronas(cx, cy, anillos):
+    """
+    Calcula la corona [radio_min, radio_max] que ocupa cada anillo alrededor de (cx, cy).
+
+    radio_min es la distancia del centro al polígono y radio_max la de su
+    vértice más lejano, así que dos anillos cuyas coronas no se tocan son
+    disjuntos.
+    """
+    geometrias = np.array(anillos, dtype=object)
+    radios_min = shapely.distance(shapely.Point(cx, cy), geometrias)
+
+    coordenadas, indices = shapely.get_coordinates(geometrias, return_index=True)
+    radios_max = np.zeros(len(geometrias))
+    np.maximum.at(radios_max, indices, np.hypot(coordenadas[:, 0] - cx, coordenadas[:, 1] - cy))
+
+    return radios_min, radios_max
+
+
+def repartir_en_capas(radios_min, radios_max):
+    """
+    Reparte los anillos en capas de anillos disjuntos entre sí (coloreado de intervalos).
+
+    Como un anillo solo se solapa con sus vecinos inmediatos, bastan dos o
+    tres capas. Devuelve la lista de capas, cada una con sus índices.
+    """
+    capas = []
+    alcances = []
+    for k in np.argsort(radios_min, kind='stable'):
+        for c, alcance in enumerate(alcances):
+            if radios_min[k] > alcance:
+                capas[c].append(k)
+                alcances[c] = radios_max[k]
+                break
+        else:
+            capas.append([k])
+            alcances.append(radios_max[k])
+    return capas
+
+
+def poligonos_de(geometria):
+    """Lista de polígonos no vacíos de una geometría (Polygon, MultiPolygon o colección)."""
+    return [p for p in getattr(geometria, 'geoms', [geometria]) if isinstance(p, shapely.Polygon) and not p.is_empty]
+
+
+def unir_anillos(cx, cy, anillos, tiras):
+    """
+    Une los anillos con las tiras del marco y los separadores.
+
+    Solo se hacen operaciones booleanas donde hace falta. Los anillos que no
+    se solapan con ningún vecino ni tocan las tiras pasan tal cual al
+    MultiPolygon final. El resto se reparte en unas pocas capas de anillos
+    disjuntos, cada capa es un MultiPolygon válido sin ninguna unión, y
+    solo se unen las capas con las tiras.
+    """
+    tiras = shapely.unary_union(tiras)
+    if not anillos:
+        return tiras
+
+    radios_min, radios_max = calcular_coronas(cx, cy, anillos)
+
+    # Anillos cuya corona no toca la de sus vecinos
+    orden = np.argsort(radios_min, kind='stable')
+    alcance_previo = np.concatenate(([-np.inf], np.maximum.accumulate(radios_max[orden])[:-1]))
+    inicio_siguiente = np.concatenate((radios_min[orden][1:], [np.inf]))
+    aislado = np.empty(len(anillos), dtype=bool)
+    aislado[orden] = (radios_min[orden] > alcance_previo) & (radios_max[orden] < inicio_siguiente)
+
+    shapely.prepare(tiras)
+    aislado &= ~shapely.intersects(tiras, np.array(anillos, dtype=object))
+
+    sueltos = [k for k in range(len(anillos)) if aislado[k]]
+    a_unir = [k for k in range(len(anillos)) if not aislado[k]]
+
+    capas = [
+        shapely.MultiPolygon([p for k in capa for p in poligonos_de(anillos[a_unir[k]])])
+        for capa in repartir_en_capas(radios_min[a_unir], radios_max[a_unir])
+    ]
+
+    # Uniones binarias por parejas, equilibradas (unary_union descompondría
+    # cada capa en sus polígonos y perdería la ventaja)
+    pendientes = [tiras] + capas
+    while len(pendientes) > 1:
+        pendientes = [
+            pendientes[k].union(pendientes[k + 1]) if k + 1 < len(pendientes) else pendientes[k]
+            for k in range(0, len(pendientes), 2)
+        ]
+    fusion = pendientes[0]
+
+    poligonos = poligonos_de(fusion)
+    for k in sueltos:
+        poligonos.extend(poligonos_de(anillos[k]))
+
+    return poligonos[0] if len(poligonos) == 1 else shapely.MultiPolygon(poligonos)
+
+
+# Comandos de path por tipo de punto: inicio de anillo, cierre, y tramo
+# (en modo relativo: l, h o v según la dirección)
+COMANDOS_ABSOLUTOS = ["M {f},{f} ", "L {f},{f} Z ", "L {f},{f} "]
+COMANDOS_RELATIVOS = ["M{f},{f}", "Z", "l{f},{f}", "h{f}", "v{f}"]
+# Qué componentes (x, y) de cada punto se escriben según su comando
+VALORES_ABSOLUTOS = ((True, True), (True, True), (True, True))
+VALORES_RELATIVOS = ((True, True), (False, False), (True, True), (True, False), (False, True))
+
+
+def anillos_a_svg_path(coords, num_coords, precision=2, relativo=False):
+    """
+    Datos de path SVG de varios anillos cerrados.
+
+    `coords` son los puntos de todos los anillos seguidos (como los devuelve
+    shapely.get_coordinates) y `num_coords` cuántos tiene cada uno, con el
+    último repetido. Todo se formatea de una vez con una única plantilla. En
+    modo relativo se trabaja con coordenadas enteras redondeadas a la
+    precisión, así que las diferencias no acumulan error, y se omiten los
+    tramos nulos.
+    """
+    # Descartar anillos degenerados (menos de 3 puntos)
+    validos = num_coords >= 3
+    if not validos.all():
+        coords = coords[np.repeat(validos, num_coords)]
+        num_coords = num_coords[validos]
+    if len(num_coords) == 0:
+        return ""
+
+    finales = np.cumsum(num_coords) - 1
+    inicio = np.zeros(len(coords), dtype=bool)
+    inicio[finales[:-1] + 1] = True
+    inicio[0] = True
+    cierre = np.zeros(len(coords), dtype=bool)
+    cierre[finales] = True
+
+    formato = f"%.{precision}f"
+
+    if not relativo:
+        tipos = np.where(inicio, 0, np.where(cierre, 1, 2))
+        comandos = [c.replace("{f}", formato) for c in COMANDOS_ABSOLUTOS]
+        valores = coords[np.array(VALORES_ABSOLUTOS)[tipos]]
+    else:
+        escala = 10 ** precision
+        enteros = np.round(coords * escala).astype(np.int64)
+        deltas = np.diff(enteros, axis=0, prepend=enteros[:1])
+        deltas[inicio] = enteros[inicio]
+
+        horizontal = deltas[:, 1] == 0
+        vertical = deltas[:, 0] == 0
+        tipos = 2 + horizontal + 2 * vertical
+        tipos[inicio] = 0
+        tipos[cierre] = 1
+
+        # Los tramos nulos no aportan nada
+        tipos = tipos[inicio | cierre | ~(horizontal & vertical)]
+        deltas = deltas[inicio | cierre | ~(horizontal & vertical)]
+        comandos = [c.replace("{f}", formato) for c in COMANDOS_RELATIVOS]
+        valores = deltas[np.array(VALORES_RELATIVOS)[tipos]] / escala
+
+    plantilla = "".join(map(comandos.__getitem__, tipos.tolist()))
+    return plantilla % tuple(valores.tolist())
+
+
+def escribir_paths(f, geometria, precision=2, relativo=False, path_por_poligono=False):
+    """
+    Escribe la geometría como paths SVG directamente en el fichero.
+
+    Cada polígono se escribe en cuanto se formatea, sin construir el path
+    completo en memoria. Con `path_por_poligono` cada polígono (contorno y
+    sus agujeros) va en su propio <path>; si no, todo va en uno solo.
+    """
+    abierto = False
+    for poligono in poligonos_de(geometria):
+        anillos = shapely.get_rings(poligono)
+        num_coords = shapely.get_num_coordinates(anillos)
+        if num_coords[0] < 3:
+            continue
+
+        if not abierto:
+            f.write('<path d="')
+            abierto = True
+        elif path_por_poligono:
+            f.write('" fill="black"/>\n<path d="')
+        else:
+            f.write(' ')
+
+        f.write(anillos_a_svg_path(shapely.get_coordinates(anillos), num_coords, precision, relativo))
+
+    if abierto:
+        f.write('" fill="black"/>\n')
+
+
+def circulo_intersecta_canvas(cx, cy, radio, grosor_max, ancho, alto):
+
+    radio_ext = radio + grosor_max / 2
+
+    if cx + radio_ext < 0 or cx - radio_ext > ancho:
+        return False
+    if cy + radio_ext < 0 or cy - radio_ext > alto:
+        return False
+
+    return True
+
+
+def anillos_en_rectangulo(cx, cy, familia, grosor_max, x_min, y_min, x_max, y_max):
+    """
+    Máscara de las curvas de la familia (con grosor hasta `grosor_max`) que
+    pueden tocar el rectángulo: la corona que ocupa cada curva tiene que
+    alcanzar el punto del rectángulo más cercano al centro sin pasar del más
+    lejano.
+    """
+    dx_cerca = max(x_min - cx, 0.0, cx - x_max)
+    dy_cerca = max(y_min - cy, 0.0, cy - y_max)
+    distancia_min = np.hypot(dx_cerca, dy_cerca)
+    distancia_max = np.hypot(max(abs(x_min - cx), abs(x_max - cx)), max(abs(y_min - cy), abs(y_max - cy)))
+    return (familia.radios_max + grosor_max / 2 >= distancia_min) & \
+        (familia.radios_min - grosor_max / 2 <= distancia_max)
+
+
+def escribir_documento_svg(f, ancho, alto, ancho_mm, alto_mm, geometria, precision=2, relativo=False,
+                           path_por_poligono=False):
+
+    f.write('<?xml version="1.0" ?>\n')
+    f.write(f'<svg xmlns="http://www.w3.org/2000/svg" '
+            f'baseProfile="full" '
+            f'height="{alto_mm}mm" '
+            f'width="{ancho_mm}mm" '
+            f'viewBox="0 0 {ancho} {alto}" '
+            f'version="1.1">\n')
+
+    escribir_paths(f, geometria, precision, relativo, path_por_poligono)
+
+    f.write('</svg>\n')
+
+
+def escribir_svg(file_path, ancho, alto, ancho_mm, alto_mm, geometria, precision=2, relativo=False,
+                 path_por_poligono=False):
+
+    with open(file_path, 'w') as f:
+        escribir_documento_svg(f, ancho, alto, ancho_mm, alto_mm, geometria, precision, relativo,
+                               path_por_poligono)
+
+
+def escribir_svgz(file_path, ancho, alto, ancho_mm, alto_mm, geometria, precision=2, relativo=False,
+                  path_por_poligono=False):
+    """SVG comprimido con gzip mientras se escribe."""
+    with gzip.open(file_path, 'wt') as f:
+        escribir_documento_svg(f, ancho, alto, ancho_mm, alto_mm, geometria, precision, relativo,
+                               path_por_poligono)
+
+
+def escribir_npz(file_path, ancho, alto, ancho_mm, alto_mm, geometria):
+    """
+    Volcado binario de los anillos (coordenadas y desplazamientos de Shapely
+    en formato ragged) junto con las dimensiones. Se recarga con cargar_npz.
+    """
+    _, coords, (desplazamientos_anillos, desplazamientos_poligonos, _) = shapely.to_ragged_array(
+        [shapely.MultiPolygon(poligonos_de(geometria))]
+    )
+    # np.savez añadiría la extensión .npz a cualquier otro nombre
+    with open(file_path, 'wb') as f:
+        np.savez(f, coords=coords, anillos=desplazamientos_anillos, poligonos=desplazamientos_poligonos,
+                 dimensiones=np.array([ancho, alto, ancho_mm, alto_mm], dtype=float))
+
+
+def cargar_npz(file_path):
+    """Recarga un volcado de escribir_npz: (geometria, ancho, alto, ancho_mm, alto_mm)."""
+    with np.load(file_path) as datos:
+        num_poligonos = len(datos['poligonos']) - 1
+        geometria = shapely.from_ragged_array(
+            shapely.GeometryType.MULTIPOLYGON, datos['coords'],
+            (datos['anillos'], datos['poligonos'], np.array([0, num_poligonos]))
+        )[0]
+        ancho, alto, ancho_mm, alto_mm = datos['dimensiones']
+    return geometria, ancho, alto, ancho_mm, alto_mm
+
+
+def escribir_wkb(file_path, ancho, alto, ancho_mm, alto_mm, geometria):
+    """La geometría tal cual en WKB (coordenadas en píxeles de la imagen)."""
+    with open(file_path, 'wb') as f:
+        f.write(shapely.to_wkb(geometria))
+
+
+def escribir_dxf(file_path, ancho, alto, ancho_mm, alto_mm, geometria, precision=2):
+    """
+    DXF (R12) para la cortadora láser: una POLYLINE cerrada por anillo, en mm
+    y con el eje Y hacia arriba.
+    """
+    escala = ancho_mm / ancho
+    formato = f"%.{precision}f"
+    vertice = f"0\nVERTEX\n8\n0\n10\n{formato}\n20\n{formato}\n"
+
+    with open(file_path, 'w') as f:
+        f.write("0\nSECTION\n2\nENTITIES\n")
+        for poligono in poligonos_de(geometria):
+            for anillo in shapely.get_rings(poligono):
+                # El último punto repite el primero: la polilínea ya es cerrada
+                coords = shapely.get_coordinates(anillo)[:-1] * escala
+                if len(coords) < 3:
+                    continue
+                coords[:, 1] = alto_mm - coords[:, 1]
+                f.write("0\nPOLYLINE\n8\n0\n66\n1\n70\n1\n")
+                f.write(vertice * len(coords) % tuple(coords.ravel().tolist()))
+                f.write("0\nSEQEND\n")
+        f.write("0\nENDSEC\n0\nEOF\n")
+
+
+def malla_extruida(geometria, ancho, ancho_mm, alto_mm, altura_mm=ALTURA_EXTRUSION_MM):
+    """
+    Triangula la geometría y la extruye `altura_mm`. Devuelve (vertices,
+    caras): vértices (n, 3) en mm con el eje Y hacia arriba y caras (m, 3)
+    con los índices de cada triángulo, orientados hacia fuera.
+
+    Cada polígono es un sólido aparte y cada sector interior alrededor de
+    un punto de sus contornos es un vértice propio: donde un agujero toca
+    el contorno u otro agujero (en el centro de los anillos, o con grosor
+    cero) o dos polígonos se tocan, las paredes no comparten aristas. Así
+    cada arista está en exactamente dos caras.
+    """
+    escala = ancho_mm / ancho
+    poligonos = np.array(poligonos_de(geometria), dtype=object)
+    if not len(poligonos):
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+
+    # Puntos de los contornos, sin el de cierre ni los repetidos seguidos
+    anillos, poligono_anillo = shapely.get_rings(poligonos, return_index=True)
+    coords, numero_anillo = shapely.get_coordinates(anillos, return_index=True)
+    cierre = np.append(numero_anillo[1:] != numero_anillo[:-1], True)
+    repetido = np.append(False, (numero_anillo[1:] == numero_anillo[:-1]) & (coords[1:] == coords[:-1]).all(axis=1))
+    mantener = ~cierre & ~repetido
+    coords, numero_anillo = coords[mantener], numero_anillo[mantener]
+    poligono_punto = poligono_anillo[numero_anillo]
+
+    # Vértices en mm, con el eje Y hacia arriba
+    puntos = coords * escala
+    puntos[:, 1] = alto_mm - puntos[:, 1]
+
+    # Siguiente y anterior de cada punto en su anillo, recorrido con el
+    # interior a la izquierda (contornos exteriores antihorarios, agujeros
+    # horarios)
+    indices = np.arange(len(puntos))
+    inicio_anillo = np.searchsorted(numero_anillo, numero_anillo)
+    final_anillo = np.searchsorted(numero_anillo, numero_anillo, side='right') - 1
+    siguiente = np.where(indices == final_anillo, inicio_anillo, indices + 1)
+    anterior = np.where(indices == inicio_anillo, final_anillo, indices - 1)
+    x, y = puntos[:, 0], puntos[:, 1]
+    producto = x * y[siguiente] - x[siguiente] * y
+    area_anillo = np.bincount(numero_anillo, weights=producto, minlength=len(anillos))
+    es_exterior = np.append(True, poligono_anillo[1:] != poligono_anillo[:-1])
+    invertir = ((area_anillo > 0) != es_exterior)[numero_anillo]
+    siguiente, anterior = np.where(invertir, anterior, siguiente), np.where(invertir, siguiente, anterior)
+
+    # Triángulos de las tapas (sin vértices nuevos: solo los de los
+    # contornos), con cada esquina llevada al punto de su polígono
+    triangulos, poligono_triangulo = shapely.get_parts(
+        shapely.constrained_delaunay_triangles(poligonos), return_index=True
+    )
+    esquinas = shapely.get_coordinates(shapely.get_exterior_ring(triangulos)).reshape(-1, 4, 2)[:, :3].reshape(-1, 2)
+    claves = np.column_stack((
+        np.concatenate((poligono_punto, np.repeat(poligono_triangulo, 3))), np.concatenate((coords, esquinas))
+    ))
+    _, grupo = np.unique(claves, axis=0, return_inverse=True)
+    grupo = grupo.ravel()
+    grupo_punto, grupo_esquina = grupo[:len(puntos)], grupo[len(puntos):]
+    apariciones = np.bincount(grupo_punto, minlength=grupo.max() + 1)
+    dueno = np.full(len(apariciones), -1)
+    dueno[grupo_punto] = indices
+    caras_tapa = dueno[grupo_esquina].reshape(-1, 3)
+
+    # Un punto que aparece varias veces en el mismo polígono (donde un
+    # agujero toca el contorno u otro agujero) separa varios sectores
+    # interiores. Cada sector empieza, en sentido antihorario, en la arista
+    # que sale de una aparición y acaba en la que llega a otra: el sector es
+    # de la aparición de la que sale, y a ella van la arista que llega y los
+    # triángulos de la tapa que caen dentro
+    llegada = indices.copy()
+    repetidas = np.flatnonzero(apariciones[grupo_punto] > 1)
+    if len(repetidas):
+        def angulo(origen, destino):
+            d = destino - origen
+            return np.arctan2(d[:, 1], d[:, 0]) % (2 * np.pi)
+
+        # Salidas ordenadas por (punto, ángulo): el sector que contiene una
+        # dirección es el de la salida anterior en sentido antihorario
+        clave_salida = grupo_punto[repetidas] * 8 + angulo(puntos[repetidas], puntos[siguiente[repetidas]])
+        orden = np.argsort(clave_salida)
+        clave_salida, repetidas = clave_salida[orden], repetidas[orden]
+
+        def sector(grupos, angulos):
+            posicion = np.searchsorted(clave_salida, grupos * 8 + angulos, side='right') - 1
+            otra_vuelta = (posicion < 0) | (clave_salida[np.maximum(posicion, 0)] < grupos * 8)
+            posicion[otra_vuelta] = np.searchsorted(clave_salida, grupos[otra_vuelta] * 8 + 8) - 1
+            return repetidas[posicion]
+
+        llegada[repetidas] = sector(grupo_punto[repetidas], angulo(puntos[repetidas], puntos[anterior[repetidas]]))
+
+        esquinas_repetidas = np.flatnonzero(apariciones[grupo_esquina] > 1)
+        triangulo, k = np.divmod(esquinas_repetidas, 3)
+        otros = (puntos[caras_tapa[triangulo, (k + 1) % 3]] + puntos[caras_tapa[triangulo, (k + 2) % 3]]) / 2
+        caras_tapa[triangulo, k] = sector(grupo_esquina[esquinas_repetidas],
+                                          angulo(puntos[caras_tapa[triangulo, k]], otros))
+    caras_tapa = caras_tapa[(caras_tapa >= 0).all(axis=1)]
+
+    # Tapas en sentido antihorario vistas desde arriba
+    a, b, c = (puntos[caras_tapa[:, k]] for k in range(3))
+    horario = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) < 0
+    caras_tapa[horario] = caras_tapa[horario][:, ::-1]
+
+    # Paredes: cada arista, con el interior a su izquierda, da dos triángulos
+    desde, hasta = indices, llegada[siguiente]
+    n = len(puntos)
+    vertices = np.concatenate((
+        np.column_stack((puntos, np.zeros(n))), np.column_stack((puntos, np.full(n, altura_mm)))
+    ))
+    caras = np.concatenate((
+        caras_tapa + n,
+        caras_tapa[:, ::-1],
+        np.column_stack((desde, hasta, hasta + n)),
+        np.column_stack((desde, hasta + n, desde + n)),
+    ))
+    return vertices, caras
+
+
+def escribir_stl(file_path, ancho, alto, ancho_mm, alto_mm, geometria, altura_mm=ALTURA_EXTRUSION_MM):
+    """STL binario de la geometría extruida `altura_mm`, en mm."""
+    vertices, caras = malla_extruida(geometria, ancho, ancho_mm, alto_mm, altura_mm)
+    triangulos = vertices[caras]
+    normales = np.cross(triangulos[:, 1] - triangulos[:, 0], triangulos[:, 2] - triangulos[:, 0])
+    normales /= np.maximum(np.linalg.norm(normales, axis=1, keepdims=True), 1e-12)
+
+    registros = np.zeros(len(caras), dtype=[('normal', '<f4', 3), ('vertices', '<f4', (3, 3)), ('atributos', '<u2')])
+    registros['normal'] = normales
+    registros['vertices'] = triangulos
+    with open(file_path, 'wb') as f:
+        f.write(b'Generador de Arte Circular'.ljust(80, b' '))
+        f.write(np.uint32(len(caras)).tobytes())
+        f.write(registros.tobytes())
+
+
+def escribir_3mf(file_path, ancho, alto, ancho_mm, alto_mm, geometria, precision=2,
+                 altura_mm=ALTURA_EXTRUSION_MM):
+    """3MF (malla indexada en mm dentro de un ZIP) de la geometría extruida `altura_mm`."""
+    import zipfile
+
+    vertices, caras = malla_extruida(geometria, ancho, ancho_mm, alto_mm, altura_mm)
+    formato = f"%.{precision}f"
+    vertice = f'<vertex x="{formato}" y="{formato}" z="{formato}"/>'
+    triangulo = '<triangle v1="%d" v2="%d" v3="%d"/>'
+
+    with zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED) as archivo:
+        archivo.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+            '</Types>\n'
+        ))
+        archivo.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+            'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+            '</Relationships>\n'
+        ))
+        with archivo.open('3D/3dmodel.model', 'w') as binario, io.TextIOWrapper(binario, encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<model unit="millimeter" xml:lang="es" '
+                    'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+                    '<resources><object id="1" type="model"><mesh>\n<vertices>\n')
+            f.write((vertice * len(vertices)) % tuple(vertices.ravel().tolist()))
+            f.write('\n</vertices>\n<triangles>\n')
+            f.write((triangulo * len(caras)) % tuple(caras.ravel().tolist()))
+            f.write('\n</triangles>\n</mesh></object></resources>\n'
+                    '<build><item objectid="1"/></build>\n</model>\n')
+
+
+# Formatos de salida: función y opciones que admite
+FORMATOS = {
+    'svg': (escribir_svg, ('precision', 'relativo', 'path_por_poligono')),
+    'svgz': (escribir_svgz, ('precision', 'relativo', 'path_por_poligono')),
+    'dxf': (escribir_dxf, ('precision',)),
+    'npz': (escribir_npz, ()),
+    'wkb': (escribir_wkb, ()),
+    'stl': (escribir_stl, ('altura_mm',)),
+    '3mf': (escribir_3mf, ('precision', 'altura_mm')),
+}
+
+
+def formato_de_archivo(file_path):
+    """Formato según la extensión del archivo (svg si no se reconoce)."""
+    extension = os.path.splitext(file_path)[1].lower().lstrip('.')
+    return extension if extension in FORMATOS else 'svg'
+
+
+def indexar_geometria(geometria):
+    """
+    Prepara índices espaciales (STRtree) para recortar la geometría por zonas.
+
+    La geometría unida suele ser un único polígono (todo se conecta a través
+    del marco) con miles de agujeros, así que además del índice de
+    componentes se indexan los agujeros de cada una.
+    """
+    componentes = poligonos_de(geometria)
+    indices_agujeros = []
+    for poligono in componentes:
+        agujeros = shapely.get_rings(poligono)[1:]
+        indices_agujeros.append((agujeros, shapely.STRtree(shapely.polygons(agujeros))))
+    return shapely.STRtree(componentes), componentes, indices_agujeros
+
+
+def recortar_componente(poligono, agujeros, arbol_agujeros, rect):
+    """
+    Recorta un polígono con un rectángulo usando el índice de sus agujeros.
+
+    Se recorta solo el contorno exterior y se le devuelven los agujeros que
+    quedan estrictamente dentro, sin recorrer el resto. Si algún agujero
+    cruza el borde se hace la intersección completa.
+    """
+    contorno = shapely.Polygon(poligono.exterior).intersection(rect)
+    if isinstance(contorno, shapely.Polygon) and not contorno.is_empty:
+        dentro = arbol_agujeros.query(contorno, predicate='contains_properly')
+        if len(dentro) == len(arbol_agujeros.query(rect, predicate='intersects')):
+            return shapely.polygons(contorno.exterior, holes=agujeros[np.sort(dentro)])
+
+    return poligono.intersection(rect)
+
+
+def recortar_indexado(indice, rect):
+    """Intersección de la geometría indexada con un rectángulo."""
+    arbol, componentes, indices_agujeros = indice
+
+    partes = []
+    for k in np.sort(arbol.query(rect)):
+        poligono = componentes[k]
+        if rect.contains(poligono):
+            partes.append(poligono)
+        else:
+            agujeros, arbol_agujeros = indices_agujeros[k]
+            partes += poligonos_de(recortar_componente(poligono, agujeros, arbol_agujeros, rect))
+
+    return partes[0] if len(partes) == 1 else shapely.MultiPolygon(partes)
+
+
+def construir_panel(muestras, familia, cx, cy, rect, tiras, grosor_min, grosor_max, tolerancia_simplificacion=0.0):
+    """
+    Construye solo la geometría de un panel, sin el resto del diseño.
+
+    Se toman los anillos que cruzan el panel, se recortan de forma analítica
+    al panel (como al canvas) y se unen con la parte de las tiras del marco y
+    los separadores que cae dentro. `rect` es (x_min, y_min, ancho, alto) en
+    píxeles del canvas. Devuelve la geometría trasladada al origen y sus
+    estadísticas.
+    """
+    x_min, y_min, ancho_panel, alto_panel = rect
+    validos = np.flatnonzero(anillos_en_rectangulo(
+        cx, cy, familia, grosor_max, x_min, y_min, x_min + ancho_panel, y_min + alto_panel
+    ))
+    tramos_anillos = aplicar_grosores([muestras[k] for k in validos], familia[validos], grosor_min, grosor_max)
+
+    # En coordenadas del panel, el panel es el canvas
+    cx_panel, cy_panel = cx - x_min, cy - y_min
+    poligonos_anillos, estadisticas = construir_poligonos(
+        tramos_anillos, validos, cx_panel, cy_panel, ancho_panel, alto_panel, tolerancia_simplificacion
+    )
+
+    panel_rect = shapely.box(x_min, y_min, x_min + ancho_panel, y_min + alto_panel)
+    tiras_panel = [shapely.affinity.translate(tira.intersection(panel_rect), -x_min, -y_min) for tira in tiras]
+    tiras_panel = [tira for tira in tiras_panel if not tira.is_empty]
+
+    geometria = unir_anillos(cx_panel, cy_panel, poligonos_anillos, tiras_panel)
+    estadisticas['vertices_union_entrada'] = int(shapely.get_num_coordinates(poligonos_anillos + tiras_panel).sum())
+    estadisticas['vertices_union_salida'] = int(shapely.get_num_coordinates(geometria))
+    return geometria, estadisticas
+
+
+def recortar_panel(indice, x_min, y_min, ancho_panel, alto_panel):
+    """Recorta un panel de la geometría indexada y lo traslada al origen."""
+    panel_rect = shapely.box(x_min, y_min, x_min + ancho_panel, y_min + alto_panel)
+    panel_geom = recortar_indexado(indice, panel_rect)
+    if panel_geom.is_empty:
+        return panel_geom
+
+    # Trasladar la geometría al origen (0,0)
+    return shapely.affinity.translate(panel_geom, -x_min, -y_min)
+
+
+def construir_anillos(piramide, ancho, alto, cx, cy, familia, indices, num_segmentos, grosor_min, grosor_max,
+                      modo_muestreo='cercano', ventana_suavizado=1, tolerancia_cuerda=None,
+                      tolerancia_simplificacion=0.0, num_lineas=None, progreso=None):
+    """
+    Construye los polígonos recortados de los anillos de las curvas de la familia.
+
+    `indices` es el número de cada círculo en el diseño completo (para los
+    mensajes) y las tolerancias van en píxeles del canvas. `progreso` es una
+    función opcional que recibe los mensajes de avance. Devuelve los
+    polígonos en orden de radio y un diccionario de estadísticas.
+    """
+    # Descarte de los círculos que no tocan el canvas
+    validos = [
+        k for k in range(len(familia))
+        if circulo_intersecta_canvas(cx, cy, familia.radios_max[k], grosor_max, ancho, alto)
+    ]
+
+    muestras = muestrear_anillos(
+        piramide, ancho, alto, cx, cy, familia[validos], num_segmentos, grosor_max,
+        modo_muestreo=modo_muestreo, ventana_suavizado=ventana_suavizado, tolerancia_cuerda=tolerancia_cuerda
+    )
+    tramos_anillos = aplicar_grosores(muestras, familia[validos], grosor_min, grosor_max)
+
+    poligonos_anillos, estadisticas = construir_poligonos(
+        tramos_anillos, [int(indices[k]) for k in validos], cx, cy, ancho, alto,
+        tolerancia_simplificacion, num_lineas=num_lineas, progreso=progreso
+    )
+    estadisticas['circulos_descartados'] += len(familia) - len(validos)
+    return poligonos_anillos, estadisticas
+
+
+def construir_poligonos(tramos_anillos, indices, cx, cy, ancho, alto, tolerancia_simplificacion=0.0,
+                        num_lineas=None, progreso=None):
+    """
+    Recorta con el canvas, simplifica y convierte en polígonos los tramos
+    polares de cada anillo.
+
+    `indices` es el número de cada círculo en el diseño completo (para los
+    mensajes) y la tolerancia va en píxeles del canvas. Devuelve los
+    polígonos en orden de radio y un diccionario de estadísticas.
+    """
+    if num_lineas is None:
+        num_lineas = len(tramos_anillos)
+
+    total_puntos_antes = 0
+    total_puntos_despues = 0
+    vertices_por_anillo = []
+    circulos_completos = 0
+    circulos_cortados = 0
+    circulos_descartados = 0
+    contadores = {'reparaciones': 0, 'piezas_descartadas': 0, 'errores_geos': 0}
+    poligonos_anillos = []
+    indices_validos = indices
+
+    # Crear rectángulo del canvas para operación booleana
+    canvas_rect = shapely.box(0, 0, ancho, alto)
+
+    # Recorte analítico con el canvas; solo los anillos que contienen una
+    # esquina se recortan después con Shapely
+    piezas_anillos = []
+    recorte_geos = []
+    recortados = []
+    for tramos in tramos_anillos:
+        radio_interior = min((interior.min() for _, interior, _, _ in tramos), default=0.0)
+        radio_exterior = max((exterior.max() for _, _, exterior, _ in tramos), default=0.0)
+        usar_geos = contiene_esquina(cx, cy, radio_interior, radio_exterior, ancho, alto)
+
+        piezas = []
+        recortado = False
+        for angulos, interior, exterior, cerrado in tramos:
+            total_puntos_antes += len(angulos)
+            if usar_geos:
+                piezas.append((
+                    puntos_polares(cx, cy, angulos, exterior),
+                    puntos_polares(cx, cy, angulos, interior),
+                    cerrado
+                ))
+            else:
+                piezas_tramo, recortado_tramo = recortar_tramo(
+                    cx, cy, angulos, interior, exterior, cerrado, ancho, alto
+                )
+                piezas += piezas_tramo
+                recortado = recortado or recortado_tramo or not cerrado
+
+        piezas_anillos.append(piezas)
+        recorte_geos.append(usar_geos)
+        recortados.append(recortado)
+
+    # Simplificar todas las piezas a la vez con error acotado (los discos sin
+    # agujero usan el borde exterior también como interior)
+    piezas_planas = [pieza for piezas in piezas_anillos for pieza in piezas]
+    piezas_simplificadas = simplificar_tramos(
+        [(exterior, exterior if interior is None else interior, cerrado)
+         for exterior, interior, cerrado in piezas_planas],
+        tolerancia_simplificacion
+    )
+
+    # Crear los polígonos de todas las piezas a la vez
+    poligonos_piezas = iter(crear_poligonos_anillo(
+        [(exterior, None if interior is None else interior_opt, cerrado)
+         for (exterior, interior_opt), (_, interior, cerrado) in zip(piezas_simplificadas, piezas_planas)],
+        cx, cy, 1e-9 * max(ancho, alto), contadores=contadores
+    ))
+    longitudes_piezas = iter(len(exterior) for exterior, _ in piezas_simplificadas)
+
+    # Generar cada círculo
+    for k, i in enumerate(indices_validos):
+        poligonos_anillo = []
+        vertices_anillo = 0
+
+        for _ in piezas_anillos[k]:
+            vertices_pieza = next(longitudes_piezas)
+            total_puntos_despues += vertices_pieza
+            vertices_anillo += vertices_pieza
+
+            poligono_pieza = next(poligonos_piezas)
+            if poligono_pieza is not None and not poligono_pieza.is_empty:
+                poligonos_anillo.append(poligono_pieza)
+
+        if not poligonos_anillo:
+            circulos_descartados += 1
+            continue
+
+        vertices_por_anillo.append(vertices_anillo)
+
+        poligono_anillo = poligonos_anillo[0] if len(poligonos_anillo) == 1 else shapely.MultiPolygon(
+            [p for poligono in poligonos_anillo for p in getattr(poligono, 'geoms', [poligono])]
+        )
+
+        if not recorte_geos[k]:
+            # Clasificación directa del recorte analítico
+            if recortados[k]:
+                circulos_cortados += 1
+            else:
+                circulos_completos += 1
+            poligonos_anillos.append(poligono_anillo)
+
+        else:
+            # OPERACIÓN BOOLEANA: Intersección con el canvas
+            try:
+                poligono_recortado = poligono_anillo.intersection(canvas_rect)
+
+                if poligono_recortado.is_empty:
+                    circulos_descartados += 1
+                    continue
+
+                circulos_cortados += 1
+                poligonos_anillos.append(poligono_recortado)
+
+            except Exception as e:
+                contadores['errores_geos'] += 1
+                if progreso:
+                    progreso(f"  Advertencia: Error procesando círculo {i}: {e}")
+                circulos_descartados += 1
+                continue
+
+        if progreso and (i + 1) % 50 == 0:
+            progreso(f"  Procesados {i + 1}/{num_lineas} círculos...")
+
+    estadisticas = {
+        'puntos_antes': total_puntos_antes,
+        'puntos_despues': total_puntos_despues,
+        'vertices_por_anillo': vertices_por_anillo,
+        'circulos_completos': circulos_completos,
+        'circulos_cortados': circulos_cortados,
+        'circulos_descartados': circulos_descartados,
+        'reparaciones': contadores['reparaciones'],
+        'piezas_descartadas': contadores['piezas_descartadas'],
+        'errores_geos': contadores['errores_geos'],
+    }
+
+    return poligonos_anillos, estadisticas
+
+
+def sumar_estadisticas(lista_estadisticas):
+    """Combina las estadísticas de varios bloques de anillos."""
+    total = {
+        'puntos_antes': 0,
+        'puntos_despues': 0,
+        'vertices_por_anillo': [],
+        'circulos_completos': 0,
+        'circulos_cortados': 0,
+        'circulos_descartados': 0,
+        'reparaciones': 0,
+        'piezas_descartadas': 0,
+        'errores_geos': 0,
+    }
+    for estadisticas in lista_estadisticas:
+        for clave, valor in estadisticas.items():
+            total[clave] = total.get(clave, 0) + valor
+    return total
+
+
+def compartir_piramide(piramide):
+    """
+    Copia la pirámide a un bloque de memoria compartida.
+
+    Devuelve el bloque (que hay que cerrar y liberar al terminar) y su
+    descripción (nombre, [(forma, dtype, desplazamiento), ...]) para los
+    procesos trabajadores.
+    """
+    from multiprocessing import shared_memory
+
+    memoria = shared_memory.SharedMemory(create=True, size=max(1, sum(nivel.nbytes for nivel in piramide)))
+
+    niveles = []
+    desplazamiento = 0
+    for nivel in piramide:
+        vista = np.ndarray(nivel.shape, dtype=nivel.dtype, buffer=memoria.buf, offset=desplazamiento)
+        vista[...] = nivel
+        niveles.append((nivel.shape, nivel.dtype.str, desplazamiento))
+        desplazamiento += nivel.nbytes
+
+    return memoria, (memoria.name, niveles)
+
+
+# Estado de cada proceso trabajador: memoria compartida y pirámide sobre ella
+_trabajador = {}
+
+
+def iniciar_trabajador(descripcion):
+    """Conecta el proceso trabajador a la pirámide en memoria compartida."""
+    from multiprocessing import shared_memory
+
+    nombre, niveles = descripcion
+    memoria = shared_memory.SharedMemory(name=nombre)
+    _trabajador['memoria'] = memoria
+    _trabajador['piramide'] = [
+        np.ndarray(forma, dtype=np.dtype(dtype), buffer=memoria.buf, offset=desplazamiento)
+        for forma, dtype, desplazamiento in niveles
+    ]
+
+
+def construir_bloque_anillos(ancho, alto, cx, cy, familia, indices, parametros):
+    """
+    Construye y une parcialmente un bloque de anillos en un proceso trabajador.
+
+    Devuelve la geometría del bloque en WKB (o None si queda vacío) y sus
+    estadísticas.
+    """
+    poligonos, estadisticas = construir_anillos(
+        _trabajador['piramide'], ancho, alto, cx, cy, familia, indices, **parametros
+    )
+    if not poligonos:
+        return None, estadisticas
+
+    parcial = unir_anillos(cx, cy, poligonos, [])
+    return shapely.to_wkb(parcial), estadisticas
+
+
+def construir_anillos_en_paralelo(piramide, ancho, alto, cx, cy, familia, workers, progreso=None, **parametros):
+    """
+    Reparte las curvas en bloques consecutivos entre un grupo de procesos.
+
+    La pirámide se comparte por memoria compartida, sin copiarla en cada
+    tarea. Cada proceso construye, recorta y une parcialmente su bloque, y lo
+    devuelve en WKB. Devuelve las geometrías de los bloques en orden de
+    radio y las estadísticas combinadas.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Más bloques que procesos para repartir mejor la carga
+    bloques = [b for b in np.array_split(np.arange(len(familia)), min(len(familia), workers * 4)) if len(b)]
+
+    memoria, descripcion = compartir_piramide(piramide)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=iniciar_trabajador,
+                                 initargs=(descripcion,)) as pool:
+            futuros = [
+                pool.submit(construir_bloque_anillos, ancho, alto, cx, cy, familia[bloque], bloque, parametros)
+                for bloque in bloques
+            ]
+            resultados = []
+            procesados = 0
+            for bloque, futuro in zip(bloques, futuros):
+                resultados.append(futuro.result())
+                procesados += len(bloque)
+                if progreso:
+                    progreso(f"  Procesados {procesados}/{len(familia)} círculos...")
+    finally:
+        memoria.close()
+        memoria.unlink()
+
+    geometrias = [shapely.from_wkb(wkb) for wkb, _ in resultados if wkb is not None]
+    return geometrias, sumar_estadisticas(estadisticas for _, estadisticas in resultados)
+
+
+def hash_archivo(file_path, bloque=1 << 20):
+    """Hash SHA-256 del contenido de un archivo."""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for datos in iter(lambda: f.read(bloque), b''):
+            h.update(datos)
+    return h.hexdigest()
+
+
+def clave_cache(*partes):
+    """Clave de una entrada de la caché a partir de los valores de los que depende."""
+    return hashlib.sha256(repr(partes).encode()).hexdigest()
+
+
+def leer_cache(directorio, clave):
+    """
+    Lee una entrada de la caché (diccionario de arrays) o None si no existe.
+
+    Cada acierto actualiza la fecha del archivo, que es lo que usa la poda LRU.
+    """
+    ruta = os.path.join(directorio, clave + '.npz')
+    try:
+        with np.load(ruta) as datos:
+            contenido = {nombre: datos[nombre] for nombre in datos.files}
+        os.utime(ruta)
+    except (OSError, ValueError):
+        return None
+    return contenido
+
+
+def guardar_cache(directorio, clave, limite_bytes, **arrays):
+    """Guarda una entrada en la caché y poda las menos usadas si se pasa del límite."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, clave + '.npz')
+
+    # Escribir aparte y renombrar: nunca queda una entrada a medias
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporal, ruta)
+
+    podar_cache(directorio, limite_bytes)
+
+
+def podar_cache(directorio, limite_bytes):
+    """Borra las entradas usadas hace más tiempo hasta quedar por debajo del límite."""
+    entradas = []
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.npz'):
+            ruta = os.path.join(directorio, nombre)
+            try:
+                info = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((info.st_mtime, info.st_size, ruta))
+
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, ruta in sorted(entradas):
+        if total <= limite_bytes:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        total -= tamano
+
+
+def bytes_a_array(datos):
+    return np.frombuffer(datos, dtype=np.uint8)
+
+
+def geometrias_a_cache(geometrias, estadisticas):
+    """Arrays para guardar en la caché una lista de geometrías y sus estadísticas."""
+    return dict(
+        wkb=bytes_a_array(shapely.to_wkb(shapely.GeometryCollection(list(geometrias)))),
+        estadisticas=bytes_a_array(json.dumps(estadisticas).encode())
+    )
+
+
+def geometrias_de_cache(contenido):
+    """Inversa de geometrias_a_cache: (lista de geometrías, estadísticas)."""
+    coleccion = shapely.from_wkb(contenido['wkb'].tobytes())
+    return list(coleccion.geoms), json.loads(contenido['estadisticas'].tobytes())
+
+
+def escribir_perfil(perfil_path, resultado, segundos_totales):
+    """
+    Guarda en JSON el perfil de una generación: tiempo real, de CPU y pico de
+    memoria por etapa, contadores de geometría y versiones de las librerías.
+    """
+    estadisticas = resultado.estadisticas
+    vertices_por_anillo = estadisticas['vertices_por_anillo']
+    picos = [medida['memoria_pico_mb'] for medida in resultado.perfil.values()
+             if medida['memoria_pico_mb'] is not None]
+
+    informe = {
+        'imagen': resultado.parametros.get('imagen_path'),
+        'parametros': {clave: valor for clave, valor in resultado.parametros.items() if clave != 'imagen_path'},
+        'versiones': {
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'shapely': shapely.__version__,
+            'geos': shapely.geos_version_string,
+        },
+        'cpus': os.cpu_count(),
+        'segundos_totales': round(segundos_totales, 4),
+        'etapas': {
+            etapa: {
+                'segundos': round(medida['segundos'], 4),
+                'cpu_segundos': round(medida['cpu_segundos'], 4),
+                'memoria_pico_mb': None if medida['memoria_pico_mb'] is None else round(medida['memoria_pico_mb'], 1),
+            }
+            for etapa, medida in resultado.perfil.items()
+        },
+        'memoria_pico_mb': round(max(picos), 1) if picos else None,
+        'memoria_pico_procesos_mb': None,
+        'contadores': {
+            'puntos_antes': estadisticas['puntos_antes'],
+            'puntos_despues': estadisticas['puntos_despues'],
+            'vertices_anillo_min': min(vertices_por_anillo, default=0),
+            'vertices_anillo_mediana': int(np.median(vertices_por_anillo)) if vertices_por_anillo else 0,
+            'vertices_anillo_max': max(vertices_por_anillo, default=0),
+            'circulos_completos': estadisticas['circulos_completos'],
+            'circulos_cortados': estadisticas['circulos_cortados'],
+            'circulos_descartados': estadisticas['circulos_descartados'],
+            # Pueden faltar en entradas de caché anteriores
+            'reparaciones': estadisticas.get('reparaciones'),
+            'piezas_descartadas': estadisticas.get('piezas_descartadas'),
+            'errores_geos': estadisticas.get('errores_geos'),
+            'vertices_union_entrada': estadisticas.get('vertices_union_entrada'),
+            'vertices_union_salida': estadisticas.get('vertices_union_salida'),
+        },
+    }
+    if resultado.parametros.get('workers', 1) > 1:
+        pico_procesos = pico_memoria_mb(hijos=True)
+        informe['memoria_pico_procesos_mb'] = None if pico_procesos is None else round(pico_procesos, 1)
+
+    with open(perfil_path, 'w') as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+
+def imprimir_estadisticas(estadisticas, progreso=print):
+
+    if estadisticas['puntos_antes'] == 0:
+        return
+
+    reduccion = 100 * (1 - estadisticas['puntos_despues'] / estadisticas['puntos_antes'])
+    vertices_por_anillo = estadisticas['vertices_por_anillo']
+    progreso(f"\nEstadísticas:")
+    progreso(f"  Puntos antes: {estadisticas['puntos_antes']}")
+    progreso(f"  Puntos después: {estadisticas['puntos_despues']}")
+    progreso(f"  Reducción de puntos: {reduccion:.1f}%")
+    if vertices_por_anillo:
+        progreso(f"  Vértices por anillo: mín {min(vertices_por_anillo)}, "
+                 f"mediana {int(np.median(vertices_por_anillo))}, máx {max(vertices_por_anillo)}")
+    progreso(f"  Círculos completos: {estadisticas['circulos_completos']}")
+    progreso(f"  Círculos cortados: {estadisticas['circulos_cortados']}")
+    progreso(f"  Círculos descartados: {estadisticas['circulos_descartados']}")
+    # Pueden faltar en entradas de caché anteriores
+    if estadisticas.get('reparaciones') or estadisticas.get('piezas_descartadas'):
+        progreso(f"  Piezas reparadas: {estadisticas.get('reparaciones', 0)}, "
+                 f"descartadas: {estadisticas.get('piezas_descartadas', 0)}")
+    if estadisticas.get('errores_geos'):
+        progreso(f"  Errores de GEOS: {estadisticas['errores_geos']}")
+
+
+def crear_tiras(ancho, alto, escala_pixel_a_mm, disposicion, dividir_paneles=True):
+    """Polígonos del marco y, si se divide en paneles, de las líneas separadoras."""
+    # Tiras del marco y separadores
+    tiras = []
+
+    marco_width_pixels = disposicion.marco_mm * escala_pixel_a_mm
+    if marco_width_pixels > 0:
+        # Crear marco con 4 rectángulos en los bordes
+        marco_superior = shapely.box(0, 0, ancho, marco_width_pixels)
+        marco_inferior = shapely.box(0, alto - marco_width_pixels, ancho, alto)
+        marco_izquierdo = shapely.box(0, 0, marco_width_pixels, alto)
+        marco_derecho = shapely.box(ancho - marco_width_pixels, 0, ancho, alto)
+
+        tiras.append(shapely.unary_union([marco_superior, marco_inferior, marco_izquierdo, marco_derecho]))
+
+    # Solo añadir separadores si dividir_paneles == True
+    linea_sep_pixels = disposicion.separador_mm * escala_pixel_a_mm
+    if dividir_paneles and linea_sep_pixels > 0 and disposicion.num_paneles > 1:
+        # Líneas verticales entre columnas y horizontales entre filas, todas
+        # las de la cuadrícula en una sola unión
+        x_pos = np.arange(1, disposicion.cols) * disposicion.panel_ancho_mm * escala_pixel_a_mm
+        y_pos = np.arange(1, disposicion.rows) * disposicion.panel_alto_mm * escala_pixel_a_mm
+        lineas_separadoras = shapely.box(
+            np.concatenate((x_pos - linea_sep_pixels / 2, np.zeros(len(y_pos)))),
+            np.concatenate((np.zeros(len(x_pos)), y_pos - linea_sep_pixels / 2)),
+            np.concatenate((x_pos + linea_sep_pixels / 2, np.full(len(y_pos), float(ancho)))),
+            np.concatenate((np.full(len(x_pos), float(alto)), y_pos + linea_sep_pixels / 2))
+        )
+
+        separadores = shapely.union_all(lineas_separadoras)
+        tiras.append(separadores)
+
+    return tiras
+
+
+def tiempo_cpu():
+    """Segundos de CPU del proceso y de sus procesos hijos ya terminados."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def reiniciar_pico_memoria():
+    """Reinicia el pico de memoria residente del proceso (solo en Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def pico_memoria_mb(hijos=False):
+    """
+    Pico de memoria residente en MB desde el último reinicio (o desde el
+    inicio si no se puede reiniciar), o el mayor de los procesos hijos.
+    Devuelve None si el sistema no lo ofrece.
+    """
+    if not hijos:
+        try:
+            with open('/proc/self/status') as f:
+                for linea in f:
+                    if linea.startswith('VmHWM:'):
+                        return int(linea.split()[1]) / 1024
+        except OSError:
+            pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_CHILDREN if hijos else resource.RUSAGE_SELF).ru_maxrss
+    # En macOS ru_maxrss va en bytes, en Linux en kB
+    return pico / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+@contextlib.contextmanager
+def medir_etapa(perfil, etapa):
+    """Guarda en perfil[etapa] el tiempo real, el tiempo de CPU y el pico de memoria del bloque."""
+    reiniciar_pico_memoria()
+    inicio, inicio_cpu = time.perf_counter(), tiempo_cpu()
+    yield
+    perfil[etapa] = dict(segundos=time.perf_counter() - inicio, cpu_segundos=tiempo_cpu() - inicio_cpu,
+                         memoria_pico_mb=pico_memoria_mb())
+
+
+@dataclass
+class PanelCircular:
+    """
+    Un panel del diseño: posición y tamaño en píxeles del canvas, tamaño en
+    mm y su geometría ya trasladada al origen.
+    """
+    numero: int
+    x_min: float
+    y_min: float
+    ancho: float
+    alto: float
+    ancho_mm: float
+    alto_mm: float
+    geometria: object
+
+
+def exportador_de(formato, precision=2, relativo=False, path_por_poligono=False, altura_mm=ALTURA_EXTRUSION_MM):
+    """Función de exportación del formato y las opciones que admite."""
+    exportador, admitidas = FORMATOS[formato]
+    opciones = dict(precision=precision, relativo=relativo, path_por_poligono=path_por_poligono,
+                    altura_mm=altura_mm)
+    return exportador, {clave: valor for clave, valor in opciones.items() if clave in admitidas}
+
+
+def escribir_panel(panel, panels_dir, formato, exportador, opciones):
+    """Guarda un panel en la carpeta de paneles. Devuelve su ruta, o None si está vacío."""
+    if panel.geometria.is_empty:
+        return None
+    panel_path = os.path.join(panels_dir, f"panel_{panel.numero}.{formato}")
+    exportador(panel_path, panel.ancho, panel.alto, panel.ancho_mm, panel.alto_mm, panel.geometria, **opciones)
+    return panel_path
+
+
+@dataclass
+class ResultadoCircular:
+    """
+    Resultado de un render: geometría completa, paneles, estadísticas y
+    tiempo por etapa (en segundos, solo de las etapas recalculadas). En
+    `perfil` están además el tiempo de CPU y el pico de memoria de cada
+    etapa, y el de la escritura tras llamar a `guardar`.
+
+    Las medidas van en píxeles del canvas (`ancho`, `alto`) y en mm
+    (`ancho_mm`, `alto_mm`); `disposicion` es la cuadrícula de paneles.
+    Nada se escribe en disco hasta llamar a `guardar`, que deja en `rutas`
+    los archivos escritos.
+    """
+    geometria: object
+    paneles: list
+    estadisticas: dict
+    tiempos: dict
+    perfil: dict
+    ancho: int
+    alto: int
+    ancho_mm: float
+    alto_mm: float
+    disposicion: Disposicion
+    parametros: dict = field(default_factory=dict)
+    rutas: list = field(default_factory=list)
+
+    def guardar(self, output_path, formato=None, precision=2, relativo=False, path_por_poligono=False,
+                altura_mm=ALTURA_EXTRUSION_MM, progreso=None):
+        """
+        Guarda el archivo completo y, si hay paneles, uno por panel en una
+        carpeta con el nombre del archivo. Devuelve las rutas escritas.
+        """
+        def avisar(mensaje):
+            if progreso:
+                progreso(mensaje)
+
+        if self.geometria is None:
+            raise ValueError("El diseño se generó panel a panel y ya se guardó al generarlo")
+        if formato is None:
+            formato = formato_de_archivo(output_path)
+        exportador, opciones = exportador_de(formato, precision, relativo, path_por_poligono, altura_mm)
+
+        rutas = [output_path]
+        with medir_etapa(self.perfil, 'escritura'):
+            # GUARDAR ARCHIVO COMPLETO
+            avisar(f"\nGuardando archivo completo: {output_path}")
+            exportador(output_path, self.ancho, self.alto, self.ancho_mm, self.alto_mm, self.geometria, **opciones)
+            avisar(f"✓ {formato.upper()} completo guardado")
+
+            if self.paneles:
+                # CREAR CARPETA PARA PANELES
+                panels_dir = os.path.splitext(output_path)[0]
+                os.makedirs(panels_dir, exist_ok=True)
+                avisar(f"\nCarpeta para paneles: {panels_dir}/")
+
+                # Los paneles ya están recortados; solo se escriben, en paralelo
+                avisar(f"\nGenerando {len(self.paneles)} paneles individuales...")
+                from concurrent.futures import ThreadPoolExecutor
+
+                with ThreadPoolExecutor() as pool:
+                    futuros = [
+                        pool.submit(escribir_panel, panel, panels_dir, formato, exportador, opciones)
+                        for panel in self.paneles
+                    ]
+                    for panel, futuro in zip(self.paneles, futuros):
+                        panel_path = futuro.result()
+                        if panel_path is None:
+                            avisar(f"  ⚠ Panel {panel.numero} vacío (omitido)")
+                        else:
+                            rutas.append(panel_path)
+                            avisar(f"  ✓ Panel {panel.numero}: {panel_path}")
+
+        self.rutas = rutas
+        return rutas
+
+
+class PipelineCircular:
+    """
+    Pipeline por etapas con memoria: lienzo → imagen → curvas → muestras →
+    grosores → polígonos → unión → paneles.
+
+    Cada etapa guarda su último resultado junto con la clave de los
+    parámetros de los que depende (los suyos y los de la etapa anterior).
+    Al cambiar un parámetro solo se recalculan las etapas posteriores: cambiar
+    el rango de grosores reutiliza las muestras de intensidad, y cambiar el
+    formato de salida reutiliza la geometría unida.
+
+    Los mensajes de avance se pasan a la función `progreso` (si la hay). El
+    tiempo real y de CPU propio de cada etapa calculada (sin las etapas
+    anteriores que calcule dentro) y su pico de memoria quedan en `perfil`.
+    """
+
+    # Etapa anterior y parámetros propios de cada etapa
+    ETAPAS = {
+        'lienzo': (None, ('imagen_path', 'num_lineas', 'centro_x', 'centro_y', 'tolerancia_cuerda',
+                          'reducir_imagen', 'paneles', 'panel_mm', 'marco_mm', 'separador_mm')),
+        'imagen': ('lienzo', ('contraste', 'modo_muestreo')),
+        'curvas': ('imagen', ('curvas', 'proporcion_elipse', 'rotacion_elipse', 'espaciado_curvas')),
+        'muestras': ('curvas', ('ventana_suavizado',)),
+        'grosores': ('muestras', ('grosor_min', 'grosor_max')),
+        'poligonos': ('grosores', ('tolerancia_simplificacion',)),
+        'union': ('poligonos', ('dividir_paneles',)),
+        'paneles': ('union', ()),
+    }
+
+    def __init__(self, progreso=None):
+        self.parametros = {}
+        self.memoria = {}
+        self.progreso = progreso
+        self.perfil = {}
+        self.anidado = (0.0, 0.0, 0.0)
+
+    def avisar(self, mensaje):
+        if self.progreso:
+            self.progreso(mensaje)
+
+    def configurar(self, **parametros):
+        self.parametros.update(parametros)
+
+    def clave(self, etapa):
+        anterior, nombres = self.ETAPAS[etapa]
+        valores = tuple(self.parametros[nombre] for nombre in nombres)
+
+        if etapa == 'lienzo':
+            # Si la imagen cambia en disco, todo se recalcula
+            info = os.stat(self.parametros['imagen_path'])
+            valores += (info.st_mtime_ns, info.st_size)
+        elif etapa == 'muestras' and self.parametros['tolerancia_cuerda'] is not None:
+            # Con teselado adaptativo los arcos visibles dependen del grosor máximo
+            valores += (self.parametros['grosor_max'],)
+
+        return valores if anterior is None else (self.clave(anterior), valores)
+
+    def obtener(self, etapa):
+        """Resultado de una etapa, recalculándola solo si su clave ha cambiado."""
+        clave = self.clave(etapa)
+        guardada = self.memoria.get(etapa)
+        if guardada is None or guardada[0] != clave:
+            # Los tiempos de las etapas anteriores calculadas dentro no
+            # cuentan; su pico de memoria sí forma parte del de esta etapa
+            anidado, self.anidado = self.anidado, (0.0, 0.0, 0.0)
+            reiniciar_pico_memoria()
+            inicio, inicio_cpu = time.perf_counter(), tiempo_cpu()
+            valor = getattr(self, 'calcular_' + etapa)()
+            total, total_cpu = time.perf_counter() - inicio, tiempo_cpu() - inicio_cpu
+            pico = pico_memoria_mb()
+            if pico is not None:
+                pico = max(pico, self.anidado[2])
+
+            self.perfil[etapa] = dict(segundos=total - self.anidado[0], cpu_segundos=total_cpu - self.anidado[1],
+                                      memoria_pico_mb=pico)
+            self.anidado = (anidado[0] + total, anidado[1] + total_cpu, max(anidado[2], pico or 0.0))
+            self.memoria[etapa] = (clave, valor)
+        return self.memoria[etapa][1]
+
+    def parametros_anillos(self):
+        """Parámetros de construir_anillos, con las tolerancias en píxeles."""
+        p = self.parametros
+        lienzo = self.obtener('lienzo')
+        escala_pixel_a_mm = lienzo['ancho'] / lienzo['ancho_mm']
+        return dict(
+            num_segmentos=NUM_SEGMENTOS,
+            grosor_min=p['grosor_min'],
+            grosor_max=p['grosor_max'],
+            modo_muestreo=p['modo_muestreo'],
+            ventana_suavizado=p['ventana_suavizado'],
+            tolerancia_cuerda=None if p['tolerancia_cuerda'] is None else p['tolerancia_cuerda'] * escala_pixel_a_mm,
+            tolerancia_simplificacion=p['tolerancia_simplificacion'] * escala_pixel_a_mm
+        )
+
+    def calcular_lienzo(self):
+        p = self.parametros
+        with Image.open(p['imagen_path']) as imagen:
+            # Calcular dimensiones físicas según orientación (antes de ajustar)
+            disposicion = calcular_disposicion(imagen, p['paneles'], p['panel_mm'], p['marco_mm'],
+                                               p['separador_mm'])
+            ancho_mm, alto_mm = disposicion.ancho_mm, disposicion.alto_mm
+
+            # El canvas conserva las coordenadas de la imagen recortada, aunque se
+            # muestree sobre una versión reducida
+            _, _, ancho, alto = calcular_recorte(imagen.size[0], imagen.size[1], disposicion.proporcion)
+
+        # Calcular posición del centro en píxeles
+        cx = int(ancho * p['centro_x'] / 100.0)
+        cy = int(alto * p['centro_y'] / 100.0)
+
+        radio_max = np.sqrt(
+            max(cx**2 + cy**2,
+                (ancho - cx)**2 + cy**2,
+                cx**2 + (alto - cy)**2,
+                (ancho - cx)**2 + (alto - cy)**2)
+        )
+
+        # Con teselado adaptativo el anillo exterior marca el tramo de arco más largo
+        segmentos_exterior = NUM_SEGMENTOS
+        if p['tolerancia_cuerda'] is not None:
+            segmentos_exterior = int(segmentos_por_tolerancia(radio_max, p['tolerancia_cuerda'] * ancho / ancho_mm))
+
+        escala_trabajo = 1.0
+        if p['reducir_imagen']:
+            escala_trabajo = calcular_escala_trabajo(ancho, ancho_mm, radio_max, p['num_lineas'], segmentos_exterior)
+
+        return dict(ancho=ancho, alto=alto, ancho_mm=ancho_mm, alto_mm=alto_mm, disposicion=disposicion,
+                    cx=cx, cy=cy, radio_max=radio_max, segmentos_exterior=segmentos_exterior,
+                    escala_trabajo=escala_trabajo)
+
+    def calcular_imagen(self):
+        p = self.parametros
+        lienzo = self.obtener('lienzo')
+        proporcion, escala_trabajo = lienzo['disposicion'].proporcion, lienzo['escala_trabajo']
+
+        # La caché en disco se indexa por el contenido de la imagen y los
+        # parámetros de cada etapa: imagen procesada, anillos y geometría unida
+        clave_disco = None
+        imagen_array = None
+        if p['cache_dir'] is not None:
+            clave_disco = clave_cache('imagen', hash_archivo(p['imagen_path']), proporcion, escala_trabajo,
+                                      p['contraste'])
+            entrada = leer_cache(p['cache_dir'], clave_disco)
+            if entrada is not None:
+                self.avisar("Imagen procesada leída de la caché")
+                imagen_array = entrada['imagen']
+
+        if imagen_array is None:
+            with Image.open(p['imagen_path']) as imagen:
+                if escala_trabajo < 1.0:
+                    # Decodificar directamente a la resolución de trabajo
+                    imagen = cargar_imagen_trabajo(imagen, proporcion, escala_trabajo)
+                else:
+                    if imagen.mode != 'L':
+                        imagen = imagen.convert('L')
+
+                    # Ajustar proporción de la imagen mediante crop centrado
+                    imagen = ajustar_proporcion_imagen(imagen, proporcion)
+
+                # Ajustar contraste
+                if p['contraste'] != 50:
+                    self.avisar(f"Ajustando contraste: {p['contraste']}")
+                    imagen = ajustar_contraste(imagen, p['contraste'])
+
+                imagen_array = np.array(imagen)
+
+            if p['cache_dir'] is not None:
+                guardar_cache(p['cache_dir'], clave_disco, self.limite_cache(), imagen=imagen_array)
+
+        # Trabajar con la imagen (ya con proporción ajustada)
+        # La pirámide solo la usa el muestreo bilineal; los demás modos leen el nivel base
+        niveles_piramide = NIVELES_PIRAMIDE if p['modo_muestreo'] == 'bilineal' else 1
+        return dict(piramide=construir_piramide(imagen_array, niveles=niveles_piramide), clave_cache=clave_disco)
+
+    def calcular_curvas(self):
+        p = self.parametros
+        return crear_familia(
+            self.obtener('lienzo'), p['num_lineas'], p['curvas'], p['proporcion_elipse'], p['rotacion_elipse'],
+            p['espaciado_curvas'], piramide=self.obtener('imagen')['piramide']
+        )
+
+    def calcular_muestras(self):
+        # Se muestrean todas las curvas: el descarte depende del grosor
+        # máximo y se hace en la etapa siguiente
+        lienzo = self.obtener('lienzo')
+        parametros = self.parametros_anillos()
+        familia = self.obtener('curvas')
+        muestras = muestrear_anillos(
+            self.obtener('imagen')['piramide'], lienzo['ancho'], lienzo['alto'], lienzo['cx'], lienzo['cy'],
+            familia, parametros['num_segmentos'], parametros['grosor_max'],
+            modo_muestreo=parametros['modo_muestreo'], ventana_suavizado=parametros['ventana_suavizado'],
+            tolerancia_cuerda=parametros['tolerancia_cuerda']
+        )
+        return familia, muestras
+
+    def calcular_grosores(self):
+        lienzo = self.obtener('lienzo')
+        familia, muestras = self.obtener('muestras')
+        grosor_min, grosor_max = self.parametros['grosor_min'], self.parametros['grosor_max']
+
+        # Descarte de los círculos que no tocan el canvas
+        validos = [
+            k for k in range(len(familia))
+            if circulo_intersecta_canvas(lienzo['cx'], lienzo['cy'], familia.radios_max[k], grosor_max,
+                                         lienzo['ancho'], lienzo['alto'])
+        ]
+        tramos_anillos = aplicar_grosores([muestras[k] for k in validos], familia[validos], grosor_min, grosor_max)
+        return validos, tramos_anillos
+
+    def calcular_poligonos(self):
+        p = self.parametros
+        lienzo = self.obtener('lienzo')
+        ancho, alto, cx, cy = lienzo['ancho'], lienzo['alto'], lienzo['cx'], lienzo['cy']
+        parametros = self.parametros_anillos()
+
+        clave_disco = None
+        if p['cache_dir'] is not None:
+            clave_disco = clave_cache('anillos', self.obtener('imagen')['clave_cache'], p['num_lineas'], cx, cy,
+                                      sorted(parametros.items()), p['curvas'], p['proporcion_elipse'],
+                                      p['rotacion_elipse'], p['espaciado_curvas'])
+            entrada = leer_cache(p['cache_dir'], clave_disco)
+            if entrada is not None:
+                self.avisar("Anillos leídos de la caché")
+                return geometrias_de_cache(entrada) + (clave_disco,)
+
+        if p['workers'] > 1:
+            # Los procesos muestrean y construyen cada bloque de anillos a la vez
+            self.avisar(f"Repartiendo los círculos entre {p['workers']} procesos...")
+            poligonos_anillos, estadisticas = construir_anillos_en_paralelo(
+                self.obtener('imagen')['piramide'], ancho, alto, cx, cy, self.obtener('curvas'), p['workers'],
+                progreso=self.avisar, **parametros
+            )
+        else:
+            validos, tramos_anillos = self.obtener('grosores')
+            poligonos_anillos, estadisticas = construir_poligonos(
+                tramos_anillos, validos, cx, cy, ancho, alto,
+                parametros['tolerancia_simplificacion'], num_lineas=p['num_lineas'], progreso=self.avisar
+            )
+            estadisticas['circulos_descartados'] += p['num_lineas'] - len(validos)
+
+        if p['cache_dir'] is not None:
+            guardar_cache(p['cache_dir'], clave_disco, self.limite_cache(),
+                          **geometrias_a_cache(poligonos_anillos, estadisticas))
+
+        return poligonos_anillos, estadisticas, clave_disco
+
+    def calcular_union(self):
+        p = self.parametros
+        lienzo = self.obtener('lienzo')
+        poligonos_anillos, estadisticas, clave_anillos = self.obtener('poligonos')
+
+        clave_disco = None
+        if p['cache_dir'] is not None:
+            clave_disco = clave_cache('geometria', clave_anillos, p['dividir_paneles'], lienzo['disposicion'])
+            entrada = leer_cache(p['cache_dir'], clave_disco)
+            if entrada is not None:
+                self.avisar("Geometría unida leída de la caché")
+                (geometria_completa,), estadisticas = geometrias_de_cache(entrada)
+                return geometria_completa, estadisticas
+
+        tiras = crear_tiras(lienzo['ancho'], lienzo['alto'], lienzo['ancho'] / lienzo['ancho_mm'],
+                            lienzo['disposicion'], p['dividir_paneles'])
+
+        # UNIÓN BOOLEANA FINAL
+        self.avisar("Realizando unión booleana final...")
+        geometria_completa = unir_anillos(lienzo['cx'], lienzo['cy'], poligonos_anillos, tiras)
+        self.avisar("✓ Unión booleana exitosa")
+
+        # Vértices que entran y salen de la unión
+        estadisticas = dict(
+            estadisticas,
+            vertices_union_entrada=int(shapely.get_num_coordinates(poligonos_anillos + tiras).sum()),
+            vertices_union_salida=int(shapely.get_num_coordinates(geometria_completa))
+        )
+
+        if p['cache_dir'] is not None:
+            guardar_cache(p['cache_dir'], clave_disco, self.limite_cache(),
+                          **geometrias_a_cache([geometria_completa], estadisticas))
+
+        return geometria_completa, estadisticas
+
+    def calcular_paneles(self):
+        lienzo = self.obtener('lienzo')
+        geometria_completa, _ = self.obtener('union')
+        if not self.parametros['dividir_paneles']:
+            return []
+
+        # Cada panel solo recorta las partes que lo tocan (índice espacial) y
+        # se recortan en paralelo; GEOS libera el GIL
+        disposicion = lienzo['disposicion']
+        rectangulos = disposicion.rectangulos_paneles(lienzo['ancho'] / lienzo['ancho_mm'])
+        indice = indexar_geometria(geometria_completa)
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor() as pool:
+            geometrias = list(pool.map(lambda rect: recortar_panel(indice, *rect), rectangulos))
+
+        return [
+            PanelCircular(numero=k + 1, x_min=x_min, y_min=y_min, ancho=ancho_panel, alto=alto_panel,
+                          ancho_mm=disposicion.panel_ancho_mm, alto_mm=disposicion.panel_alto_mm,
+                          geometria=geometria)
+            for k, ((x_min, y_min, ancho_panel, alto_panel), geometria) in enumerate(zip(rectangulos, geometrias))
+        ]
+
+    def limite_cache(self):
+        return int(self.parametros['cache_mb'] * 1024 * 1024)
+
+
+def rasterizar_anillos(ancho, alto, cx, cy, familia, grosores, grosor_max, escala, disposicion,
+                       escala_pixel_a_mm, dividir_paneles=True):
+    """
+    Rasteriza los anillos, el marco y los separadores sin operaciones booleanas.
+
+    `grosores` es la matriz de grosores de calcular_anillos (curvas ×
+    segmentos) y `escala` los píxeles del canvas por píxel de la vista
+    previa. Cada píxel es tinta si su distancia radial a alguna curva cercana
+    es menor que la mitad del grosor interpolado en su ángulo. Devuelve un
+    array booleano (alto × ancho de la vista previa).
+    """
+    num_anillos = len(familia)
+    num_segmentos = grosores.shape[1] - (0 if familia.cerradas else 1)
+    espaciado = familia.espaciados.min() * familia.forma(np.linspace(0, 2 * np.pi, 360)).min()
+    ancho_px = max(1, int(round(ancho / escala)))
+    alto_px = max(1, int(round(alto / escala)))
+
+    xs = (np.arange(ancho_px) + 0.5) * escala
+    ys = (np.arange(alto_px) + 0.5) * escala
+
+    # Anillos que pueden cubrir un píxel además del más cercano
+    vecinos = int(np.ceil(grosor_max / 2 / espaciado)) + 1
+
+    tinta = np.zeros((alto_px, ancho_px), dtype=bool)
+    for inicio in range(0, alto_px, 256):
+        # Por bandas de filas para acotar la memoria
+        dy = ys[inicio:inicio + 256, np.newaxis] - cy
+        dx = xs[np.newaxis, :] - cx
+        r = np.hypot(dx, dy)
+
+        angulo = np.arctan2(dy, dx) % (2 * np.pi)
+        posicion = angulo * num_segmentos / (2 * np.pi)
+        j0 = np.floor(posicion).astype(np.intp) % num_segmentos
+        j1 = (j0 + 1) % num_segmentos if familia.cerradas else j0 + 1
+        fraccion = posicion - np.floor(posicion)
+
+        # Curva más cercana según la escala que tendría la que pasa por el píxel
+        forma = familia.forma(angulo)
+        cercano = np.searchsorted(familia.escalas, (r - familia.paso * angulo / (2 * np.pi)) / forma)
+        banda = tinta[inicio:inicio + 256]
+        for desplazamiento in range(-vecinos, vecinos + 1):
+            k = np.clip(cercano + desplazamiento, 0, num_anillos - 1)
+            grosor = grosores[k, j0] * (1 - fraccion) + grosores[k, j1] * fraccion
+            radio = familia.escalas[k] * forma + familia.paso * angulo / (2 * np.pi)
+            banda |= np.abs(r - radio) <= grosor / 2
+
+    # Marco y separadores con las mismas medidas que el vector
+    marco = disposicion.marco_mm * escala_pixel_a_mm
+    tinta[:, (xs < marco) | (xs > ancho - marco)] = True
+    tinta[(ys < marco) | (ys > alto - marco), :] = True
+
+    if dividir_paneles:
+        media_linea = disposicion.separador_mm * escala_pixel_a_mm / 2
+        for col in range(1, disposicion.cols):
+            tinta[:, np.abs(xs - col * disposicion.panel_ancho_mm * escala_pixel_a_mm) <= media_linea] = True
+        for row in range(1, disposicion.rows):
+            tinta[np.abs(ys - row * disposicion.panel_alto_mm * escala_pixel_a_mm) <= media_linea, :] = True
+
+    return tinta
+
+
+def generar_preview(imagen_path, num_lineas, grosor_min, grosor_max, contraste, centro_x, centro_y, preview_path,
+                    dividir_paneles=True, modo_muestreo='cercano', ventana_suavizado=1, reducir_imagen=False,
+                    paneles=None, panel_mm=PANEL_SIZE_MM, marco_mm=MARCO_WIDTH_MM,
+                    separador_mm=LINEA_SEPARADORA_MM, curvas='circulos', proporcion_elipse=PROPORCION_ELIPSE,
+                    rotacion_elipse=0.0, espaciado_curvas='uniforme', ancho_px=PREVIEW_ANCHO_PX, pipeline=None,
+                    progreso=print):
+    """
+    Vista previa rápida en PNG: muestrea la imagen igual que la versión
+    vectorial (teselado fijo) y rasteriza los anillos con NumPy, sin Shapely.
+    """
+    if pipeline is None:
+        pipeline = PipelineCircular()
+    pipeline.configurar(
+        imagen_path=imagen_path, num_lineas=num_lineas, contraste=contraste, centro_x=centro_x,
+        centro_y=centro_y, modo_muestreo=modo_muestreo, reducir_imagen=reducir_imagen,
+        tolerancia_cuerda=None, paneles=paneles, panel_mm=panel_mm, marco_mm=marco_mm, separador_mm=separador_mm,
+        curvas=curvas, proporcion_elipse=proporcion_elipse, rotacion_elipse=rotacion_elipse,
+        espaciado_curvas=espaciado_curvas, cache_dir=None, cache_mb=TAMANO_CACHE_MB
+    )
+
+    progreso(f"Cargando imagen: {imagen_path}")
+    lienzo = pipeline.obtener('lienzo')
+    ancho, alto, cx, cy = lienzo['ancho'], lienzo['alto'], lienzo['cx'], lienzo['cy']
+
+    familia = pipeline.obtener('curvas')
+    intensidades = calcular_anillos(
+        pipeline.obtener('imagen')['piramide'], ancho, alto, cx, cy, familia, NUM_SEGMENTOS,
+        modo_muestreo=modo_muestreo, ventana_suavizado=ventana_suavizado
+    )
+    grosores = grosor_min + (grosor_max - grosor_min) * (1.0 - intensidades / 255.0)
+
+    escala = ancho / ancho_px
+    tinta = rasterizar_anillos(
+        ancho, alto, cx, cy, familia, grosores, grosor_max, escala, lienzo['disposicion'],
+        ancho / lienzo['ancho_mm'], dividir_paneles=dividir_paneles
+    )
+
+    Image.fromarray(np.where(tinta, 0, 255).astype(np.uint8)).save(preview_path)
+    progreso(f"✓ Vista previa guardada: {preview_path} ({tinta.shape[1]}x{tinta.shape[0]} píxeles)")
+
+
+class RenderizadorCircular:
+    """
+    API de librería: genera la geometría sin escribir nada ni imprimir.
+
+    `render` devuelve un ResultadoCircular; los mensajes de avance van a la
+    función `progreso` (por ejemplo `print`) si se indica. Llamadas
+    sucesivas sobre el mismo renderizador reutilizan las etapas del pipeline
+    que no dependen de los parámetros cambiados.
+
+        renderizador = RenderizadorCircular()
+        resultado = renderizador.render('foto.jpg', num_lineas=150)
+        resultado.guardar('foto.svg')
+
+    Con `guardar_panel` el diseño se genera panel a panel: cada panel se
+    construye por separado, se pasa a `guardar_panel` y se descarta, así que
+    la memoria depende del tamaño del panel y no del diseño completo. El
+    resultado no tiene entonces geometría completa.
+    """
+
+    def __init__(self, progreso=None, pipeline=None):
+        self.pipeline = pipeline if pipeline is not None else PipelineCircular()
+        self.progreso = progreso
+
+    def avisar(self, mensaje):
+        if self.progreso:
+            self.progreso(mensaje)
+
+    def render(self, imagen_path, num_lineas=120, grosor_min=6.0, grosor_max=16.0, contraste=75.0,
+               centro_x=-20.0, centro_y=50.0, dividir_paneles=True, modo_muestreo='cercano', ventana_suavizado=1,
+               reducir_imagen=False, tolerancia_cuerda=None, tolerancia_simplificacion=TOLERANCIA_SIMPLIFICACION_MM,
+               workers=1, paneles=None, panel_mm=PANEL_SIZE_MM, marco_mm=MARCO_WIDTH_MM,
+               separador_mm=LINEA_SEPARADORA_MM, curvas='circulos', proporcion_elipse=PROPORCION_ELIPSE,
+               rotacion_elipse=0.0, espaciado_curvas='uniforme', cache_dir=None, cache_mb=TAMANO_CACHE_MB,
+               guardar_panel=None):
+        if guardar_panel is not None and not dividir_paneles:
+            raise ValueError("La generación panel a panel necesita dividir en paneles")
+        if curvas not in FAMILIAS_CURVAS:
+            raise ValueError(f"Familia de curvas desconocida: {curvas}")
+        if espaciado_curvas not in ESPACIADOS_CURVAS:
+            raise ValueError(f"Espaciado de curvas desconocido: {espaciado_curvas}")
+        if curvas == 'espiral' and espaciado_curvas != 'uniforme':
+            raise ValueError("La espiral solo admite espaciado uniforme")
+        if proporcion_elipse <= 0:
+            raise ValueError("La proporción de las elipses debe ser mayor que 0")
+
+        pipeline = self.pipeline
+        pipeline.progreso = self.progreso
+        pipeline.perfil = {}
+        pipeline.configurar(
+            imagen_path=imagen_path, num_lineas=num_lineas, grosor_min=grosor_min, grosor_max=grosor_max,
+            contraste=contraste, centro_x=centro_x, centro_y=centro_y, dividir_paneles=dividir_paneles,
+            modo_muestreo=modo_muestreo, ventana_suavizado=ventana_suavizado, reducir_imagen=reducir_imagen,
+            tolerancia_cuerda=tolerancia_cuerda, tolerancia_simplificacion=tolerancia_simplificacion,
+            workers=workers, paneles=paneles, panel_mm=panel_mm, marco_mm=marco_mm, separador_mm=separador_mm,
+            curvas=curvas, proporcion_elipse=proporcion_elipse, rotacion_elipse=rotacion_elipse,
+            espaciado_curvas=espaciado_curvas, cache_dir=cache_dir, cache_mb=cache_mb
+        )
+
+        self.avisar(f"Cargando imagen: {imagen_path}")
+        lienzo = pipeline.obtener('lienzo')
+        ancho, alto = lienzo['ancho'], lienzo['alto']
+        ancho_mm, alto_mm = lienzo['ancho_mm'], lienzo['alto_mm']
+        disposicion = lienzo['disposicion']
+        cols, rows = disposicion.cols, disposicion.rows
+        cx, cy = lienzo['cx'], lienzo['cy']
+
+        piramide = pipeline.obtener('imagen')['piramide']
+
+        if guardar_panel is not None:
+            self.avisar(f"Modo: {disposicion.num_paneles} paneles, uno cada vez (sin archivo completo)")
+        else:
+            self.avisar(f"Modo: {f'Archivo completo + {disposicion.num_paneles} paneles' if dividir_paneles else 'Solo archivo completo'}")
+        if paneles is None:
+            self.avisar(f"Orientación detectada: {'Horizontal' if cols > rows else 'Vertical'}")
+        self.avisar(f"Disposición de paneles: {cols}x{rows}")
+        if (disposicion.panel_ancho_mm, disposicion.panel_alto_mm) != (PANEL_SIZE_MM, PANEL_SIZE_MM):
+            self.avisar(f"Tamaño de panel: {disposicion.panel_ancho_mm}mm x {disposicion.panel_alto_mm}mm")
+        self.avisar(f"Dimensiones físicas totales: {round(ancho_mm, 2)}mm x {round(alto_mm, 2)}mm")
+        self.avisar(f"Marco: {disposicion.marco_mm}mm")
+
+        self.avisar(f"Dimensiones canvas: {ancho}x{alto} píxeles")
+        self.avisar(f"Resolución de trabajo: {piramide[0].shape[1]}x{piramide[0].shape[0]} píxeles "
+                    f"({len(piramide)} niveles de pirámide)")
+        self.avisar(f"Centro: ({cx}, {cy})")
+
+        self.avisar(f"Muestreo: {modo_muestreo} (suavizado: {ventana_suavizado})")
+        if tolerancia_cuerda is None:
+            self.avisar(f"Teselado: {NUM_SEGMENTOS} segmentos por círculo")
+        else:
+            self.avisar(f"Teselado adaptativo: error de cuerda máximo {tolerancia_cuerda}mm "
+                        f"(hasta {lienzo['segmentos_exterior']} segmentos por círculo, solo arcos visibles)")
+        if curvas == 'espiral':
+            self.avisar(f"Generando una espiral de {num_lineas} vueltas con grosor variable...")
+        elif curvas == 'elipses':
+            self.avisar(f"Generando {num_lineas} elipses (proporción {proporcion_elipse}, "
+                        f"rotación {rotacion_elipse}°) con grosor variable...")
+        else:
+            self.avisar(f"Generando {num_lineas} círculos con grosor variable...")
+        if espaciado_curvas == 'detalle':
+            self.avisar("Espaciado según el detalle de la imagen")
+
+        # Calcular escala píxel a mm
+        escala_pixel_a_mm = ancho / ancho_mm
+        marco_width_pixels = disposicion.marco_mm * escala_pixel_a_mm
+
+        self.avisar(f"Escala: {escala_pixel_a_mm:.2f} píxeles/mm")
+        self.avisar(f"Ancho del marco: {marco_width_pixels:.2f} píxeles ({disposicion.marco_mm}mm)")
+        if dividir_paneles and disposicion.num_paneles > 1 and disposicion.separador_mm > 0:
+            linea_sep_pixels = disposicion.separador_mm * escala_pixel_a_mm
+            self.avisar(f"Ancho líneas separadoras: {linea_sep_pixels:.2f} píxeles ({disposicion.separador_mm}mm)")
+            self.avisar(f"Líneas separadoras: {cols - 1} verticales + {rows - 1} horizontales")
+
+        if guardar_panel is not None:
+            return self.render_por_paneles(lienzo, guardar_panel)
+
+        # Anillos, unión con el marco y los separadores, y recorte de los paneles
+        geometria_completa, estadisticas = pipeline.obtener('union')
+        paneles = pipeline.obtener('paneles')
+
+        return ResultadoCircular(
+            geometria=geometria_completa, paneles=paneles, estadisticas=estadisticas,
+            tiempos={etapa: medida['segundos'] for etapa, medida in pipeline.perfil.items()},
+            perfil=dict(pipeline.perfil), ancho=ancho, alto=alto, ancho_mm=ancho_mm, alto_mm=alto_mm,
+            disposicion=disposicion, parametros=dict(pipeline.parametros)
+        )
+
+    def render_por_paneles(self, lienzo, guardar_panel):
+        """
+        Construye cada panel solo con los anillos que lo cruzan y lo entrega a
+        `guardar_panel` antes de pasar al siguiente.
+        """
+        pipeline = self.pipeline
+        p = pipeline.parametros
+        ancho, alto, cx, cy = lienzo['ancho'], lienzo['alto'], lienzo['cx'], lienzo['cy']
+        disposicion = lienzo['disposicion']
+        escala_pixel_a_mm = ancho / lienzo['ancho_mm']
+
+        # Las muestras de intensidad (polares) son compactas y se comparten;
+        # la geometría solo existe panel a panel
+        familia, muestras = pipeline.obtener('muestras')
+        tolerancia_simplificacion = pipeline.parametros_anillos()['tolerancia_simplificacion']
+        tiras = crear_tiras(ancho, alto, escala_pixel_a_mm, disposicion, p['dividir_paneles'])
+
+        self.avisar(f"\nGenerando {disposicion.num_paneles} paneles, uno cada vez...")
+        paneles = []
+        lista_estadisticas = []
+        with medir_etapa(pipeline.perfil, 'paneles'):
+            for numero, rect in enumerate(disposicion.rectangulos_paneles(escala_pixel_a_mm), 1):
+                geometria, estadisticas = construir_panel(
+                    muestras, familia, cx, cy, rect, tiras, p['grosor_min'], p['grosor_max'],
+                    tolerancia_simplificacion
+                )
+                x_min, y_min, ancho_panel, alto_panel = rect
+                panel = PanelCircular(numero=numero, x_min=x_min, y_min=y_min, ancho=ancho_panel, alto=alto_panel,
+                                      ancho_mm=disposicion.panel_ancho_mm, alto_mm=disposicion.panel_alto_mm,
+                                      geometria=geometria)
+                guardar_panel(panel)
+
+                # El panel ya está guardado: se conserva sin geometría
+                panel.geometria = None
+                paneles.append(panel)
+                lista_estadisticas.append(estadisticas)
+
+        # Los puntos y vértices se suman por panel; los círculos se clasifican
+        # con el canvas completo (un círculo cruza varios paneles), igual que
+        # en el diseño completo: se construyen por bloques y sus polígonos se
+        # descartan
+        estadisticas = sumar_estadisticas(lista_estadisticas)
+        estadisticas['vertices_por_anillo'] = []
+        with medir_etapa(pipeline.perfil, 'clasificacion'):
+            validos, tramos_anillos = pipeline.obtener('grosores')
+            clasificacion = sumar_estadisticas([
+                construir_poligonos(tramos_anillos[inicio:inicio + ANILLOS_POR_BLOQUE],
+                                    validos[inicio:inicio + ANILLOS_POR_BLOQUE], cx, cy, ancho, alto,
+                                    tolerancia_simplificacion)[1]
+                for inicio in range(0, len(validos), ANILLOS_POR_BLOQUE)
+            ])
+        estadisticas['circulos_completos'] = clasificacion['circulos_completos']
+        estadisticas['circulos_cortados'] = clasificacion['circulos_cortados']
+        estadisticas['circulos_descartados'] = clasificacion['circulos_descartados'] + p['num_lineas'] - len(validos)
+
+        return ResultadoCircular(
+            geometria=None, paneles=paneles, estadisticas=estadisticas,
+            tiempos={etapa: medida['segundos'] for etapa, medida in pipeline.perfil.items()},
+            perfil=dict(pipeline.perfil), ancho=ancho, alto=alto, ancho_mm=lienzo['ancho_mm'],
+            alto_mm=lienzo['alto_mm'], disposicion=disposicion, parametros=dict(pipeline.parametros)
+        )
+
+
+def generar_svg_circular(imagen_path, num_lineas, grosor_min, grosor_max, contraste, centro_x, centro_y, output_path, dividir_paneles=True,
+                         modo_muestreo='cercano', ventana_suavizado=1, reducir_imagen=False,
+                         tolerancia_cuerda=None, tolerancia_simplificacion=TOLERANCIA_SIMPLIFICACION_MM, workers=1,
+                         precision=2, relativo=False, path_por_poligono=False, formato=None,
+                         altura_mm=ALTURA_EXTRUSION_MM, paneles=None, panel_mm=PANEL_SIZE_MM, marco_mm=MARCO_WIDTH_MM,
+                         separador_mm=LINEA_SEPARADORA_MM, curvas='circulos', proporcion_elipse=PROPORCION_ELIPSE,
+                         rotacion_elipse=0.0, espaciado_curvas='uniforme', cache_dir=None, cache_mb=TAMANO_CACHE_MB,
+                         pipeline=None, por_paneles=False, progreso=print):
+    """
+    Genera y guarda el diseño mostrando el avance por pantalla (uso desde la
+    línea de comandos), o pasándolo a `progreso`. Devuelve el
+    ResultadoCircular, con los archivos escritos en `rutas`.
+
+    Con `por_paneles` se genera y guarda un panel cada vez, sin el archivo
+    completo.
+    """
+    if formato is None:
+        formato = formato_de_archivo(output_path)
+
+    rutas = []
+    if por_paneles:
+        panels_dir = os.path.splitext(output_path)[0]
+        os.makedirs(panels_dir, exist_ok=True)
+        exportador, opciones = exportador_de(formato, precision, relativo, path_por_poligono, altura_mm)
+
+    def guardar_panel(panel):
+        panel_path = escribir_panel(panel, panels_dir, formato, exportador, opciones)
+        if panel_path is None:
+            progreso(f"  ⚠ Panel {panel.numero} vacío (omitido)")
+        else:
+            rutas.append(panel_path)
+            progreso(f"  ✓ Panel {panel.numero}: {panel_path}")
+
+    # Pasando el mismo pipeline en llamadas sucesivas solo se recalculan las
+    # etapas que dependen de los parámetros que han cambiado
+    renderizador = RenderizadorCircular(progreso=progreso, pipeline=pipeline)
+    resultado = renderizador.render(
+        imagen_path, num_lineas, grosor_min, grosor_max, contraste, centro_x, centro_y,
+        dividir_paneles=dividir_paneles, modo_muestreo=modo_muestreo, ventana_suavizado=ventana_suavizado,
+        reducir_imagen=reducir_imagen, tolerancia_cuerda=tolerancia_cuerda,
+        tolerancia_simplificacion=tolerancia_simplificacion, workers=workers, paneles=paneles, panel_mm=panel_mm,
+        marco_mm=marco_mm, separador_mm=separador_mm, curvas=curvas, proporcion_elipse=proporcion_elipse,
+        rotacion_elipse=rotacion_elipse, espaciado_curvas=espaciado_curvas, cache_dir=cache_dir, cache_mb=cache_mb,
+        guardar_panel=guardar_panel if por_paneles else None
+    )
+    if por_paneles:
+        resultado.rutas = rutas
+        imprimir_estadisticas(resultado.estadisticas, progreso)
+        progreso(f"\n✓ Generación completa (panel a panel)!")
+        progreso(f"✓ {len(rutas)} archivos {formato.upper()} en: {panels_dir}/")
+        return resultado
+
+    rutas = resultado.guardar(output_path, formato=formato, precision=precision, relativo=relativo,
+                              path_por_poligono=path_por_poligono, altura_mm=altura_mm, progreso=progreso)
+
+    # Si no dividir paneles, terminar aquí
+    if not dividir_paneles:
+        progreso(f"\n✓ Generación completa (archivo único)")
+        # Estadísticas
+        imprimir_estadisticas(resultado.estadisticas, progreso)
+        return resultado
+
+    # Estadísticas
+    imprimir_estadisticas(resultado.estadisticas, progreso)
+
+    progreso(f"\n✓ Generación completa!")
+    progreso(f"✓ 1 archivo completo: {output_path}")
+    progreso(f"✓ {len(rutas) - 1} archivos {formato.upper()} en: {os.path.splitext(output_path)[0]}/")
+    return resultado
+
+
+# VALIDACIÓN DE PARÁMETROS
+
+# Parámetros de generar_svg_circular que deben ser enteros, números o uno de
+# unos valores dados
+PARAMETROS_ENTEROS = ('num_lineas', 'ventana_suavizado', 'workers', 'precision')
+PARAMETROS_NUMERICOS = (
+    'grosor_min', 'grosor_max', 'contraste', 'centro_x', 'centro_y', 'marco_mm', 'separador_mm', 'altura_mm',
+    'proporcion_elipse', 'rotacion_elipse', 'tolerancia_simplificacion', 'cache_mb'
+)
+PARAMETROS_OPCIONES = {
+    'modo_muestreo': MODOS_MUESTREO, 'curvas': FAMILIAS_CURVAS, 'espaciado_curvas': ESPACIADOS_CURVAS,
+    'formato': (None,) + tuple(FORMATOS),
+}
+
+
+def es_numero(valor):
+    return isinstance(valor, (int, float)) and not isinstance(valor, bool)
+
+
+def validar_parametros(p):
+    """
+    Comprueba los parámetros de generar_svg_circular (los de la línea de
+    comandos, o los de un trabajo de un lote o del servidor) y lanza
+    ValueError con el primer problema que encuentra.
+    """
+    for clave in PARAMETROS_ENTEROS:
+        if clave in p and not (isinstance(p[clave], int) and not isinstance(p[clave], bool)):
+            raise ValueError(f"El parámetro '{clave}' debe ser un número entero: {p[clave]!r}")
+    for clave in PARAMETROS_NUMERICOS:
+        if clave in p and not es_numero(p[clave]):
+            raise ValueError(f"El parámetro '{clave}' debe ser un número: {p[clave]!r}")
+    if p.get('tolerancia_cuerda') is not None and not es_numero(p['tolerancia_cuerda']):
+        raise ValueError(f"El parámetro 'tolerancia_cuerda' debe ser un número: {p['tolerancia_cuerda']!r}")
+    for clave, opciones in PARAMETROS_OPCIONES.items():
+        if clave in p and p[clave] not in opciones:
+            raise ValueError(f"Valor no válido para '{clave}': {p[clave]!r}")
+
+    if p.get('num_lineas', 1) < 1:
+        raise ValueError("El número de líneas debe ser al menos 1")
+    grosor_min, grosor_max = p.get('grosor_min', 0), p.get('grosor_max', 0)
+    if grosor_min < 0 or grosor_max < 0:
+        raise ValueError("Los grosores no pueden ser negativos")
+    if grosor_min > grosor_max:
+        raise ValueError("El grosor mínimo no puede ser mayor que el máximo")
+    if p.get('tolerancia_cuerda') is not None and p['tolerancia_cuerda'] <= 0:
+        raise ValueError("La tolerancia de cuerda debe ser mayor que 0")
+    if p.get('tolerancia_simplificacion', 0) < 0:
+        raise ValueError("La tolerancia de simplificación no puede ser negativa")
+    if p.get('precision', 0) < 0:
+        raise ValueError("La precisión no puede ser negativa")
+    if p.get('cache_mb', 1) <= 0:
+        raise ValueError("El tamaño de la caché debe ser mayor que 0")
+    if p.get('workers', 1) < 1:
+        raise ValueError("El número de procesos debe ser al menos 1")
+    if p.get('ventana_suavizado', 1) < 1:
+        raise ValueError("La ventana de suavizado debe ser al menos 1")
+
+    try:
+        panel_mm = leer_medidas(p.get('panel_mm', PANEL_SIZE_MM))
+        paneles = None if p.get('paneles') is None else leer_medidas(p['paneles'])
+        if not all(es_numero(n) for n in panel_mm + (paneles or ())):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ValueError("Las medidas de los paneles deben tener la forma N o AxB") from None
+    if min(panel_mm) <= 0:
+        raise ValueError("El tamaño de panel debe ser mayor que 0")
+    if paneles is not None and any(n != int(n) or n < 1 for n in paneles):
+        raise ValueError("La cuadrícula de paneles debe ser de números enteros positivos (p. ej. 4x3)")
+
+    if p.get('por_paneles') and not p.get('dividir_paneles', True):
+        raise ValueError("--por-paneles no se puede combinar con --no-dividir")
+    if p.get('marco_mm', 0) < 0 or p.get('separador_mm', 0) < 0:
+        raise ValueError("El marco y los separadores no pueden ser negativos")
+    if p.get('altura_mm', 1) <= 0:
+        raise ValueError("La altura de la extrusión debe ser mayor que 0")
+    if p.get('proporcion_elipse', 1) <= 0:
+        raise ValueError("La proporción de las elipses debe ser mayor que 0")
+    if p.get('curvas') == 'espiral' and p.get('espaciado_curvas', 'uniforme') != 'uniforme':
+        raise ValueError("La espiral solo admite espaciado uniforme")
+
+
+# PROCESAMIENTO POR LOTES
+
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+
+
+def es_lote(ruta):
+    """Una carpeta o un manifiesto JSON/CSV se procesan por lotes."""
+    return os.path.isdir(ruta) or ruta.lower().endswith(('.json', '.csv'))
+
+
+def convertir_parametro(valor, referencia):
+    """Convierte un valor de texto (CSV) al tipo del parámetro por defecto."""
+    if not isinstance(valor, str):
+        return valor
+    if isinstance(referencia, bool):
+        return valor.strip().lower() in ('1', 'true', 'si', 'sí', 'yes')
+    if isinstance(referencia, int):
+        return int(valor)
+    if isinstance(referencia, float):
+        return float(valor)
+    if referencia is None:
+        try:
+            return float(valor)
+        except ValueError:
+            return valor
+    return valor
+
+
+def leer_trabajos(origen, directorio_salida, parametros_base):
+    """
+    Trabajos (argumentos de generar_svg_circular) de un lote y registros de
+    error de las entradas que no se pueden leer.
+
+    El origen es una carpeta de imágenes (todas con los parámetros base) o un
+    manifiesto JSON (lista de objetos) o CSV (con cabecera). Cada entrada
+    lleva `imagen`, opcionalmente `salida` y cualquier parámetro de
+    generar_svg_circular que cambie respecto a los base. Una entrada con un
+    valor incorrecto no detiene el lote: queda como registro de error.
+    """
+    formato = parametros_base.get('formato') or 'svg'
+
+    if os.path.isdir(origen):
+        entradas = [
+            {'imagen': nombre}
+            for nombre in sorted(os.listdir(origen))
+            if nombre.lower().endswith(EXTENSIONES_IMAGEN)
+        ]
+        base = origen
+    else:
+        with open(origen, newline='') as f:
+            if origen.lower().endswith('.json'):
+                entradas = json.load(f)
+            else:
+                entradas = list(csv.DictReader(f))
+        base = os.path.dirname(origen)
+
+    lista = []
+    errores = []
+    for numero, entrada in enumerate(entradas, 1):
+        try:
+            lista.append(trabajo_de_entrada(entrada, parametros_base, base, directorio_salida, formato))
+        except (ValueError, TypeError) as e:
+            imagen = entrada.get('imagen') if isinstance(entrada, dict) else None
+            errores.append({'imagen': os.path.join(base, imagen) if imagen else f"entrada {numero}",
+                            'salida': None, 'estado': 'error', 'error': f"{type(e).__name__}: {e}"})
+    return lista, errores
+
+
+def trabajo_de_entrada(entrada, parametros_base, base, directorio_salida, formato):
+    """
+    Argumentos de generar_svg_circular para una entrada de un lote o del
+    servidor: `imagen` (relativa a `base`), `salida` (relativa a
+    `directorio_salida`) y los parámetros que cambian respecto a los base.
+    """
+    if not isinstance(entrada, dict):
+        raise ValueError(f"La entrada debe ser un objeto: {entrada!r}")
+    entrada = {clave: valor for clave, valor in entrada.items() if valor not in ('', None)}
+    if 'imagen' not in entrada:
+        raise ValueError(f"Entrada sin 'imagen': {entrada}")
+
+    imagen_path = os.path.join(base, entrada.pop('imagen'))
+    nombre = os.path.splitext(os.path.basename(imagen_path))[0]
+    output_path = entrada.pop('salida', None) or f"{nombre}.{entrada.get('formato') or formato}"
+
+    trabajo = dict(parametros_base)
+    for clave, valor in entrada.items():
+        if clave not in parametros_base:
+            raise ValueError(f"Parámetro desconocido: '{clave}'")
+        trabajo[clave] = convertir_parametro(valor, parametros_base[clave])
+
+    validar_parametros(trabajo)
+
+    trabajo['imagen_path'] = imagen_path
+    trabajo['output_path'] = os.path.join(directorio_salida, output_path)
+    return trabajo
+
+
+def dentro_de(ruta, carpeta):
+    """La ruta, con los enlaces simbólicos resueltos, queda dentro de la carpeta."""
+    carpeta = os.path.realpath(carpeta)
+    return os.path.commonpath([os.path.realpath(ruta), carpeta]) == carpeta
+
+
+def clave_trabajo(trabajo):
+    """Clave de los parámetros de un trabajo (para saber si su salida está al día)."""
+    return clave_cache(sorted(trabajo.items()))
+
+
+def leer_resumen(resumen_path):
+    """Claves de los trabajos terminados con éxito en ejecuciones anteriores, por salida."""
+    terminados = {}
+    if os.path.exists(resumen_path):
+        with open(resumen_path) as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue
+                if registro.get('estado') in ('ok', 'omitido'):
+                    terminados[registro['salida']] = registro.get('clave')
+    return terminados
+
+
+def esta_al_dia(trabajo, clave, terminados):
+    """La salida existe, es posterior a la imagen y se generó con los mismos parámetros."""
+    salida = trabajo['output_path']
+    return (
+        terminados.get(salida) == clave
+        and os.path.exists(salida)
+        and os.path.getmtime(salida) >= os.path.getmtime(trabajo['imagen_path'])
+    )
+
+
+def iniciar_lote(semaforo):
+    """Guarda en el proceso trabajador el semáforo de imágenes grandes."""
+    _trabajador['semaforo'] = semaforo
+
+
+def ejecutar_trabajo(trabajo):
+    """
+    Ejecuta un trabajo del lote en un proceso trabajador, sin su salida por
+    pantalla. Las imágenes grandes esperan su turno en el semáforo para no
+    tener más de K decodificadas a la vez. Devuelve el registro del resumen.
+    """
+    registro = {'imagen': trabajo['imagen_path'], 'salida': trabajo['output_path']}
+    inicio = time.perf_counter()
+    try:
+        with Image.open(trabajo['imagen_path']) as imagen:
+            grande = imagen.size[0] * imagen.size[1] > IMAGEN_GRANDE_MPX * 1e6
+
+        semaforo = _trabajador.get('semaforo') if grande else None
+        if semaforo is not None:
+            semaforo.acquire()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                generar_svg_circular(**trabajo)
+        finally:
+            if semaforo is not None:
+                semaforo.release()
+
+        registro['estado'] = 'ok'
+    except Exception as e:
+        registro['estado'] = 'error'
+        registro['error'] = f"{type(e).__name__}: {e}"
+
+    registro['segundos'] = round(time.perf_counter() - inicio, 3)
+    return registro
+
+
+def procesar_lote(origen, directorio_salida, parametros_base, trabajos=1, max_grandes=2):
+    """
+    Procesa una carpeta o manifiesto de imágenes con un grupo de procesos.
+
+    Los procesos se reutilizan entre trabajos (sin volver a importar numpy,
+    PIL ni Shapely). Cada resultado se añade a `resumen.jsonl` en cuanto
+    termina, y los trabajos cuya salida ya está al día se omiten.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    lista, errores = leer_trabajos(origen, directorio_salida, parametros_base)
+    os.makedirs(directorio_salida, exist_ok=True)
+    resumen_path = os.path.join(directorio_salida, 'resumen.jsonl')
+    terminados = leer_resumen(resumen_path)
+
+    print(f"Lote: {len(lista) + len(errores)} trabajos de {origen} ({trabajos} procesos, "
+          f"máximo {max_grandes} imágenes grandes a la vez)")
+
+    contadores = {'ok': 0, 'error': 0, 'omitido': 0}
+    with open(resumen_path, 'a') as resumen:
+
+        def anotar(registro):
+            contadores[registro['estado']] += 1
+            resumen.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            resumen.flush()
+
+            if registro['estado'] == 'ok':
+                print(f"  ✓ {registro['imagen']} → {registro['salida']} ({registro['segundos']:.1f}s)")
+            elif registro['estado'] == 'omitido':
+                print(f"  = {registro['imagen']} (al día)")
+            else:
+                print(f"  ✗ {registro['imagen']}: {registro['error']}")
+
+        for registro in errores:
+            anotar(registro)
+
+        pendientes = []
+        for trabajo in lista:
+            clave = clave_trabajo(trabajo)
+            if esta_al_dia(trabajo, clave, terminados):
+                anotar({'imagen': trabajo['imagen_path'], 'salida': trabajo['output_path'],
+                        'estado': 'omitido', 'clave': clave})
+            else:
+                pendientes.append((trabajo, clave))
+
+        semaforo = multiprocessing.BoundedSemaphore(max_grandes)
+        with ProcessPoolExecutor(max_workers=trabajos, initializer=iniciar_lote, initargs=(semaforo,)) as pool:
+            futuros = {pool.submit(ejecutar_trabajo, trabajo): (trabajo, clave) for trabajo, clave in pendientes}
+            for futuro in as_completed(futuros):
+                trabajo, clave = futuros[futuro]
+                try:
+                    registro = futuro.result()
+                except Exception as e:
+                    # El proceso trabajador ha muerto (por ejemplo, sin memoria)
+                    registro = {'imagen': trabajo['imagen_path'], 'salida': trabajo['output_path'],
+                                'estado': 'error', 'error': f"{type(e).__name__}: {e}"}
+                registro['clave'] = clave
+                anotar(registro)
+
+    print(f"\n✓ Lote completo: {contadores['ok']} generados, {contadores['omitido']} al día, "
+          f"{contadores['error']} con error")
+    print(f"✓ Resumen: {resumen_path}")
+    return contadores
+
+
+# SERVIDOR DE RENDER
+
+# Parámetros de generar_svg_circular que usa también la vista previa
+PARAMETROS_PREVIEW = (
+    'num_lineas', 'grosor_min', 'grosor_max', 'contraste', 'centro_x', 'centro_y', 'dividir_paneles',
+    'modo_muestreo', 'ventana_suavizado', 'reducir_imagen', 'paneles', 'panel_mm', 'marco_mm', 'separador_mm',
+    'curvas', 'proporcion_elipse', 'rotacion_elipse', 'espaciado_curvas'
+)
+
+
+def iniciar_servidor(cola_eventos):
+    """
+    Prepara un proceso trabajador del servidor: la cola de eventos y un
+    pipeline para vistas previas y otro para renders, que se conservan entre
+    trabajos. Ctrl+C solo lo atiende el proceso principal, que cierra el grupo.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _trabajador['eventos'] = cola_eventos
+    _trabajador['pipelines'] = {'preview': PipelineCircular(), 'render': PipelineCircular()}
+
+
+def ejecutar_trabajo_servidor(trabajo_id, trabajo, preview=False, ancho_px=PREVIEW_ANCHO_PX):
+    """
+    Ejecuta un trabajo del servidor en un proceso trabajador: el diseño, o
+    con `preview` una vista previa PNG de `ancho_px` píxeles. Los mensajes de
+    avance y el registro final (estado, rutas, segundos) se envían como
+    eventos a la cola del servidor. Devuelve el registro final.
+    """
+    cola = _trabajador['eventos']
+    pipelines = _trabajador['pipelines']
+
+    def progreso(mensaje):
+        cola.put((trabajo_id, {'mensaje': str(mensaje)}))
+
+    cola.put((trabajo_id, {'estado': 'en_curso'}))
+    registro = {}
+    inicio = time.perf_counter()
+    try:
+        if preview:
+            generar_preview(
+                trabajo['imagen_path'], preview_path=trabajo['output_path'], ancho_px=ancho_px,
+                pipeline=pipelines['preview'], progreso=progreso, **{nombre: trabajo[nombre] for nombre in PARAMETROS_PREVIEW}
+            )
+            registro['rutas'] = [trabajo['output_path']]
+        else:
+            resultado = generar_svg_circular(**trabajo, pipeline=pipelines['render'], progreso=progreso)
+            registro['rutas'] = resultado.rutas
+            registro['tiempos'] = {etapa: round(segundos, 4) for etapa, segundos in resultado.tiempos.items()}
+        registro['estado'] = 'ok'
+    except Exception as e:
+        registro['estado'] = 'error'
+        registro['error'] = f"{type(e).__name__}: {e}"
+
+    registro['segundos'] = round(time.perf_counter() - inicio, 3)
+    cola.put((trabajo_id, registro))
+    return registro
+
+
+class ServidorRender:
+    """
+    Cola de trabajos del servidor de render.
+
+    Los trabajos (imagen y parámetros, como una entrada de un lote) se
+    reparten entre `trabajos` procesos calientes: numpy, PIL y Shapely ya
+    importados y sus pipelines en memoria, así que un trabajo que solo cambia
+    el grosor o el formato reutiliza la imagen y las muestras del anterior.
+    Cada trabajo guarda su registro (estado, rutas, segundos) y sus eventos:
+    los mensajes de avance y los cambios de estado.
+
+    Las imágenes son relativas a `directorio_imagenes` (la carpeta actual por
+    defecto) y las salidas a `directorio_salida`; un trabajo cuyas rutas
+    salgan de ellas se rechaza.
+    """
+
+    def __init__(self, parametros_base, directorio_salida, trabajos=1, directorio_imagenes=''):
+        import multiprocessing
+
+        self.parametros_base = parametros_base
+        self.directorio_salida = directorio_salida
+        self.directorio_imagenes = directorio_imagenes
+        self.trabajos = trabajos
+        self.registros = {}
+        self.eventos = {}
+        self.siguiente_id = 1
+        self.condicion = threading.Condition()
+        self.cola_eventos = multiprocessing.Queue()
+        self.bloqueo_pool = threading.Lock()
+        self.pool = self.crear_pool()
+        threading.Thread(target=self.repartir_eventos, daemon=True).start()
+
+    def crear_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        pool = ProcessPoolExecutor(max_workers=self.trabajos, initializer=iniciar_servidor,
+                                   initargs=(self.cola_eventos,))
+        # Arrancar ya los procesos: el primer trabajo no paga su arranque
+        for futuro in [pool.submit(time.sleep, 0) for _ in range(self.trabajos)]:
+            futuro.result()
+        return pool
+
+    def enviar(self, entrada):
+        """Pone en cola un trabajo y devuelve su registro."""
+        from concurrent.futures.process import BrokenProcessPool
+
+        entrada = dict(entrada)
+        preview = bool(convertir_parametro(entrada.pop('preview', False), False))
+        ancho_px = convertir_parametro(entrada.pop('ancho_px', PREVIEW_ANCHO_PX), PREVIEW_ANCHO_PX)
+        if ancho_px < 1:
+            raise ValueError("El ancho de la vista previa debe ser al menos 1 píxel")
+        formato = 'png' if preview else self.parametros_base.get('formato') or 'svg'
+        trabajo = trabajo_de_entrada(entrada, self.parametros_base, self.directorio_imagenes, self.directorio_salida,
+                                     formato)
+        if not dentro_de(trabajo['imagen_path'], self.directorio_imagenes):
+            raise ValueError(f"La imagen debe estar dentro de {os.path.abspath(self.directorio_imagenes)}")
+        if not dentro_de(trabajo['output_path'], self.directorio_salida):
+            raise ValueError(f"La salida debe quedar dentro de {self.directorio_salida}/")
+        os.makedirs(os.path.dirname(trabajo['output_path']) or '.', exist_ok=True)
+
+        with self.condicion:
+            trabajo_id = str(self.siguiente_id)
+            self.siguiente_id += 1
+            self.registros[trabajo_id] = {
+                'id': trabajo_id, 'imagen': trabajo['imagen_path'], 'salida': trabajo['output_path'],
+                'preview': preview, 'estado': 'en_cola'
+            }
+            self.eventos[trabajo_id] = []
+            self.olvidar_terminados()
+            registro = dict(self.registros[trabajo_id])
+
+        # Con el bloqueo, si varios trabajos encuentran el grupo roto a la vez
+        # solo uno lo sustituye
+        with self.bloqueo_pool:
+            try:
+                futuro = self.pool.submit(ejecutar_trabajo_servidor, trabajo_id, trabajo, preview, ancho_px)
+            except BrokenProcessPool:
+                # Un proceso murió (por ejemplo, sin memoria): se cierra el
+                # grupo roto y se crea uno nuevo
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.crear_pool()
+                futuro = self.pool.submit(ejecutar_trabajo_servidor, trabajo_id, trabajo, preview, ancho_px)
+        futuro.add_done_callback(lambda futuro: self.comprobar_fallo(trabajo_id, futuro))
+        return registro
+
+    def comprobar_fallo(self, trabajo_id, futuro):
+        # Si el proceso trabajador muere, el trabajo no envía su registro final
+        error = futuro.exception()
+        if error is not None:
+            self.anotar(trabajo_id, {'estado': 'error', 'error': f"{type(error).__name__}: {error}"})
+
+    def repartir_eventos(self):
+        while True:
+            trabajo_id, evento = self.cola_eventos.get()
+            self.anotar(trabajo_id, evento)
+
+    def anotar(self, trabajo_id, evento):
+        with self.condicion:
+            if trabajo_id not in self.registros or self.terminado(trabajo_id):
+                return
+            self.eventos[trabajo_id].append(evento)
+            if 'mensaje' not in evento:
+                self.registros[trabajo_id].update(evento)
+            self.condicion.notify_all()
+            registro = dict(self.registros[trabajo_id])
+
+        if registro['estado'] == 'ok':
+            print(f"  ✓ #{trabajo_id} {registro['imagen']} → {registro['salida']} ({registro['segundos']:.2f}s)")
+        elif registro['estado'] == 'error':
+            print(f"  ✗ #{trabajo_id} {registro['imagen']}: {registro['error']}")
+
+    def terminado(self, trabajo_id):
+        return self.registros[trabajo_id]['estado'] in ('ok', 'error')
+
+    def olvidar_terminados(self):
+        # Se llama con la condición adquirida
+        terminados = [trabajo_id for trabajo_id in self.registros if self.terminado(trabajo_id)]
+        for trabajo_id in terminados[:max(0, len(self.registros) - TRABAJOS_GUARDADOS)]:
+            del self.registros[trabajo_id], self.eventos[trabajo_id]
+
+    def consultar(self, trabajo_id=None):
+        """Registro de un trabajo (None si no existe), o lista de todos."""
+        with self.condicion:
+            if trabajo_id is None:
+                return [dict(registro) for registro in self.registros.values()]
+            registro = self.registros.get(trabajo_id)
+            return None if registro is None else dict(registro)
+
+    def esperar(self, trabajo_id):
+        """Espera a que termine un trabajo y devuelve su registro."""
+        with self.condicion:
+            self.condicion.wait_for(lambda: self.terminado(trabajo_id))
+            return dict(self.registros[trabajo_id])
+
+    def seguir_eventos(self, trabajo_id):
+        """Genera los eventos de un trabajo según llegan, hasta que termina."""
+        vistos = 0
+        while True:
+            with self.condicion:
+                self.condicion.wait_for(
+                    lambda: len(self.eventos[trabajo_id]) > vistos or self.terminado(trabajo_id)
+                )
+                nuevos = self.eventos[trabajo_id][vistos:]
+                fin = self.terminado(trabajo_id)
+            vistos += len(nuevos)
+            yield from nuevos
+            if fin:
+                return
+
+    def cerrar(self):
+        with self.bloqueo_pool:
+            self.pool.shutdown(cancel_futures=True)
+
+
+class ManejadorServidor:
+    """
+    API HTTP del servidor de render (JSON):
+
+        POST /trabajos              {"imagen": ..., "salida": ..., "preview": false, "ancho_px": 1200, parámetros...}
+        POST /trabajos?esperar=1    igual, pero responde cuando el trabajo termina
+        GET  /trabajos              registros de todos los trabajos
+        GET  /trabajos/ID           registro de un trabajo
+        GET  /trabajos/ID/eventos   eventos del trabajo, un JSON por línea, hasta que termina
+    """
+
+    def responder(self, codigo, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_POST(self):
+        ruta = urlparse(self.path)
+        if ruta.path.rstrip('/') != '/trabajos':
+            self.responder(404, {'error': f"Ruta desconocida: {ruta.path}"})
+            return
+
+        servidor = self.server.servidor
+        try:
+            entrada = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(entrada, dict):
+                raise ValueError("El trabajo debe ser un objeto JSON")
+            registro = servidor.enviar(entrada)
+        except (ValueError, TypeError) as e:
+            self.responder(400, {'error': str(e)})
+            return
+
+        if parse_qs(ruta.query).get('esperar', ['0'])[0] not in ('', '0'):
+            self.responder(200, servidor.esperar(registro['id']))
+        else:
+            self.responder(202, registro)
+
+    def do_GET(self):
+        partes = urlparse(self.path).path.strip('/').split('/')
+        servidor = self.server.servidor
+        if partes == ['trabajos']:
+            self.responder(200, servidor.consultar())
+            return
+
+        registro = servidor.consultar(partes[1]) if len(partes) in (2, 3) and partes[0] == 'trabajos' else None
+        if registro is None or (len(partes) == 3 and partes[2] != 'eventos'):
+            self.responder(404, {'error': f"Ruta o trabajo desconocido: {self.path}"})
+        elif len(partes) == 2:
+            self.responder(200, registro)
+        else:
+            # Sin Content-Length: la respuesta termina al cerrar la conexión
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+            self.end_headers()
+            for evento in servidor.seguir_eventos(partes[1]):
+                self.wfile.write(json.dumps(evento, ensure_ascii=False).encode('utf-8') + b'\n')
+                self.wfile.flush()
+
+    def log_message(self, formato, *args):
+        # Los trabajos se anotan al terminar; las peticiones no
+        pass
+
+
+def leer_direccion(texto):
+    """Convierte 'PUERTO' o 'HOST:PUERTO' en (host, puerto); el host por defecto es 127.0.0.1."""
+    host, _, puerto = texto.rpartition(':')
+    return host or '127.0.0.1', int(puerto)
+
+
+def servir(direccion, parametros_base, directorio_salida, trabajos=1):
+    """
+    Servidor de render local en `direccion` (host, puerto) hasta Ctrl+C. Los
+    trabajos usan `parametros_base` para lo que no indiquen y escriben en
+    `directorio_salida`; como mucho `trabajos` se generan a la vez.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    servidor = ServidorRender(parametros_base, directorio_salida, trabajos)
+    # http.server solo se importa al servir: el manejador se combina aquí
+    manejador = type('ManejadorServidor', (ManejadorServidor, BaseHTTPRequestHandler), {})
+    http = ThreadingHTTPServer(direccion, manejador)
+    http.servidor = servidor
+    host, puerto = http.server_address[:2]
+    print(f"Servidor de render en http://{host}:{puerto}/ ({trabajos} procesos, salida en {directorio_salida}/)")
+    print("Ctrl+C para detenerlo")
+    try:
+        http.serve_forever()
+    except KeyboardInterrupt:
+        print("\nDeteniendo el servidor...")
+    finally:
+        http.server_close()
+        servidor.cerrar()
+
+
+def enviar_trabajo(url, entrada, progreso=None):
+    """
+    Cliente del servidor de render: envía el trabajo `entrada` a `url` (por
+    ejemplo http://127.0.0.1:8765), pasa sus mensajes de avance a `progreso`
+    y devuelve el registro final (estado, rutas, segundos).
+    """
+    import urllib.error
+    import urllib.request
+
+    url = url.rstrip('/')
+    peticion = urllib.request.Request(
+        f"{url}/trabajos", data=json.dumps(entrada).encode('utf-8'), headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(peticion) as respuesta:
+            trabajo_id = json.load(respuesta)['id']
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.load(e).get('error', str(e))) from None
+
+    registro = None
+    with urllib.request.urlopen(f"{url}/trabajos/{trabajo_id}/eventos") as respuesta:
+        for linea in respuesta:
+            evento = json.loads(linea)
+            if 'mensaje' in evento:
+                if progreso:
+                    progreso(evento['mensaje'])
+            else:
+                registro = evento
+    return registro
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Circular Lines Generator - Genera círculos concéntricos a partir de imágenes',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Ejemplos de uso:
+  %(prog)s imagen.jpg -o salida.svg
+  %(prog)s imagen.jpg -n 500 -min 0.5 -max 5.0 -c 75
+  %(prog)s imagen.jpg -cx 50 -cy 30 -n 300
+  %(prog)s imagen.jpg -o salida.svg --no-dividir  (solo archivo único)
+  %(prog)s imagen.jpg --paneles 4x3 --panel-mm 300x200  (mural de 12 paneles)
+  %(prog)s fotos/ -o salidas/ --trabajos 4  (lote: carpeta o manifiesto JSON/CSV)
+  %(prog)s --servidor 8765 -o salidas/ --trabajos 2  (servidor de render local)
+
+Características:
+  - Dimensiones físicas: 217.7mm x 217.7mm por panel (6 paneles por defecto)
+  - Marco de 3.2mm y líneas separadoras de 2.8mm (configurables)
+  - Optimización automática de puntos
+  - Operaciones booleanas para recorte preciso
+        """
+    )
+
+    parser.add_argument('imagen', nargs='?', help='Ruta de la imagen de entrada (blanco y negro), '
+                                                  'o carpeta / manifiesto JSON o CSV para procesar por lotes')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Archivo SVG salida (default: salida.svg); en lotes y en el servidor, '
+                             'carpeta de salida (default: salida/)')
+    parser.add_argument('-n', '--num-lineas', type=int, default=120, help='Número de círculos (default: 120)')
+    parser.add_argument('-min', '--grosor-min', type=float, default=6.0, help='Grosor mínimo (default: 6.0)')
+    parser.add_argument('-max', '--grosor-max', type=float, default=16.0, help='Grosor máximo (default: 16.0)')
+    parser.add_argument('-c', '--contraste', type=float, default=75.0, help='Contraste: 50=neutro (default: 75)')
+    parser.add_argument('-cx', '--centro-x', type=float, default=-20.0, help='Centro X en %% (default: -20)')
+    parser.add_argument('-cy', '--centro-y', type=float, default=50.0, help='Centro Y en %% (default: 50)')
+    parser.add_argument('--no-dividir', action='store_true', help='Solo generar archivo completo, sin paneles')
+    parser.add_argument('--paneles', metavar='CxF', default=None,
+                        help='Cuadrícula de paneles, columnas x filas (default: 3x2 horizontal, 2x3 vertical)')
+    parser.add_argument('--panel-mm', metavar='MM', default=str(PANEL_SIZE_MM),
+                        help=f'Tamaño de cada panel en mm: lado o ANCHOxALTO (default: {PANEL_SIZE_MM})')
+    parser.add_argument('--por-paneles', action='store_true',
+                        help='Generar y guardar un panel cada vez, sin archivo completo (murales grandes)')
+    parser.add_argument('--marco-mm', type=float, default=MARCO_WIDTH_MM,
+                        help=f'Ancho del marco exterior en mm (default: {MARCO_WIDTH_MM})')
+    parser.add_argument('--separador-mm', type=float, default=LINEA_SEPARADORA_MM,
+                        help=f'Ancho de las líneas separadoras en mm (default: {LINEA_SEPARADORA_MM})')
+    parser.add_argument('--curvas', choices=FAMILIAS_CURVAS, default='circulos',
+                        help='Familia de curvas: circulos, elipses o espiral (default: circulos)')
+    parser.add_argument('--proporcion-elipse', type=float, default=PROPORCION_ELIPSE,
+                        help=f'Proporción entre los semiejes de las elipses (default: {PROPORCION_ELIPSE})')
+    parser.add_argument('--rotacion-elipse', type=float, default=0.0,
+                        help='Rotación de las elipses en grados (default: 0)')
+    parser.add_argument('--espaciado', dest='espaciado_curvas', choices=ESPACIADOS_CURVAS, default='uniforme',
+                        help='Espaciado entre curvas: uniforme o según el detalle de la imagen (default: uniforme)')
+    parser.add_argument('--muestreo', choices=MODOS_MUESTREO, default='cercano',
+                        help='Modo de muestreo de intensidad: cercano, bilineal o area (default: cercano)')
+    parser.add_argument('--suavizado', type=int, default=1,
+                        help='Ventana del promedio móvil circular en segmentos (default: 1)')
+    parser.add_argument('--tolerancia-cuerda', type=float, default=None,
+                        help='Teselado adaptativo: error de cuerda máximo en mm (default: 900 segmentos fijos)')
+    parser.add_argument('--tolerancia-simplificacion', type=float, default=TOLERANCIA_SIMPLIFICACION_MM,
+                        help=f'Desviación máxima en mm al simplificar los anillos (default: {TOLERANCIA_SIMPLIFICACION_MM})')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Procesos para generar los círculos en paralelo (default: 1)')
+    parser.add_argument('--formato', choices=list(FORMATOS), default=None,
+                        help='Formato de salida: svg, svgz, dxf, npz, wkb, stl o 3mf (default: según la extensión de -o)')
+    parser.add_argument('--precision', type=int, default=2,
+                        help='Decimales de las coordenadas del SVG (default: 2)')
+    parser.add_argument('--altura-mm', type=float, default=ALTURA_EXTRUSION_MM,
+                        help=f'Altura de la extrusión en mm para STL y 3MF (default: {ALTURA_EXTRUSION_MM})')
+    parser.add_argument('--relativo', action='store_true',
+                        help='Usar comandos relativos (l/h/v) en los paths: archivos más pequeños')
+    parser.add_argument('--path-por-poligono', action='store_true',
+                        help='Escribir cada polígono en su propio <path>')
+    parser.add_argument('--resolucion-reducida', action='store_true',
+                        help='Muestrear sobre la imagen reducida a la resolución que pueden representar los anillos')
+    parser.add_argument('--preview', metavar='PNG', default=None,
+                        help='Solo generar una vista previa rápida en PNG (sin vectorizar)')
+    parser.add_argument('--trabajos', type=int, default=1,
+                        help='Lotes y servidor: imágenes procesadas a la vez (default: 1)')
+    parser.add_argument('--max-grandes', type=int, default=2,
+                        help=f'Lotes: máximo de imágenes de más de {IMAGEN_GRANDE_MPX} Mpx a la vez (default: 2)')
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help='Carpeta de caché para reutilizar resultados entre ejecuciones (default: sin caché)')
+    parser.add_argument('--cache-mb', type=float, default=TAMANO_CACHE_MB,
+                        help=f'Tamaño máximo de la caché en MB (default: {TAMANO_CACHE_MB})')
+    parser.add_argument('--profile', metavar='JSON', default=None,
+                        help='Guardar en JSON el tiempo, la CPU y la memoria de cada etapa')
+    parser.add_argument('--servidor', metavar='[HOST:]PUERTO', nargs='?', const=str(PUERTO_SERVIDOR), default=None,
+                        help=f'Arrancar el servidor de render local (default: 127.0.0.1:{PUERTO_SERVIDOR}); '
+                             'los parámetros indicados son los base de cada trabajo')
+    parser.add_argument('--validar', action='store_true',
+                        help='Solo validar los parámetros y salir, sin cargar numpy, PIL ni shapely')
+
+    args = parser.parse_args()
+
+    if args.servidor is None and args.imagen is None and not args.validar:
+        parser.error("falta la imagen de entrada")
+
+    if args.servidor is not None and (args.imagen is not None or args.preview or args.profile):
+        print("Error: --servidor no se combina con una imagen, --preview ni --profile", file=sys.stderr)
+        sys.exit(1)
+
+    if args.profile and (args.preview or (args.imagen is not None and es_lote(args.imagen))):
+        print("Error: --profile solo se admite al generar una imagen (sin --preview ni lotes)", file=sys.stderr)
+        sys.exit(1)
+
+    if args.trabajos < 1 or args.max_grandes < 1:
+        print("Error: --trabajos y --max-grandes deben ser al menos 1", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        panel_mm = leer_medidas(args.panel_mm)
+        paneles = None if args.paneles is None else leer_medidas(args.paneles)
+    except ValueError:
+        print("Error: Las medidas de los paneles deben tener la forma N o AxB", file=sys.stderr)
+        sys.exit(1)
+
+    parametros = dict(
+        num_lineas=args.num_lineas,
+        grosor_min=args.grosor_min,
+        grosor_max=args.grosor_max,
+        contraste=args.contraste,
+        centro_x=args.centro_x,
+        centro_y=args.centro_y,
+        dividir_paneles=not args.no_dividir,
+        paneles=paneles,
+        panel_mm=panel_mm,
+        marco_mm=args.marco_mm,
+        separador_mm=args.separador_mm,
+        curvas=args.curvas,
+        proporcion_elipse=args.proporcion_elipse,
+        rotacion_elipse=args.rotacion_elipse,
+        espaciado_curvas=args.espaciado_curvas,
+        por_paneles=args.por_paneles,
+        modo_muestreo=args.muestreo,
+        ventana_suavizado=args.suavizado,
+        reducir_imagen=args.resolucion_reducida,
+        tolerancia_cuerda=args.tolerancia_cuerda,
+        tolerancia_simplificacion=args.tolerancia_simplificacion,
+        workers=args.workers,
+        precision=args.precision,
+        relativo=args.relativo,
+        path_por_poligono=args.path_por_poligono,
+        altura_mm=args.altura_mm,
+        formato=args.formato,
+        cache_dir=args.cache,
+        cache_mb=args.cache_mb
+    )
+
+    try:
+        validar_parametros(parametros)
+    except ValueError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    if paneles is not None:
+        parametros['paneles'] = paneles = (int(paneles[0]), int(paneles[1]))
+
+    if args.validar:
+        print("✓ Parámetros válidos")
+        return
+
+    if args.servidor is not None:
+        try:
+            servir(leer_direccion(args.servidor), parametros, args.output or 'salida', trabajos=args.trabajos)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Error: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if es_lote(args.imagen):
+        try:
+            procesar_lote(args.imagen, args.output or 'salida', parametros,
+                          trabajos=args.trabajos, max_grandes=args.max_grandes)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"Error: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    try:
+        if args.preview:
+            generar_preview(
+                args.imagen,
+                args.num_lineas,
+                args.grosor_min,
+                args.grosor_max,
+                args.contraste,
+                args.centro_x,
+                args.centro_y,
+                args.preview,
+                dividir_paneles=not args.no_dividir,
+                modo_muestreo=args.muestreo,
+                ventana_suavizado=args.suavizado,
+                reducir_imagen=args.resolucion_reducida,
+                paneles=paneles,
+                panel_mm=panel_mm,
+                marco_mm=args.marco_mm,
+                separador_mm=args.separador_mm,
+                curvas=args.curvas,
+                proporcion_elipse=args.proporcion_elipse,
+                rotacion_elipse=args.rotacion_elipse,
+                espaciado_curvas=args.espaciado_curvas
+            )
+            return
+
+        inicio = time.perf_counter()
+        resultado = generar_svg_circular(args.imagen, output_path=args.output or 'salida.svg', **parametros)
+        if args.profile:
+            escribir_perfil(args.profile, resultado, time.perf_counter() - inicio)
+            print(f"✓ Perfil guardado: {args.profile}")
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo '{args.imagen}'", file=sys.stderr)
+        sys.exit(1)
+    except ImportError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()